@@ -1,9 +1,58 @@
 # Configuration settings for the backend
-from os import getenv
+from os import cpu_count, getenv
 
 class CMSettings:
     def __init__(self):
         self.CORNU_DB_URL: str = self._get_required_env("CORNU_DB_URL")
+        # Optional, derived from CORNU_DB_URL (e.g. postgresql+asyncpg://) when unset
+        self.CORNU_ASYNC_DB_URL: str | None = getenv("CORNU_ASYNC_DB_URL")
+        # Connection pool settings, shared by the sync and async engines
+        self.CORNU_DB_POOL_SIZE: int = self._get_int_env("CORNU_DB_POOL_SIZE", 5)
+        self.CORNU_DB_MAX_OVERFLOW: int = self._get_int_env("CORNU_DB_MAX_OVERFLOW", 10)
+        self.CORNU_DB_POOL_PRE_PING: bool = self._get_bool_env("CORNU_DB_POOL_PRE_PING", True)
+        self.CORNU_DB_POOL_RECYCLE: int = self._get_int_env("CORNU_DB_POOL_RECYCLE", 1800)  # seconds
+        self.CORNU_DB_POOL_TIMEOUT: int = self._get_int_env("CORNU_DB_POOL_TIMEOUT", 30)  # seconds
+        # Read replicas: comma separated sync URLs (async URLs are derived), how often they are
+        # health checked, and how long a client's reads stay on the primary after it wrote
+        self.CORNU_DB_REPLICA_URLS: list[str] = self._get_list_env("CORNU_DB_REPLICA_URLS")
+        self.CORNU_DB_REPLICA_CHECK_INTERVAL: int = self._get_int_env("CORNU_DB_REPLICA_CHECK_INTERVAL", 10)  # seconds
+        self.CORNU_DB_READ_STICKY_SECONDS: int = self._get_int_env("CORNU_DB_READ_STICKY_SECONDS", 5)  # seconds
+        # Cart storage shards (carts, cart_items): comma separated sync URLs, empty keeps them on the primary.
+        # Changing the list moves carts between shards, run database/_rebalance_shards.py afterwards
+        self.CORNU_DB_SHARD_URLS: list[str] = self._get_list_env("CORNU_DB_SHARD_URLS")
+        # Bearer token of the operational endpoints (/metrics, /health/*); while unset they answer 404
+        self.CORNU_INTERNAL_TOKEN: str | None = getenv("CORNU_INTERNAL_TOKEN") or None
+        # GET /metrics (Prometheus text format) and the per-request / per-statement recording behind it
+        self.CORNU_METRICS_ENABLED: bool = self._get_bool_env("CORNU_METRICS_ENABLED", True)
+        # Query profiling of every request (X-Query-Profile header for requests with an X-Internal-Token
+        # header, /health/query-profiles, both for CORNU_INTERNAL_TOKEN holders only), for development only, off unless set,
+        # and how often one parameterized statement may repeat in a profile before it is flagged as an N+1 suspect
+        self.CORNU_QUERY_PROFILING: bool = self._get_bool_env("CORNU_QUERY_PROFILING", False)
+        self.CORNU_QUERY_PROFILE_REPEAT_THRESHOLD: int = self._get_int_env("CORNU_QUERY_PROFILE_REPEAT_THRESHOLD", 3)
+        # Cart cache: Redis when CORNU_REDIS_URL is set, in-process LRU otherwise. Redis calls give up
+        # after CORNU_REDIS_TIMEOUT_MS and the request reads the database instead
+        self.CORNU_REDIS_URL: str | None = getenv("CORNU_REDIS_URL")
+        self.CORNU_REDIS_TIMEOUT_MS: int = self._get_int_env("CORNU_REDIS_TIMEOUT_MS", 250)
+        self.CORNU_CART_CACHE_TTL: int = self._get_int_env("CORNU_CART_CACHE_TTL", 300)  # seconds
+        self.CORNU_CART_CACHE_MAX_ENTRIES: int = self._get_int_env("CORNU_CART_CACHE_MAX_ENTRIES", 10000)
+        # Cart item listing: default page size and the largest page a client may request
+        self.CORNU_CART_PAGE_SIZE: int = self._get_int_env("CORNU_CART_PAGE_SIZE", 100)
+        self.CORNU_CART_MAX_PAGE_SIZE: int = self._get_int_env("CORNU_CART_MAX_PAGE_SIZE", 500)
+        # Stale anonymous cart sweeper: age after which a session cart is deleted (the cookie lifetime),
+        # carts deleted per transaction, and how often the API process sweeps (0 disables it)
+        self.CORNU_CART_SWEEP_TTL: int = self._get_int_env("CORNU_CART_SWEEP_TTL", 60*60*24*30)  # seconds
+        self.CORNU_CART_SWEEP_BATCH_SIZE: int = self._get_int_env("CORNU_CART_SWEEP_BATCH_SIZE", 500)
+        self.CORNU_CART_SWEEP_INTERVAL: int = self._get_int_env("CORNU_CART_SWEEP_INTERVAL", 3600)  # seconds
+        # Write-behind of cart item quantity updates (off by default): flush interval, and the
+        # number of buffered items that triggers an early flush
+        self.CORNU_CART_WRITE_BEHIND: bool = self._get_bool_env("CORNU_CART_WRITE_BEHIND", False)
+        self.CORNU_CART_WRITE_BEHIND_FLUSH_MS: int = self._get_int_env("CORNU_CART_WRITE_BEHIND_FLUSH_MS", 250)
+        self.CORNU_CART_WRITE_BEHIND_MAX_PENDING: int = self._get_int_env("CORNU_CART_WRITE_BEHIND_MAX_PENDING", 1000)
+        # Password hashing executor: worker threads and how many more calls may queue behind them
+        self.CORNU_BCRYPT_WORKERS: int = self._get_int_env("CORNU_BCRYPT_WORKERS", cpu_count() or 1)
+        self.CORNU_BCRYPT_MAX_PENDING: int = self._get_int_env("CORNU_BCRYPT_MAX_PENDING", 32)
+        # Verified access-token payloads kept in memory until the token expires
+        self.CORNU_TOKEN_CACHE_MAX_ENTRIES: int = self._get_int_env("CORNU_TOKEN_CACHE_MAX_ENTRIES", 10000)
 
     def _get_required_env(self, var_name: str) -> str:
         value = getenv(var_name)
@@ -11,4 +60,23 @@ class CMSettings:
             raise ValueError(f"environment variable {var_name} should be set.")
         return value
 
+    def _get_int_env(self, var_name: str, default: int) -> int:
+        value = getenv(var_name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"environment variable {var_name} should be an integer.")
+
+    def _get_list_env(self, var_name: str) -> list[str]:
+        value = getenv(var_name) or ""
+        return [item.strip() for item in value.split(",") if item.strip()]
+
+    def _get_bool_env(self, var_name: str, default: bool) -> bool:
+        value = getenv(var_name)
+        if value is None:
+            return default
+        return value.strip().lower() in ("1", "true", "yes", "on")
+
 settings = CMSettings()
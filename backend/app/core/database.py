@@ -1,27 +1,591 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import threading
+import time
+import uuid
 from .base_init import Base
 from .config import settings 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from .metrics import db_pool_checkouts, db_statement_seconds, db_statements
+from contextlib import contextmanager
+from datetime import timezone
+from typing import List, Optional, Sequence
+from fastapi import Request
+from sqlalchemy import DateTime, TypeDecorator, and_, bindparam, create_engine, event, exc, insert, inspect, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql.util import find_tables
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Async drivers used when the async URL is derived from the sync one
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(db_url: str) -> str:
+    """Swap the driver of a sync database URL for its async counterpart"""
+    url = make_url(db_url)
+    async_driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if async_driver is None:
+        raise ValueError(f"no async driver known for database backend '{url.get_backend_name()}'")
+    return url.set(drivername=async_driver).render_as_string(hide_password=False)
+
+# Dialects with INSERT ... ON CONFLICT, the others get SelectThenInsert
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+def dialect_insert(db: Session, entity):
+    """INSERT construct of the session's dialect, which supports ON CONFLICT; run it with execute_upsert"""
+    return UPSERT_INSERTS.get(db.get_bind(entity).dialect.name, SelectThenInsert)(entity)
+
+def execute_upsert(db: Session, stmt, execution_options: Optional[dict] = None):
+    """Execute a statement built by dialect_insert, returns its Result (None for a SelectThenInsert without returning)"""
+    if isinstance(stmt, SelectThenInsert):
+        return stmt.execute(db, execution_options)
+    return db.execute(stmt, execution_options=execution_options or {})
+
+class _Excluded:
+    """Stand-in for the excluded row of ON CONFLICT DO UPDATE: a bound parameter per column"""
+
+    def __init__(self, table):
+        self._table = table
+
+    def __getattr__(self, name):
+        return bindparam(f"excluded_{name}", type_=self._table.c[name].type)
+
+class SelectThenInsert:
+    """INSERT ... ON CONFLICT ... RETURNING for dialects without it, with the same builder methods.
+
+    Each row is looked up on the conflict columns, then inserted, or updated (DO UPDATE,
+    with its WHERE). RETURNING reads the inserted / updated rows back by primary key.
+    Unlike ON CONFLICT this is not atomic: a concurrent insert of the same key fails on
+    the unique index instead of being merged.
+    """
+
+    def __init__(self, entity):
+        self.entity = entity
+        self.table = inspect(entity).local_table
+        self.primary_key, = inspect(entity).primary_key
+        self.excluded = _Excluded(self.table)
+        self.rows = []
+        self.index_elements = None
+        self.set_ = None
+        self.where = None
+        self.returning_columns = None
+
+    def values(self, *args, **kwargs):
+        self.rows = list(args[0]) if args and isinstance(args[0], list) else [args[0] if args else kwargs]
+        return self
+
+    def on_conflict_do_nothing(self, index_elements):
+        self.index_elements = index_elements
+        return self
+
+    def on_conflict_do_update(self, index_elements, set_, where=None):
+        self.index_elements, self.set_, self.where = index_elements, set_, where
+        return self
+
+    def returning(self, *columns):
+        self.returning_columns = columns
+        return self
+
+    def execute(self, db: Session, execution_options: Optional[dict] = None):
+        written = []
+        for row in self.rows:
+            key = and_(*(column == row[column.key] for column in self.index_elements))
+            existing = db.execute(select(self.primary_key).where(key)).scalar()
+            if existing is None:
+                written.append(db.execute(insert(self.table).values(row)).inserted_primary_key[0])
+            elif self.set_ is not None:
+                stmt = update(self.table).where(key).values(self.set_)
+                if self.where is not None:
+                    stmt = stmt.where(self.where)
+                excluded = {f"excluded_{name}": value for name, value in row.items()}
+                if db.execute(stmt, excluded).rowcount:
+                    written.append(existing)
+        if self.returning_columns is None:
+            return None
+        return db.execute(
+            select(*self.returning_columns).where(self.primary_key.in_(written)),
+            execution_options=execution_options or {}
+        )
+
+class UTCDateTime(TypeDecorator):
+    """Timestamp stored as naive UTC, always handed back timezone-aware.
+
+    Values set in memory (datetime.now(timezone.utc)) and values read from the
+    database then serialize the same way, with a "Z" suffix.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+class PoolStats:
+    """Checkout counters and wait times of a connection pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record_checkout(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.total_wait, 6),
+                "wait_seconds_avg": round(self.total_wait / attempts, 6) if attempts else 0.0,
+                "wait_seconds_max": round(self.max_wait, 6),
+            }
+
+class _TimedPoolMixin:
+    """Measure how long each connection checkout waits on the pool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        # pre-ping / invalidation swaps the pool; keep the counters across the swap
+        new_pool = super().recreate()
+        new_pool.stats = self.stats
+        return new_pool
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.record_checkout(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_checkout(time.perf_counter() - start)
+        return connection
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+class TimedAsyncAdaptedQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def pool_options(db_url: str, is_async: bool = False) -> dict:
+    """Engine keyword arguments for the configured connection pool"""
+    if make_url(db_url).get_backend_name() == "sqlite":
+        # SQLite picks its own pool (single connection for :memory:), leave it alone
+        return {}
+    return {
+        "poolclass": TimedAsyncAdaptedQueuePool if is_async else TimedQueuePool,
+        "pool_size": settings.CORNU_DB_POOL_SIZE,
+        "max_overflow": settings.CORNU_DB_MAX_OVERFLOW,
+        "pool_pre_ping": settings.CORNU_DB_POOL_PRE_PING,
+        "pool_recycle": settings.CORNU_DB_POOL_RECYCLE,
+        "pool_timeout": settings.CORNU_DB_POOL_TIMEOUT,
+    }
+
+def pool_status(engine) -> dict:
+    """Checked-out / overflow / wait-time report of an engine's pool"""
+    pool = engine.pool
+    status = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status.update(stats.snapshot())
+    return status
+
+logger = logging.getLogger(__name__)
+
+def instrument_engine(engine, name: str) -> None:
+    """Count the engine's statements, statement time and pool checkouts in the /metrics registry"""
+    labels = (name,)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _statement_started(conn, cursor, statement, parameters, context, executemany):
+        conn.info["cornu_statement_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("cornu_statement_started", None)
+        db_statements.inc(labels)
+        if started is not None:
+            db_statement_seconds.inc(labels, time.perf_counter() - started)
+
+    @event.listens_for(engine, "checkout")
+    def _checked_out(dbapi_connection, connection_record, connection_proxy):
+        db_pool_checkouts.inc(labels)
+
+# Cart storage sharding.
+# Tables marked with info={"sharded": True} (carts, cart_items) live on
+# CORNU_DB_SHARD_URLS when it is set, every other table stays on the primary.
+# A cart's shard is a function of its owner only, so all of an owner's rows
+# are on one shard and every cart query is single-shard.
+
+def owner_key(user_id=None, session_id=None) -> Optional[str]:
+    """Stable key a cart is sharded by, its owner (a user wins over a session)"""
+    if user_id:
+        return f"user:{uuid.UUID(str(user_id))}"
+    if session_id:
+        return f"session:{session_id}"
+    return None
+
+def shard_index(key: str, shard_count: int) -> int:
+    """Shard of a key: blake2b of the key fed to a jump consistent hash.
+
+    The hash is stable across processes and Python versions (unlike hash()),
+    and growing from N to N+1 shards moves only 1/(N+1) of the carts.
+    """
+    state = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+    bucket, candidate = -1, 0
+    while candidate < shard_count:
+        bucket = candidate
+        state = (state * 2862933555777941757 + 1) % (1 << 64)
+        candidate = int((bucket + 1) * ((1 << 31) / ((state >> 33) + 1)))
+    return bucket
+
+def is_sharded_table(table) -> bool:
+    return bool(table.info.get("sharded"))
+
+class ShardedSession(Session):
+    """Session sending statements on sharded tables to the shard chosen by
+    route_to_owner / use_shard, and everything else to its own bind.
+
+    Without shards it behaves like a plain Session. One session can touch several
+    shards; commit() then commits them one after the other (not atomically).
+    """
+
+    def __init__(self, *args, shards: Sequence = (), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shards = list(shards)
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.shards and self._targets_sharded_table(mapper, clause):
+            shard = self.info.get("shard")
+            if shard is None:
+                raise RuntimeError("sharded table used before the session was routed to a shard")
+            return self.shards[shard]
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+    @staticmethod
+    def _targets_sharded_table(mapper, clause) -> bool:
+        if mapper is not None:
+            return is_sharded_table(inspect(mapper).local_table)
+        if clause is not None:
+            return any(is_sharded_table(table) for table in find_tables(clause, include_crud=True))
+        return False
+
+def shard_ids(db) -> list:
+    """Shards a session can be routed to, [None] when storage is not sharded"""
+    shards = getattr(db, "shards", None)
+    return list(range(len(shards))) if shards else [None]
+
+def shard_for(db, user_id=None, session_id=None) -> Optional[int]:
+    """Shard holding the owner's cart, None when storage is not sharded"""
+    shards = getattr(db, "shards", None)
+    key = owner_key(user_id, session_id)
+    if not shards or key is None:
+        return None
+    return shard_index(key, len(shards))
+
+def use_shard(db, shard: Optional[int]) -> None:
+    db.info["shard"] = shard
+
+def route_to_owner(db, user_id=None, session_id=None) -> Optional[int]:
+    """Point the session's cart queries at the owner's shard, returns the shard"""
+    shard = shard_for(db, user_id, session_id)
+    if shard is not None:
+        use_shard(db, shard)
+    return shard
+
+def create_shard_tables(engine) -> None:
+    """Create the sharded tables on a shard database.
+
+    Foreign keys to tables that are not sharded (carts.user_id -> users) can't
+    exist across databases and are left out.
+    """
+    tables = [table for table in Base.metadata.sorted_tables if is_sharded_table(table)]
+    with engine.begin() as conn:
+        existing = set(inspect(conn).get_table_names())
+        for table in tables:
+            if table.name in existing:
+                continue
+            foreign_keys = [fk for fk in table.foreign_key_constraints if is_sharded_table(fk.referred_table)]
+            conn.execute(CreateTable(table, include_foreign_key_constraints=foreign_keys))
+            for index in table.indexes:
+                index.create(conn)
+
+class Shard:
+    """Sync and async engines of one cart storage shard"""
 
-class DatabaseManager:
     def __init__(self, db_url: str):
-        self.engine = create_engine(db_url)
-        self.db_session = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.url = make_url(db_url).render_as_string(hide_password=True)
+        self.engine = create_engine(db_url, **pool_options(db_url))
+        async_db_url = to_async_url(db_url)
+        self.async_engine = create_async_engine(async_db_url, **pool_options(async_db_url, is_async=True))
+
+    def status(self) -> dict:
+        return {
+            "url": self.url,
+            "sync": pool_status(self.engine),
+            "async": pool_status(self.async_engine.sync_engine),
+        }
+
+# Set after a successful mutation: until the timestamp it holds, the client's reads go to the primary
+READ_PRIMARY_COOKIE = "cornu_read_primary"
+
+def reads_from_primary(request: Request) -> bool:
+    """Whether the client wrote recently enough that a lagging replica could hide its write"""
+    value = request.cookies.get(READ_PRIMARY_COOKIE)
+    try:
+        return value is not None and float(value) > time.time()
+    except ValueError:
+        return False
+
+def is_replica_session(db) -> bool:
+    """Whether a session reads from a replica, and so may see data that is slightly stale"""
+    return bool(db.info.get("replica"))
+
+class Replica:
+    """A read replica's async engine and sessions, plus its last known health"""
+
+    def __init__(self, db_url: str, shards: Sequence[Shard] = ()):
+        self.url = make_url(db_url).render_as_string(hide_password=True)
+        async_db_url = to_async_url(db_url)
+        self.async_engine = create_async_engine(async_db_url, **pool_options(async_db_url, is_async=True))
+        # Replicas mirror the primary; the sharded tables are still read from their shards
+        self.async_db_session = async_sessionmaker(
+            bind=self.async_engine, autoflush=False, expire_on_commit=False, info={"replica": True},
+            sync_session_class=ShardedSession, shards=[shard.async_engine.sync_engine for shard in shards]
+        )
+        self.healthy = True
+        self.failed_at = 0.0
+        self.last_error: Optional[str] = None
+
+    def mark_down(self, error: BaseException) -> None:
+        if self.healthy:
+            logger.warning("read replica %s marked down: %s", self.url, error)
+        self.healthy = False
+        self.failed_at = time.monotonic()
+        self.last_error = str(error).splitlines()[0] if str(error) else type(error).__name__
+
+    def mark_up(self) -> None:
+        if not self.healthy:
+            logger.info("read replica %s is back", self.url)
+        self.healthy = True
+        self.last_error = None
+
+class ReplicaSet:
+    """Round robin over the replicas that pass health checks.
+
+    A replica is marked down when a health check or a request fails to reach it,
+    and skipped until a health check succeeds again. Without the periodic check
+    running, a down replica is retried by a single request once retry_after
+    seconds have passed.
+    """
+
+    def __init__(
+        self,
+        db_urls: Sequence[str],
+        shards: Sequence[Shard] = (),
+        retry_after: float = settings.CORNU_DB_REPLICA_CHECK_INTERVAL
+    ):
+        self.replicas: List[Replica] = [Replica(db_url, shards) for db_url in db_urls]
+        self.retry_after = retry_after
+        self._turn = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    def pick(self) -> Optional[Replica]:
+        """Next usable replica, None when all of them are down"""
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self._turn) % len(self.replicas)]
+            if replica.healthy:
+                return replica
+            if time.monotonic() - replica.failed_at >= self.retry_after:
+                # Let this request probe it; failing again restarts the wait
+                replica.failed_at = time.monotonic()
+                return replica
+        return None
+
+    async def check(self, replica: Replica, timeout: float = 5) -> bool:
+        try:
+            async with replica.async_engine.connect() as conn:
+                await asyncio.wait_for(conn.execute(text("SELECT 1")), timeout)
+        except Exception as e:
+            replica.mark_down(e)
+            return False
+        replica.mark_up()
+        return True
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def run_health_checks(self, interval: float) -> None:
+        """Health check task: checks every replica each `interval` seconds until cancelled"""
+        while True:
+            await self.check_all()
+            await asyncio.sleep(interval)
+
+    def status(self) -> list:
+        return [
+            {"url": replica.url, "healthy": replica.healthy, "last_error": replica.last_error,
+             **pool_status(replica.async_engine.sync_engine)}
+            for replica in self.replicas
+        ]
+
+class DatabaseManager:
+    def __init__(
+        self,
+        db_url: str,
+        async_db_url: Optional[str] = None,
+        replica_urls: Sequence[str] = (),
+        shard_urls: Sequence[str] = ()
+    ):
+        # Cart storage shards, see ShardedSession; empty keeps every table on the primary
+        self.shards: List[Shard] = [Shard(shard_url) for shard_url in shard_urls]
+
+        self.engine = create_engine(db_url, **pool_options(db_url))
+        self.db_session = sessionmaker(
+            autocommit=False, autoflush=False, bind=self.engine,
+            class_=ShardedSession, shards=[shard.engine for shard in self.shards]
+        )
+
+        # Async engine for the event-loop friendly routes (e.g. cart).
+        # expire_on_commit=False: attributes can't be lazy loaded outside the greenlet,
+        # so objects must stay readable after commit.
+        async_db_url = async_db_url or to_async_url(db_url)
+        self.async_engine = create_async_engine(async_db_url, **pool_options(async_db_url, is_async=True))
+        self.async_db_session = async_sessionmaker(
+            bind=self.async_engine, autoflush=False, expire_on_commit=False,
+            sync_session_class=ShardedSession, shards=[shard.async_engine.sync_engine for shard in self.shards]
+        )
+
+        # Read-only routes use get_async_read_db, which spreads them over these replicas
+        self.replicas = ReplicaSet(replica_urls, self.shards)
+
+        if settings.CORNU_METRICS_ENABLED:
+            self.instrument()
+
+    def instrument(self) -> None:
+        """Hook every engine into the /metrics statement and checkout counters, labelled by role"""
+        instrument_engine(self.engine, "primary")
+        instrument_engine(self.async_engine.sync_engine, "primary-async")
+        for i, replica in enumerate(self.replicas.replicas):
+            instrument_engine(replica.async_engine.sync_engine, f"replica-{i}")
+        for i, shard in enumerate(self.shards):
+            instrument_engine(shard.engine, f"shard-{i}")
+            instrument_engine(shard.async_engine.sync_engine, f"shard-{i}-async")
 
     def get_db(self):
         """
         Dependency to get a database session.
+        Request scoped: the session is rolled back on error and always closed,
+        which returns its connection to the pool.
         """
         db = self.db_session()
         try:
             yield db
+        except Exception:
+            db.rollback()
+            raise
         finally:
             db.close()
 
+    async def get_async_db(self):
+        """
+        Dependency to get an async database session, request scoped like get_db.
+        """
+        db = self.async_db_session()
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
+
+    async def get_async_read_db(self, request: Request):
+        """
+        Dependency for read-only routes: an async session on the next healthy replica.
+        Falls back to the primary when no replica is configured or usable, and while
+        the client's read-your-writes cookie is set, so it never reads a cart older
+        than its own last write. Connection failures mark the replica down.
+        """
+        replica = None if reads_from_primary(request) else self.replicas.pick()
+        db = replica.async_db_session() if replica else self.async_db_session()
+        try:
+            yield db
+        except (exc.OperationalError, exc.InterfaceError) as e:
+            if replica:
+                replica.mark_down(e)
+            await db.rollback()
+            raise
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
+
+    @contextmanager
+    def session_scope(self):
+        """Session for code outside a request (scripts, CLI), released on exit"""
+        yield from self.get_db()
+
+    def pool_status(self) -> dict:
+        """Pool report for both engines, used by the health endpoint and metrics"""
+        status = {
+            "sync": pool_status(self.engine),
+            "async": pool_status(self.async_engine.sync_engine),
+        }
+        if self.replicas:
+            status["replicas"] = self.replicas.status()
+        if self.shards:
+            status["shards"] = [shard.status() for shard in self.shards]
+        return status
+
     def create_all_tables(self):
         Base.metadata.create_all(bind=self.engine)
+        for shard in self.shards:
+            create_shard_tables(shard.engine)
 
     def drop_all_tables(self):
         Base.metadata.drop_all(bind=self.engine)
+        sharded = [table for table in Base.metadata.sorted_tables if is_sharded_table(table)]
+        for shard in self.shards:
+            Base.metadata.drop_all(bind=shard.engine, tables=sharded)
 
-db_manager = DatabaseManager(settings.CORNU_DB_URL)
\ No newline at end of file
+db_manager = DatabaseManager(
+    settings.CORNU_DB_URL, settings.CORNU_ASYNC_DB_URL, settings.CORNU_DB_REPLICA_URLS, settings.CORNU_DB_SHARD_URLS
+)
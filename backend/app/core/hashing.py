@@ -0,0 +1,60 @@
+# Dedicated executor for password hashing
+import asyncio
+import threading
+from .config import settings
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+
+class PasswordHashExecutor:
+    """Bounded thread pool for bcrypt.
+
+    bcrypt releases the GIL while hashing, so the worker threads run in parallel and
+    the event loop stays free. The pool has its own queue-depth limit: once
+    max_workers + max_pending calls are in flight, new calls fail fast with 503
+    instead of piling up, so a login burst can't starve the rest of the API.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool, raise 503 when the pool is saturated"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication service busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        with self._lock:
+            self.in_flight += 1
+        future = self._executor.submit(fn, *args)
+        # Free the slot when the work is done, not when the caller stops waiting
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHashExecutor(settings.CORNU_BCRYPT_WORKERS, settings.CORNU_BCRYPT_MAX_PENDING)
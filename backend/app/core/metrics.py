@@ -0,0 +1,161 @@
+# In-process metrics, exposed in the Prometheus text format on GET /metrics.
+# Every thread records into its own dicts, so the hot path takes no lock (a
+# thread-local lookup and a dict update, about a microsecond); a scrape merges
+# the per-thread values. Counts of threads that have exited are kept.
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Sequence, Tuple
+
+# Request latencies, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+class _PerThread:
+    """One dict per recording thread, merged on read"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: List[dict] = []
+
+    def values(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._all.append(values)
+            return values
+
+    def snapshots(self) -> List[dict]:
+        with self._lock:
+            shards = list(self._all)
+        # dict.copy() runs under the GIL, a concurrent update can't break it
+        return [shard.copy() for shard in shards]
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = _PerThread()
+
+    def _format_labels(self, labels: Labels, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        merged: Dict[Labels, float] = {}
+        for shard in self._values.snapshots():
+            for labels, value in shard.items():
+                merged[labels] = merged.get(labels, 0) + value
+        return [f"{self.name}{self._format_labels(labels)} {_number(value)}" for labels, value in sorted(merged.items())]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        values = self._values.values()
+        values[labels] = values.get(labels, 0) + amount
+
+class Gauge(Counter):
+    """Up/down value, e.g. requests in flight; each thread's increments and decrements are summed"""
+    kind = "gauge"
+
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        values = self._values.values()
+        # [count per bucket..., count above the last bucket, sum]
+        state = values.get(labels)
+        if state is None:
+            state = values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def _samples(self) -> List[str]:
+        merged: Dict[Labels, list] = {}
+        for shard in self._values.snapshots():
+            for labels, state in shard.items():
+                total = merged.setdefault(labels, [0] * len(state))
+                for i, value in enumerate(list(state)):
+                    total[i] += value
+        lines = []
+        bounds = [f'le="{bound!r}"' for bound in self.buckets] + ['le="+Inf"']
+        for labels, state in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, state):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._format_labels(labels, bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(labels)} {_number(state[-1])}")
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {cumulative}")
+        return lines
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter(
+    "cornu_http_requests_total", "HTTP requests by method, route template and status code", ("method", "route", "status")
+)
+http_request_duration = metrics.histogram(
+    "cornu_http_request_duration_seconds", "HTTP request latency by method and route template", ("method", "route")
+)
+http_requests_in_flight = metrics.gauge(
+    "cornu_http_requests_in_flight", "HTTP requests being handled", ("method",)
+)
+db_statements = metrics.counter(
+    "cornu_db_statements_total", "SQL statements executed, by engine", ("engine",)
+)
+db_statement_seconds = metrics.counter(
+    "cornu_db_statement_seconds_total", "Time spent executing SQL statements, by engine", ("engine",)
+)
+db_pool_checkouts = metrics.counter(
+    "cornu_db_pool_checkouts_total", "Connections checked out of the pool, by engine", ("engine",)
+)
@@ -0,0 +1,226 @@
+# Pure ASGI middleware.
+# Unlike @app.middleware("http") (BaseHTTPMiddleware) there is no extra task or
+# body-stream wrapper per request, and streaming responses pass through untouched.
+import time
+from .metrics import http_request_duration, http_requests, http_requests_in_flight
+from .profiling import profile_queries, recent_profiles
+from .security import INTERNAL_TOKEN_HEADER, matches_internal_token
+
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Content-Security-Policy": (
+        "default-src 'self'; "
+        "script-src 'self'; "
+        "style-src 'self' 'unsafe-inline'; "
+        "img-src 'self' data: https:; "
+        "connect-src 'self'; "
+        "font-src 'self'; "
+        "object-src 'none'; "
+        "media-src 'self'; "
+        "frame-src 'none'; "
+        "base-uri 'self';"
+    ),
+}
+
+# Request headers browsers may always send cross-origin (CORS safelist)
+SAFELISTED_HEADERS = frozenset({"accept", "accept-language", "content-language", "content-type"})
+
+def _encode_headers(headers: dict) -> list:
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+
+class SecurityHeadersMiddleware:
+    """Security headers and CORS handling in a single pass.
+
+    Every header is encoded once at startup; per request the middleware only scans
+    the request headers for Origin and appends the prepared byte pairs to the
+    http.response.start message. CORS preflights are answered directly.
+    """
+
+    def __init__(
+        self,
+        app,
+        allow_origins=(),
+        allow_methods=("GET",),
+        allow_headers=(),
+        expose_headers=(),
+        allow_credentials: bool = False,
+        max_age: int = 600,
+        security_headers: dict = SECURITY_HEADERS,
+    ):
+        self.app = app
+        self.allow_origins = frozenset(origin.encode("latin-1") for origin in allow_origins)
+        self.allow_methods = frozenset(method.upper() for method in allow_methods)
+        self.allow_headers = frozenset(header.lower() for header in allow_headers) | SAFELISTED_HEADERS
+
+        self.security_headers = _encode_headers(security_headers)
+        cors_headers = [(b"vary", b"Origin")]
+        if allow_credentials:
+            cors_headers.append((b"access-control-allow-credentials", b"true"))
+        if expose_headers:
+            cors_headers.append((b"access-control-expose-headers", ", ".join(expose_headers).encode("latin-1")))
+        self.cors_headers = cors_headers
+        self.preflight_headers = self.security_headers + cors_headers + _encode_headers({
+            "Access-Control-Allow-Methods": ", ".join(sorted(self.allow_methods)),
+            "Access-Control-Allow-Headers": ", ".join(sorted(self.allow_headers)),
+            "Access-Control-Max-Age": str(max_age),
+        })
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = requested_method = requested_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                requested_method = value
+            elif name == b"access-control-request-headers":
+                requested_headers = value
+
+        if origin is None:
+            extra_headers = self.security_headers
+        elif scope["method"] == "OPTIONS" and requested_method is not None:
+            await self.preflight(origin, requested_method, requested_headers, send)
+            return
+        elif origin in self.allow_origins:
+            extra_headers = self.security_headers + [(b"access-control-allow-origin", origin)] + self.cors_headers
+        else:
+            extra_headers = self.security_headers
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # new list: the response object may reuse its own header list
+                message["headers"] = [*message.get("headers", ()), *extra_headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    async def preflight(self, origin: bytes, requested_method: bytes, requested_headers, send):
+        """Answer a CORS preflight without reaching the application"""
+        failures = []
+        if origin not in self.allow_origins:
+            failures.append("origin")
+        if requested_method.decode("latin-1").upper() not in self.allow_methods:
+            failures.append("method")
+        if requested_headers:
+            names = {name.strip().lower() for name in requested_headers.decode("latin-1").split(",")}
+            if not names.issubset(self.allow_headers | {""}):
+                failures.append("headers")
+
+        if failures:
+            status, body = 400, f"Disallowed CORS {', '.join(failures)}".encode()
+            headers = list(self.security_headers)
+        else:
+            status, body = 200, b"OK"
+            headers = self.preflight_headers + [(b"access-control-allow-origin", origin)]
+        headers += [(b"content-type", b"text/plain; charset=utf-8"), (b"content-length", str(len(body)).encode())]
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+class ReadYourWritesMiddleware:
+    """Pins a client's reads to the primary database for a while after it writes.
+
+    Every successful (< 400) response to an unsafe method gets a short-lived cookie
+    holding the time until which the client's read-only routes must skip the read
+    replicas, long enough to cover replication lag.
+    """
+
+    UNSAFE_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+    def __init__(self, app, cookie_name: str, ttl: int = 5):
+        self.app = app
+        self.cookie_name = cookie_name
+        self.ttl = ttl
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in self.UNSAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                until = time.time() + self.ttl
+                cookie = f"{self.cookie_name}={until:.3f}; Max-Age={self.ttl}; Path=/; HttpOnly; SameSite=Lax"
+                message["headers"] = [*message.get("headers", ()), (b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+class MetricsMiddleware:
+    """Request count, status code, latency and in-flight metrics (see core/metrics.py).
+
+    Requests are labelled with the template of the route that handled them
+    (/cart/items/{item_id}, not the raw path), read from the scope after the
+    router matched it; requests no route matched are labelled "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec((method,))
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_requests.inc((method, route, str(status)))
+            http_request_duration.observe(elapsed, (method, route))
+
+class QueryProfilerMiddleware:
+    """Profiles the SQL statements of every request (see core/profiling.py).
+
+    The summary goes out in an X-Query-Profile header with the response, to requests
+    carrying the internal token in an X-Internal-Token header only (Authorization stays
+    free for the user's token, so any route can be profiled as its users call it). The full report, with each statement, its time
+    and call site, and the N+1 suspects, is kept for GET /health/query-profiles. It
+    costs a stack walk per statement, so it's meant for development and load tests,
+    not production: main.py only adds it with CORNU_QUERY_PROFILING on.
+    """
+
+    def __init__(self, app, repeat_threshold: int = 3):
+        self.app = app
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        internal_token = dict(scope["headers"]).get(INTERNAL_TOKEN_HEADER.lower().encode(), b"").decode("latin-1")
+        show_header = matches_internal_token(internal_token)
+        with profile_queries(self.repeat_threshold) as profile:
+            async def send_with_profile(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                if message["type"] == "http.response.start" and show_header:
+                    message["headers"] = [*message.get("headers", ()), (b"x-query-profile", profile.header().encode("latin-1"))]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_profile)
+            finally:
+                recent_profiles.add(scope["method"], scope["path"], status, profile)
@@ -0,0 +1,177 @@
+"""Query profiling: every SQL statement issued while a profile is active, with
+its duration and the application code that issued it.
+
+- CORNU_QUERY_PROFILING=true (off by default) profiles every request
+  (QueryProfilerMiddleware): responses to requests carrying the internal token
+  in an X-Internal-Token header get an X-Query-Profile summary header, and the
+  latest profiles are kept for GET /health/query-profiles, which requires that
+  token (as a bearer token) as well.
+- assert_max_queries(n) profiles a block of test code and fails when it issues
+  more than n statements, to lock in the query budget of a code path.
+
+The same parameterized statement issued CORNU_QUERY_PROFILE_REPEAT_THRESHOLD
+times or more in one profile is reported as an N+1 suspect: a query running
+once per row of an earlier one, where a join or an IN would do.
+"""
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from typing import Deque, List, NamedTuple, Optional
+import sqlalchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+
+# The call site is the innermost frame of the application (outside core/), or else
+# the innermost one outside SQLAlchemy and this module (e.g. a test)
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CORE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_LIBRARY_DIRS = (os.path.dirname(sqlalchemy.__file__) + os.sep, os.path.abspath(__file__), contextlib.__file__)
+
+class StatementRecord(NamedTuple):
+    statement: str
+    duration: float
+    call_site: str
+    executemany: bool
+
+class QueryProfile:
+    """Statements recorded while the profile is the active one"""
+
+    def __init__(self, repeat_threshold: int = settings.CORNU_QUERY_PROFILE_REPEAT_THRESHOLD):
+        self.repeat_threshold = repeat_threshold
+        self.statements: List[StatementRecord] = []
+        self._lock = threading.Lock()  # sync dependencies run in worker threads
+
+    def record(self, statement: StatementRecord) -> None:
+        with self._lock:
+            self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def total_time(self) -> float:
+        return sum((statement.duration for statement in self.statements), 0.0)
+
+    def n_plus_one_suspects(self) -> List[dict]:
+        """Statements repeated repeat_threshold times or more, most repeated first"""
+        repeats = Counter(statement.statement for statement in self.statements if not statement.executemany)
+        suspects = []
+        for sql, count in repeats.most_common():
+            if count < self.repeat_threshold:
+                break
+            call_sites = sorted({statement.call_site for statement in self.statements if statement.statement == sql})
+            suspects.append({"statement": sql, "count": count, "call_sites": call_sites})
+        return suspects
+
+    def header(self) -> str:
+        """Summary for the X-Query-Profile response header"""
+        return f"queries={self.count}; time_ms={self.total_time * 1000:.3f}; n_plus_one={len(self.n_plus_one_suspects())}"
+
+    def report(self) -> dict:
+        return {
+            "queries": self.count,
+            "time_ms": round(self.total_time * 1000, 3),
+            "n_plus_one_suspects": self.n_plus_one_suspects(),
+            "statements": [
+                {
+                    "statement": statement.statement,
+                    "ms": round(statement.duration * 1000, 3),
+                    "call_site": statement.call_site,
+                    "executemany": statement.executemany,
+                }
+                for statement in self.statements
+            ],
+        }
+
+    def describe(self) -> str:
+        return "\n".join(
+            f"  {statement.duration * 1000:8.3f} ms  {statement.call_site}\n      {' '.join(statement.statement.split())}"
+            for statement in self.statements
+        )
+
+_active_profile: ContextVar[Optional[QueryProfile]] = ContextVar("cornu_query_profile", default=None)
+
+def _call_site() -> str:
+    """file:line (function) of the code that issued the statement"""
+    frame, fallback = sys._getframe(2), None
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_DIR) and not filename.startswith(_CORE_DIR):
+            return _describe_frame(frame)
+        if fallback is None and not filename.startswith(_LIBRARY_DIRS):
+            fallback = frame
+        frame = frame.f_back
+    return _describe_frame(fallback) if fallback is not None else "<unknown>"
+
+def _describe_frame(frame) -> str:
+    filename = frame.f_code.co_filename
+    if filename.startswith(os.path.dirname(_APP_DIR)):
+        filename = os.path.relpath(filename, os.path.dirname(_APP_DIR))
+    return f"{filename}:{frame.f_lineno} ({frame.f_code.co_name})"
+
+def _statement_started(conn, cursor, statement, parameters, context, executemany):
+    if _active_profile.get() is not None:
+        conn.info.setdefault("cornu_profile_started", []).append(time.perf_counter())
+
+def _statement_finished(conn, cursor, statement, parameters, context, executemany):
+    profile = _active_profile.get()
+    if profile is None:
+        return
+    started = conn.info.get("cornu_profile_started")
+    duration = time.perf_counter() - started.pop() if started else 0.0
+    profile.record(StatementRecord(statement, duration, _call_site(), executemany))
+
+_install_lock = threading.Lock()
+_installed = False
+
+def install() -> None:
+    """Listen to the statements of every engine (idempotent). Without an active profile a listener only reads a ContextVar."""
+    global _installed
+    with _install_lock:
+        if not _installed:
+            event.listen(Engine, "before_cursor_execute", _statement_started)
+            event.listen(Engine, "after_cursor_execute", _statement_finished)
+            _installed = True
+
+@contextlib.contextmanager
+def profile_queries(repeat_threshold: int = settings.CORNU_QUERY_PROFILE_REPEAT_THRESHOLD):
+    """Record the statements issued inside the block, in this context and the threads / tasks it starts"""
+    install()
+    profile = QueryProfile(repeat_threshold)
+    token = _active_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _active_profile.reset(token)
+
+@contextlib.contextmanager
+def assert_max_queries(n: int):
+    """Test helper: fail when the block issues more than n SQL statements
+
+        with assert_max_queries(2):
+            CartService.get_cart_first_page(db, session_id="s1")
+    """
+    with profile_queries() as profile:
+        yield profile
+    if profile.count > n:
+        raise AssertionError(f"expected at most {n} queries, {profile.count} were issued:\n{profile.describe()}")
+
+class RecentProfiles:
+    """The last `size` request profiles, for GET /health/query-profiles"""
+
+    def __init__(self, size: int = 50):
+        self._profiles: Deque[dict] = deque(maxlen=size)
+
+    def add(self, method: str, path: str, status: int, profile: QueryProfile) -> None:
+        self._profiles.append({"method": method, "path": path, "status": status, **profile.report()})
+
+    def snapshot(self) -> List[dict]:
+        return list(self._profiles)
+
+recent_profiles = RecentProfiles()
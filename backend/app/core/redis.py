@@ -1 +1,200 @@
-# Redis connection setup
+# Redis connection setup and the cart cache built on top of it
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+import redis.asyncio as redis
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+class LRUCacheBackend:
+    """In-process LRU cache with per-entry TTL, safe to share between threads.
+    Synchronous: it also backs the token and CSRF caches, which never wait on I/O."""
+
+    def __init__(self, max_entries: int = 10000, default_ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[0] is not None and entry[0] <= now):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+class CacheBackend(ABC):
+    """Async key/value interface the cart cache is written against"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        """Release connections, at shutdown"""
+
+class LocalCacheBackend(CacheBackend):
+    """LRUCacheBackend behind the async interface. Per process: every worker has its own."""
+
+    def __init__(self, lru: Optional[LRUCacheBackend] = None):
+        self.lru = lru or LRUCacheBackend()
+
+    async def get(self, key):
+        return self.lru.get(key)
+
+    async def set(self, key, value, ttl=None):
+        self.lru.set(key, value, ttl)
+
+    async def delete(self, *keys):
+        self.lru.delete(*keys)
+
+    def stats(self) -> dict:
+        return self.lru.stats()
+
+class RedisCacheBackend(CacheBackend):
+    """Cache backend on a redis.asyncio client (get / set(ex=)), shared by every worker"""
+
+    def __init__(self, client, prefix: str = "cornu:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(
+        cls, url: str, prefix: str = "cornu:", timeout: float = settings.CORNU_REDIS_TIMEOUT_MS / 1000
+    ) -> "RedisCacheBackend":
+        return cls(redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout), prefix=prefix)
+
+    async def get(self, key):
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key, value, ttl=None):
+        await self.client.set(self.prefix + key, value, ex=ttl)
+
+    async def delete(self, *keys):
+        await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def close(self):
+        await self.client.aclose()
+
+class CachedCart(NamedTuple):
+    etag: str
+    body: bytes
+
+class CartCache:
+    """Cache of serialized cart payloads, keyed by cart owner, each stored with its ETag
+
+    GET /cart serves a hit without touching the database. The cart mutation
+    routes keep it current: add, update, batch and merge write the body they
+    answer with through, remove, clear and buffered (write-behind) updates
+    invalidate the owner's entry. A miss is read from the database, primary or
+    replica (a client reads from the primary for a while after its own writes),
+    and stored.
+
+    Changes made outside the API are seen once the entry expires (ttl). With the
+    in-process backend every worker has its own entries, and a write through
+    one worker leaves the others' outdated until then: run several workers on Redis.
+
+    The cache is an optimization only. A failing backend (Redis down or slow)
+    is logged and counts as a miss; the request reads the database. A failed
+    write-through or invalidation is logged too, the old entry then lives until it expires.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: int = 300):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def key(user_id=None, session_id=None) -> Optional[str]:
+        if user_id:
+            return f"cart:user:{user_id}"
+        if session_id:
+            return f"cart:session:{session_id}"
+        return None
+
+    async def get(self, user_id=None, session_id=None) -> Optional[CachedCart]:
+        key = self.key(user_id, session_id)
+        if key is None:
+            return None
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.warning("cart cache read failed, reading the database instead: %r", e)
+            return None
+        if value is None:
+            return None
+        # Stored as b"<etag>\n<body>", an ETag never contains a newline
+        etag, _, body = value.partition(b"\n")
+        return CachedCart(etag.decode(), body)
+
+    async def set(self, payload: bytes, etag: str, user_id=None, session_id=None) -> None:
+        key = self.key(user_id, session_id)
+        if key is None:
+            return
+        try:
+            await self.backend.set(key, etag.encode() + b"\n" + payload, ttl=self.ttl)
+        except Exception as e:
+            logger.warning("cart cache write failed: %r", e)
+
+    async def invalidate(self, user_id=None, session_id=None) -> None:
+        """Drop the entries of a user and / or a session (a merge changes both)"""
+        keys = [key for key in (self.key(user_id=user_id), self.key(session_id=session_id)) if key]
+        if not keys:
+            return
+        try:
+            await self.backend.delete(*keys)
+        except Exception as e:
+            logger.warning("cart cache invalidation failed: %r", e)
+
+def create_cache_backend() -> CacheBackend:
+    if settings.CORNU_REDIS_URL:
+        return RedisCacheBackend.from_url(settings.CORNU_REDIS_URL)
+    return LocalCacheBackend(LRUCacheBackend(max_entries=settings.CORNU_CART_CACHE_MAX_ENTRIES))
+
+cart_cache = CartCache(create_cache_backend(), ttl=settings.CORNU_CART_CACHE_TTL)
@@ -5,6 +5,12 @@ import time
 from os import getenv
 from typing import Optional
 from fastapi import HTTPException, Request, Response
+from .config import settings
+from .redis import LRUCacheBackend
+from ..utils.origin_check import validate_request_origin
+
+# Methods that don't change state and skip the request guard
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "TRACE"})
 
 class CSRFProtection:
     """Custom CSRF protection implementation"""
@@ -14,6 +20,16 @@ class CSRFProtection:
         self.token_expiry = 3600  # 1 hour
         self.cookie_name = "csrftoken"
         self.header_name = "X-CSRF-Token"
+        # Keyed once, copied per signature instead of re-encoding the key on every call
+        self._hmac = hmac.new(self.secret_key.encode(), digestmod=hashlib.sha256)
+        # Recently validated tokens, each kept until it expires
+        self._validated_tokens = LRUCacheBackend(max_entries=4096)
+    
+    def _sign(self, message: str) -> str:
+        """HMAC-SHA256 hex signature of message"""
+        signer = self._hmac.copy()
+        signer.update(message.encode())
+        return signer.hexdigest()
     
     def generate_csrf_token(self) -> str:
         """Generate a CSRF token"""
@@ -21,16 +37,14 @@ class CSRFProtection:
         random_value = secrets.token_urlsafe(16)
         message = f"{timestamp}:{random_value}"
         
-        signature = hmac.new(
-            self.secret_key.encode(),
-            message.encode(),
-            hashlib.sha256
-        ).hexdigest()
+        signature = self._sign(message)
         
         return f"{message}:{signature}"
     
     def validate_csrf_token(self, token: str) -> bool:
         """Validate a CSRF token"""
+        if self._validated_tokens.get(token):
+            return True
         try:
             parts = token.split(":")
             if len(parts) != 3:
@@ -40,11 +54,7 @@ class CSRFProtection:
             message = f"{timestamp}:{random_value}"
             
             # Verify signature
-            expected_signature = hmac.new(
-                self.secret_key.encode(),
-                message.encode(),
-                hashlib.sha256
-            ).hexdigest()
+            expected_signature = self._sign(message)
             
             if not hmac.compare_digest(signature, expected_signature):
                 return False
@@ -56,6 +66,7 @@ class CSRFProtection:
             if current_time - token_time > self.token_expiry:
                 return False
             
+            self._validated_tokens.set(token, True, ttl=self.token_expiry - (current_time - token_time))
             return True
         except (ValueError, TypeError):
             return False
@@ -103,3 +114,62 @@ class CSRFProtection:
 
 # Global CSRF protection instance
 csrf_protect = CSRFProtection()
+
+class RequestGuard:
+    """Origin/referer and CSRF checks for state-changing requests.
+    
+    Declared on the route instead of called in the handler:
+        @router.post("/", dependencies=[Depends(request_guard)])
+    Safe methods pass straight through, and FastAPI caches the dependency per
+    request, so the checks run once per unsafe request.
+    """
+    
+    def __init__(self, check_origin: bool = True, check_csrf: bool = True):
+        self.check_origin = check_origin
+        self.check_csrf = check_csrf
+    
+    async def __call__(self, request: Request):
+        if request.method in SAFE_METHODS:
+            return
+        if self.check_origin:
+            # Validate request origin to prevent cross-site attacks
+            validate_request_origin(request)
+        if self.check_csrf:
+            # CSRF protection for state-changing operation
+            csrf_protect.validate_csrf(request)
+
+# Origin + CSRF guard for every state-changing route
+request_guard = RequestGuard()
+
+# Carries CORNU_INTERNAL_TOKEN on requests whose Authorization header holds a user's token,
+# e.g. to get the X-Query-Profile header of a cart request
+INTERNAL_TOKEN_HEADER = "X-Internal-Token"
+
+def matches_internal_token(token: Optional[str]) -> bool:
+    """Whether a token is CORNU_INTERNAL_TOKEN (never, while it is unset)"""
+    expected = settings.CORNU_INTERNAL_TOKEN
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.strip().encode(), expected.encode())
+
+def is_internal_token(authorization: Optional[str]) -> bool:
+    """Whether an Authorization header carries CORNU_INTERNAL_TOKEN as a bearer token"""
+    scheme, _, credentials = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and matches_internal_token(credentials)
+
+class InternalGuard:
+    """Bearer token check of the operational endpoints: metrics, pool, cache and job reports.
+    
+    Declared on their routers:
+        router = APIRouter(prefix="/health", dependencies=[Depends(internal_guard)])
+    While CORNU_INTERNAL_TOKEN is unset the endpoints answer 404, as if they were not mounted.
+    """
+    
+    async def __call__(self, request: Request):
+        if not settings.CORNU_INTERNAL_TOKEN:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if not is_internal_token(request.headers.get("authorization")):
+            raise HTTPException(status_code=401, detail="Invalid internal token", headers={"WWW-Authenticate": "Bearer"})
+
+# Token guard for the operational endpoints
+internal_guard = InternalGuard()
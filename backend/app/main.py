@@ -1,50 +1,69 @@
+import asyncio
 import uvicorn
+from contextlib import asynccontextmanager, suppress
 from app.routes.user_login import router as user_login_router
 from app.routes.user_refresh_token import router as user_refresh_router
 from app.routes.user_registration import router as user_register_router
 from app.routes.cart import router as cart_router
 from app.routes.cart_item import router as cart_item_router
 from app.routes.security import router as security_router
-from fastapi import FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-
-
-my_app = FastAPI(title="Cornucopia API", version="1.0.0", root_path="/cornucopia")
-
-# Security headers middleware
-@my_app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    
-    # Security headers
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-    response.headers["Content-Security-Policy"] = (
-        "default-src 'self'; "
-        "script-src 'self'; "
-        "style-src 'self' 'unsafe-inline'; "
-        "img-src 'self' data: https:; "
-        "connect-src 'self'; "
-        "font-src 'self'; "
-        "object-src 'none'; "
-        "media-src 'self'; "
-        "frame-src 'none'; "
-        "base-uri 'self';"
-    )
-    
-    return response
-
-# CORS middleware with credentials support for HttpOnly cookies
+from app.routes.health import router as health_router
+from app.routes.metrics import router as metrics_router
+from app.core.config import settings
+from app.core.database import READ_PRIMARY_COOKIE, db_manager
+from app.core.hashing import password_hasher
+from app.core.redis import cart_cache
+from app.core.middleware import MetricsMiddleware, QueryProfilerMiddleware, ReadYourWritesMiddleware, SecurityHeadersMiddleware
+from app.services.cart_sweeper import cart_sweeper
+from app.services.cart_write_behind import cart_write_behind
+from fastapi import FastAPI
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background tasks living as long as the process
+    tasks = []
+    if settings.CORNU_CART_SWEEP_INTERVAL > 0:
+        tasks.append(asyncio.create_task(cart_sweeper.run_periodically(settings.CORNU_CART_SWEEP_INTERVAL)))
+    if cart_write_behind.enabled:
+        tasks.append(asyncio.create_task(cart_write_behind.run_periodically()))
+    if db_manager.replicas:
+        tasks.append(asyncio.create_task(db_manager.replicas.run_health_checks(settings.CORNU_DB_REPLICA_CHECK_INTERVAL)))
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # Write-behind: whatever is still buffered is written before the process exits
+    if cart_write_behind.enabled:
+        await asyncio.to_thread(cart_write_behind.flush)
+    await cart_cache.backend.close()
+    password_hasher.shutdown()
+
+my_app = FastAPI(title="Cornucopia API", version="1.0.0", root_path="/cornucopia", lifespan=lifespan)
+
+# Security headers and CORS (with credentials support for HttpOnly cookies) in one pure ASGI middleware
 my_app.add_middleware(
-    CORSMiddleware,
+    SecurityHeadersMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:5173"],  # Specific origins
     allow_credentials=True,  # Required for HttpOnly cookies
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],  # Specific methods
-    allow_headers=["Authorization", "Content-Type", "X-CSRF-Token"],  # Include CSRF header
+    allow_headers=["Authorization", "Content-Type", "X-CSRF-Token", "If-Match", "If-None-Match", "X-Internal-Token"],  # Include CSRF, precondition and query profile headers
+    expose_headers=["ETag", "X-Query-Profile"],  # Cart version, sent back in If-Match; query profile summary
 )
 
+# Read replicas: after a write, the client's reads stay on the primary (read-your-writes)
+if db_manager.replicas:
+    my_app.add_middleware(ReadYourWritesMiddleware, cookie_name=READ_PRIMARY_COOKIE, ttl=settings.CORNU_DB_READ_STICKY_SECONDS)
+
+# Development only: statements of each request, N+1 suspects flagged
+if settings.CORNU_QUERY_PROFILING:
+    my_app.add_middleware(QueryProfilerMiddleware, repeat_threshold=settings.CORNU_QUERY_PROFILE_REPEAT_THRESHOLD)
+
+# Outermost, so the recorded latency covers the other middleware too
+if settings.CORNU_METRICS_ENABLED:
+    my_app.add_middleware(MetricsMiddleware)
+
 # Include routers
 my_app.include_router(security_router)  # Security endpoints (CSRF, etc.)
 my_app.include_router(user_refresh_router, prefix="/user", tags=["user"])  
@@ -52,6 +71,9 @@ my_app.include_router(user_login_router, prefix="/user", tags=["user"])
 my_app.include_router(user_register_router, prefix="/user", tags=["user"])  
 my_app.include_router(cart_router)  
 my_app.include_router(cart_item_router) 
+my_app.include_router(health_router)
+if settings.CORNU_METRICS_ENABLED:
+    my_app.include_router(metrics_router)
 
 if __name__ == "__main__":
     uvicorn.run("app.main:my_app", host="0.0.0.0", port=8000, reload=True)
@@ -1,7 +1,7 @@
 import uuid
-from ..core.database import Base
+from ..core.database import Base, UTCDateTime
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import Column, String, Integer, ForeignKey, CheckConstraint, Index, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -11,8 +11,10 @@ class Cart(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, unique=True, nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True, unique=True) 
     session_id = Column(String(128), nullable=True, unique=True, index=True) 
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+    # Bumped by every mutation of the cart or its items, checked against If-Match for optimistic concurrency
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Ensure user_id and session_id cannot be null at the same time, 
     # but only one can have a value
@@ -21,6 +23,15 @@ class Cart(Base):
             '(user_id IS NOT NULL AND session_id IS NULL) OR (user_id IS NULL AND session_id IS NOT NULL)',
             name='chk_cart_owner'
         ),
+        # Finds stale anonymous carts for the sweeper, user carts are left out of the index
+        Index(
+            "ix_carts_session_updated_at",
+            "updated_at",
+            postgresql_where=text("session_id IS NOT NULL"),
+            sqlite_where=text("session_id IS NOT NULL")
+        ),
+        # Stored on the cart shards when CORNU_DB_SHARD_URLS is set
+        {"info": {"sharded": True}},
     )
   
     items = relationship("CartItem", back_populates="cart", cascade="all, delete-orphan")
@@ -1,7 +1,7 @@
 import uuid
-from ..core.database import Base
+from ..core.database import Base, UTCDateTime
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, ForeignKey, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -14,8 +14,34 @@ class CartItem(Base):
     quantity = Column(Integer, nullable=False, default=1)
     # Can add price snapshot to avoid cart being affected by price changes
     price_snapshot = Column(String(20), nullable=True)  # Store price as string to avoid floating point issues
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     
+    __table_args__ = (
+        # One line per product in a cart, also the conflict target of the add-to-cart upsert
+        Index("ux_cart_items_cart_product", "cart_id", "product_id", unique=True),
+        # Keyset pagination of a cart's lines in (created_at, id) order
+        Index("ix_cart_items_cart_created_id", "cart_id", "created_at", "id"),
+        # Stored on the shard of its cart when CORNU_DB_SHARD_URLS is set
+        {"info": {"sharded": True}},
+    )
+
     # Relationships
     cart = relationship("Cart", back_populates="items")
+
+class CartItemTransfer(Base):
+    """Cart line copied into a cart on another database (shard move, cross-shard merge), source not deleted yet.
+
+    Written in the transaction of the copy: a copy run again after an interruption skips
+    the lines it already added instead of adding their quantities twice.
+    """
+    __tablename__ = "cart_item_transfers"
+
+    source_item_id = Column(UUID(as_uuid=True), primary_key=True)
+    cart_id = Column(UUID(as_uuid=True), nullable=False)
+    created_at = Column(UTCDateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        # Stored on the shard of the cart the line was copied into
+        {"info": {"sharded": True}},
+    )
@@ -1,7 +1,7 @@
 import uuid
-from ..core.database import Base
+from ..core.database import Base, UTCDateTime
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, Boolean, DateTime
+from sqlalchemy import Column, String, Boolean
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 
@@ -14,8 +14,8 @@ class User(Base):
     email = Column(String(120), unique=True, index=True, nullable=False)
     is_active = Column(Boolean, default=True)
     is_superuser = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
-    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    created_at = Column(UTCDateTime, default=datetime.now(timezone.utc))
+    updated_at = Column(UTCDateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
 
     # 1 user 1 cart
     cart = relationship("Cart", back_populates="user", uselist=False)
@@ -1,123 +1,192 @@
-import uuid
-from fastapi import APIRouter, Depends, HTTPException, Request, Response
-from sqlalchemy.orm import Session
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Union
+from ..core.config import settings
 from ..core.database import db_manager
-from ..core.security import csrf_protect
-from ..utils.origin_check import validate_request_origin
-from ..services.cart import CartService
-from ..services.user import get_current_user as _get_current_user
-from ..schemas.cart import CartResponse
+from ..core.redis import cart_cache
+from ..core.security import request_guard
+from ..services.cart import AsyncCartService, CartVersionConflictError, virtual_cart
+from ..services.cart_write_behind import cart_write_behind, flush_pending_cart_writes
+from ..services.user import get_current_user as _get_current_user, get_current_user_optional, get_user_id
+from ..schemas.cart import CartPageResponse, CartResponse, CartSummaryResponse
+from ..utils.cart_owner import get_cart_identifier, set_secure_cookie
+from ..utils.etag import (
+    CartVersion, cart_cache_headers, cart_etag, etag_matches, expected_cart_version,
+    not_modified_response, precondition_failed
+)
+from ..utils.pagination import encode_cursor
+from ..utils.serialization import CartJSONResponse, serialize_cart_page, serialize_cart_response, serialize_cart_summary
 
 router = APIRouter(prefix="/cart", tags=["cart"])
 
-def get_db():
-    """Get database connection"""
-    return next(db_manager.get_db())
-
-def get_current_user_optional() -> Optional[dict]:
-    """Get current user (optional)"""
-    try:
-        return _get_current_user()
-    except HTTPException:
-        return None
-
-def set_secure_cookie(response: Response, key: str, value: str):
-    """Set secure cookie with improved security settings"""
-    response.set_cookie(
-        key=key,
-        value=value,
-        max_age=60*60*24*30,  # 30 days
-        httponly=True,        # Prevent JavaScript access
-        secure=False,         # Set to True in production with HTTPS
-        samesite="strict"     # Strict CSRF protection
-    )
-
-def get_cart_identifier(request: Request, current_user: Optional[dict] = None):
-    """Get cart identifier information"""
-    if current_user:
-        return {"user_id": str(current_user["id"]), "session_id": None}
-    
-    # For anonymous users, use session or cookie to identify
-    session_id = request.cookies.get("cart_session_id")
-    if not session_id:
-        session_id = str(uuid.uuid4())
-    
-    return {"user_id": None, "session_id": session_id}
-
-@router.get("/", response_model=CartResponse)
+@router.get("/", response_model=Union[CartResponse, CartPageResponse])
 async def get_cart(
     request: Request,
-    response: Response,
-    db: Session = Depends(get_db),
+    page_size: Optional[int] = Query(None, ge=1, le=settings.CORNU_CART_MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(db_manager.get_async_read_db),
     current_user: Optional[dict] = Depends(get_current_user_optional)
 ):
-    """Get cart content"""
+    """Get cart content - served from the cart cache when possible
+    
+    An owner without a cart row gets a virtual empty cart (an id derived from the
+    owner, version 0), nothing is written.
+    
+    Responses carry a strong ETag, the paged representation one of its own
+    per page size. A cached cart (kept current by the mutation routes) is served,
+    or answered 304, without touching the database. Otherwise a matching
+    If-None-Match is answered with 304 after one indexed lookup of the cart's
+    version, without loading the items.
+    
+    With page_size, only the first page of items is returned (a CartPageResponse),
+    together with the totals and the cursor to continue with on GET /cart/items.
+    
+    Reads may be served by a read replica.
+    """
     cart_info = get_cart_identifier(request, current_user)
+    new_session = not current_user and not request.cookies.get("cart_session_id")
+    if_none_match = request.headers.get("if-none-match")
+    
+    # Buffered (write-behind) quantity updates: page mode flushes them, the full cart shows them
+    pending = not new_session and cart_write_behind.has_pending(**cart_info)
+    if pending and page_size is not None:
+        await cart_write_behind.flush_owner(**cart_info)
+        pending = False
+    
+    cached = None if new_session or pending or page_size is not None else await cart_cache.get(**cart_info)
+    if cached is not None:
+        if etag_matches(if_none_match, cached.etag):
+            return not_modified_response(cached.etag)
+    elif if_none_match and not new_session and not pending:
+        etag = await AsyncCartService.get_cart_etag(db, page_size=page_size, **cart_info)
+        if etag_matches(if_none_match, etag):
+            return not_modified_response(etag)
+    
+    if new_session:
+        # First visit: no cart can exist, answer without touching the database
+        cart = virtual_cart(**cart_info)
+        etag = cart_etag(cart.id, cart.version, page_size)
+        payload = serialize_cart_page(cart, 0, 0, None) if page_size is not None else serialize_cart_response(cart, 0)
+    elif page_size is not None:
+        page = await AsyncCartService.get_cart_first_page(
+            db,
+            user_id=cart_info["user_id"],
+            session_id=cart_info["session_id"],
+            page_size=page_size
+        )
+        next_cursor = encode_cursor(page.next_key) if page.next_key else None
+        etag = cart_etag(page.cart.id, page.cart.version, page_size)
+        payload = serialize_cart_page(page.cart, page.total_items, page.line_count, next_cursor)
+    elif cached is None:
+        # Reads never create the cart, the first mutation does
+        cart = await AsyncCartService.get_cart(
+            db, 
+            user_id=cart_info["user_id"], 
+            session_id=cart_info["session_id"]
+        ) or virtual_cart(**cart_info)
+        
+        if pending:
+            # Not stored yet: no ETag, and nothing cached
+            cart_write_behind.project(cart, **cart_info)
+            total_items = AsyncCartService.get_cart_total_items(cart)
+            etag, payload = None, serialize_cart_response(cart, total_items)
+        else:
+            total_items = AsyncCartService.get_cart_total_items(cart)
+            etag, payload = cart_etag(cart.id, cart.version), serialize_cart_response(cart, total_items)
+            await cart_cache.set(payload, etag, **cart_info)
+    else:
+        etag, payload = cached
+    
+    response = CartJSONResponse(payload, headers=cart_cache_headers(etag) if etag else {"Cache-Control": "no-store"})
     
     # If anonymous user and no session_id, set cookie
-    if not current_user and not request.cookies.get("cart_session_id"):
+    if new_session:
         set_secure_cookie(response, "cart_session_id", cart_info["session_id"])
     
-    cart = CartService.get_or_create_cart(
-        db, 
-        user_id=cart_info["user_id"], 
-        session_id=cart_info["session_id"]
-    )
+    return response
+
+@router.get("/summary", response_model=CartSummaryResponse)
+async def get_cart_summary(
+    request: Request,
+    db: AsyncSession = Depends(db_manager.get_async_read_db),
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
+    """Line count and total quantity only, for badges - one aggregate query
     
-    total_items = CartService.get_cart_total_items(cart)
+    Responses carry a strong ETag of their own, from the cart's version: a matching
+    If-None-Match is answered with 304 after one indexed lookup of the version.
+    Buffered (write-behind) quantity updates are counted on the projected cart,
+    without ETag; they are not flushed by this read.
     
-    return CartResponse(cart=cart, total_items=total_items)
+    Reads may be served by a read replica.
+    """
+    if not current_user and not request.cookies.get("cart_session_id"):
+        # No cart can exist yet, and a read must not create one
+        return CartJSONResponse(serialize_cart_summary(0, 0), headers={"Cache-Control": "no-store"})
+    
+    cart_info = get_cart_identifier(request, current_user)
+    if cart_write_behind.has_pending(**cart_info):
+        # Not stored yet: counted on the cart as GET /cart shows it, no ETag
+        cart = await AsyncCartService.get_cart(db, **cart_info) or virtual_cart(**cart_info)
+        cart_write_behind.project(cart, **cart_info)
+        payload = serialize_cart_summary(len(cart.items), AsyncCartService.get_cart_total_items(cart))
+        return CartJSONResponse(payload, headers={"Cache-Control": "no-store"})
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etag = await AsyncCartService.get_cart_etag(db, summary=True, **cart_info)
+        if etag_matches(if_none_match, etag):
+            return not_modified_response(etag)
+    
+    etag, line_count, total_items = await AsyncCartService.get_cart_summary_with_etag(db, **cart_info)
+    return CartJSONResponse(serialize_cart_summary(line_count, total_items), headers=cart_cache_headers(etag))
 
-@router.delete("/")
+@router.delete("/", dependencies=[Depends(request_guard), Depends(flush_pending_cart_writes)])
 async def clear_cart(
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: Optional[dict] = Depends(get_current_user_optional)
+    db: AsyncSession = Depends(db_manager.get_async_db),
+    current_user: Optional[dict] = Depends(get_current_user_optional),
+    expected_version: Optional[CartVersion] = Depends(expected_cart_version)
 ):
     """Clear cart - requires CSRF protection and origin validation"""
-    # Validate request origin to prevent cross-site attacks
-    validate_request_origin(request)
-    
-    # CSRF protection for state-changing operation
-    csrf_protect.validate_csrf(request)
-    
     cart_info = get_cart_identifier(request, current_user)
     
-    success = CartService.clear_cart(
-        db,
-        user_id=cart_info["user_id"],
-        session_id=cart_info["session_id"]
-    )
+    try:
+        success = await AsyncCartService.clear_cart(
+            db,
+            user_id=cart_info["user_id"],
+            session_id=cart_info["session_id"],
+            expected_version=expected_version
+        )
+    except CartVersionConflictError as e:
+        raise precondition_failed(e.cart_id, e.current_version)
     
     if not success:
         raise HTTPException(status_code=404, detail="Cart not found")
     
+    await cart_cache.invalidate(**cart_info)
     return {"message": "Cart cleared"}
 
-@router.post("/merge")
+@router.post("/merge", dependencies=[Depends(request_guard), Depends(flush_pending_cart_writes)])
 async def merge_cart_on_login(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(db_manager.get_async_db),
     current_user: dict = Depends(_get_current_user)  # Require login
 ):
     """Merge cart on user login - requires CSRF protection and origin validation"""
-    # Validate request origin to prevent cross-site attacks
-    validate_request_origin(request)
-    
-    # CSRF protection for state-changing operation
-    csrf_protect.validate_csrf(request)
-    
     session_id = request.cookies.get("cart_session_id")
     
     if not session_id:
         return {"message": "No anonymous cart to merge"}
     
-    user_id = str(current_user["id"])
-    merged_cart = CartService.merge_carts(db, user_id, session_id)
+    user_id = get_user_id(current_user)
+    merged_cart = await AsyncCartService.merge_carts(db, user_id, session_id)
+    # The anonymous cart is gone (or now the user's)
+    await cart_cache.invalidate(session_id=session_id)
     
     if merged_cart:
-        total_items = CartService.get_cart_total_items(merged_cart)
-        return CartResponse(cart=merged_cart, total_items=total_items)
+        total_items = AsyncCartService.get_cart_total_items(merged_cart)
+        etag, payload = cart_etag(merged_cart.id, merged_cart.version), serialize_cart_response(merged_cart, total_items)
+        await cart_cache.set(payload, etag, user_id=user_id)
+        return CartJSONResponse(payload, headers=cart_cache_headers(etag))
     
     return {"message": "No cart to merge"}
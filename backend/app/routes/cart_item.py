@@ -1,116 +1,182 @@
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, Request, Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
+from ..core.config import settings
 from ..core.database import db_manager
-from ..core.security import csrf_protect
-from ..utils.origin_check import validate_request_origin
-from ..services.cart import CartService
-from ..services.cart_item import CartItemService
-from ..services.user import get_current_user as _get_current_user
+from ..core.redis import cart_cache
+from ..core.security import request_guard
+from ..services.cart import AsyncCartService, CartVersionConflictError
+from ..services.cart_item import AsyncCartItemService, CartItemNotFoundError
+from ..services.cart_write_behind import cart_write_behind, flush_pending_cart_writes
+from ..services.user import get_current_user_optional
 from ..schemas.cart import CartResponse
-from ..schemas.cart_item import AddToCartRequest, UpdateCartItemRequest
+from ..schemas.cart_item import AddToCartRequest, CartBatchRequest, CartItemPage, UpdateCartItemRequest
+from ..utils.cart_owner import get_cart_identifier, set_secure_cookie
+from ..utils.etag import CartVersion, cart_cache_headers, cart_etag, expected_cart_version, precondition_failed
+from ..utils.pagination import decode_cursor, encode_cursor
+from ..utils.serialization import CartJSONResponse, serialize_cart_items_page, serialize_cart_response
 
 router = APIRouter(prefix="/cart/items", tags=["cart-items"])
 
-def get_db():
-    """Get database connection"""
-    return next(db_manager.get_db())
-
-def get_current_user_optional() -> Optional[dict]:
-    """Get current user (optional)"""
+@router.get("/", response_model=CartItemPage)
+async def list_cart_items(
+    request: Request,
+    page_size: int = Query(settings.CORNU_CART_PAGE_SIZE, ge=1, le=settings.CORNU_CART_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(db_manager.get_async_read_db),
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
+    """List cart items page by page, oldest first - pass next_cursor back as cursor for the next page"""
     try:
-        return _get_current_user()
-    except HTTPException:
-        return None
-
-def set_secure_cookie(response: Response, key: str, value: str):
-    """Set secure cookie with improved security settings"""
-    response.set_cookie(
-        key=key,
-        value=value,
-        max_age=60*60*24*30,  # 30 days
-        httponly=True,        # Prevent JavaScript access
-        secure=False,         # Set to True in production with HTTPS
-        samesite="strict"     # Strict CSRF protection
-    )
-
-def get_cart_identifier(request: Request, current_user: Optional[dict] = None):
-    """Get cart identifier information"""
-    if current_user:
-        return {"user_id": str(current_user["id"]), "session_id": None}
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     
-    # For anonymous users, use session or cookie to identify
-    session_id = request.cookies.get("cart_session_id")
-    if not session_id:
-        session_id = str(uuid.uuid4())
+    if not current_user and not request.cookies.get("cart_session_id"):
+        # No cart can exist yet
+        return CartJSONResponse(serialize_cart_items_page([], None))
     
-    return {"user_id": None, "session_id": session_id}
+    cart_info = get_cart_identifier(request, current_user)
+    await cart_write_behind.flush_owner(**cart_info)
+    items, next_key = await AsyncCartService.get_cart_items_page(
+        db,
+        user_id=cart_info["user_id"],
+        session_id=cart_info["session_id"],
+        limit=page_size,
+        after=after
+    )
+    
+    return CartJSONResponse(serialize_cart_items_page(items, encode_cursor(next_key) if next_key else None))
 
-@router.post("/", response_model=CartResponse)
+@router.post("/", response_model=CartResponse, dependencies=[Depends(request_guard), Depends(flush_pending_cart_writes)])
 async def add_to_cart(
     request: Request,
-    response: Response,
     add_request: AddToCartRequest,
-    db: Session = Depends(get_db),
-    current_user: Optional[dict] = Depends(get_current_user_optional)
+    db: AsyncSession = Depends(db_manager.get_async_db),
+    current_user: Optional[dict] = Depends(get_current_user_optional),
+    expected_version: Optional[CartVersion] = Depends(expected_cart_version)
 ):
-    """Add product to cart - requires CSRF protection and origin validation"""
-    # Validate request origin to prevent cross-site attacks
-    validate_request_origin(request)
-    
-    # CSRF protection for state-changing operation
-    csrf_protect.validate_csrf(request)
+    """Add product to cart - requires CSRF protection and origin validation
     
+    Like every cart mutation, takes an optional If-Match (or expected_version)
+    precondition and answers 412 when the cart has changed since.
+    """
     cart_info = get_cart_identifier(request, current_user)
     
+    # The cart is created if needed and comes back with its items loaded, no refresh needed
+    try:
+        cart_item = await AsyncCartItemService.add_item_to_cart(
+            db,
+            add_request,
+            user_id=cart_info["user_id"],
+            session_id=cart_info["session_id"],
+            expected_version=expected_version
+        )
+    except CartVersionConflictError as e:
+        raise precondition_failed(e.cart_id, e.current_version)
+    cart = cart_item.cart
+    
+    total_items = AsyncCartService.get_cart_total_items(cart)
+    etag, payload = cart_etag(cart.id, cart.version), serialize_cart_response(cart, total_items)
+    await cart_cache.set(payload, etag, **cart_info)
+    response = CartJSONResponse(payload, headers=cart_cache_headers(etag))
+    
     # If anonymous user and no session_id, set cookie
     if not current_user and not request.cookies.get("cart_session_id"):
         set_secure_cookie(response, "cart_session_id", cart_info["session_id"])
     
-    cart = CartService.get_or_create_cart(
-        db, 
-        user_id=cart_info["user_id"], 
-        session_id=cart_info["session_id"]
-    )
+    return response
+
+@router.post("/batch", response_model=CartResponse, dependencies=[Depends(request_guard), Depends(flush_pending_cart_writes)])
+async def batch_update_cart(
+    request: Request,
+    batch_request: CartBatchRequest,
+    db: AsyncSession = Depends(db_manager.get_async_db),
+    current_user: Optional[dict] = Depends(get_current_user_optional),
+    expected_version: Optional[CartVersion] = Depends(expected_cart_version)
+):
+    """Apply many add / update / remove operations at once - requires CSRF protection and origin validation
     
-    CartItemService.add_item_to_cart(db, cart, add_request)
+    The whole batch is one transaction: if any operation references a line
+    that is not in the cart, nothing is applied and 404 is returned.
+    """
+    cart_info = get_cart_identifier(request, current_user)
     
-    # Refresh cart to get updated data
-    db.refresh(cart)
-    total_items = CartService.get_cart_total_items(cart)
+    try:
+        cart = await AsyncCartItemService.apply_batch(
+            db,
+            batch_request.operations,
+            user_id=cart_info["user_id"],
+            session_id=cart_info["session_id"],
+            expected_version=expected_version
+        )
+    except CartItemNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except CartVersionConflictError as e:
+        raise precondition_failed(e.cart_id, e.current_version)
+    
+    total_items = AsyncCartService.get_cart_total_items(cart)
+    etag, payload = cart_etag(cart.id, cart.version), serialize_cart_response(cart, total_items)
+    await cart_cache.set(payload, etag, **cart_info)
+    response = CartJSONResponse(payload, headers=cart_cache_headers(etag))
     
-    return CartResponse(cart=cart, total_items=total_items)
+    # If anonymous user and no session_id, set cookie
+    if not current_user and not request.cookies.get("cart_session_id"):
+        set_secure_cookie(response, "cart_session_id", cart_info["session_id"])
+    
+    return response
 
-@router.put("/{item_id}", response_model=CartResponse)
+@router.put("/{item_id}", response_model=CartResponse, dependencies=[Depends(request_guard)])
 async def update_cart_item(
-    item_id: str,
+    item_id: uuid.UUID,
     request: Request,
     update_request: UpdateCartItemRequest,
-    db: Session = Depends(get_db),
-    current_user: Optional[dict] = Depends(get_current_user_optional)
+    db: AsyncSession = Depends(db_manager.get_async_db),
+    current_user: Optional[dict] = Depends(get_current_user_optional),
+    expected_version: Optional[CartVersion] = Depends(expected_cart_version)
 ):
-    """Update cart item quantity - requires CSRF protection and origin validation"""
-    # Validate request origin to prevent cross-site attacks
-    validate_request_origin(request)
+    """Update cart item quantity - requires CSRF protection and origin validation
     
-    # CSRF protection for state-changing operation
-    csrf_protect.validate_csrf(request)
+    In write-behind mode an unconditional quantity change is buffered and answered
+    with the projected cart (no ETag, the version changes when it is flushed).
+    """
     cart_info = get_cart_identifier(request, current_user)
     
-    cart_item = CartItemService.update_cart_item(
-        db,
-        item_id,
-        update_request,
-        user_id=cart_info["user_id"],
-        session_id=cart_info["session_id"]
-    )
-    
-    if not cart_item and update_request.quantity > 0:
+    if cart_write_behind.enabled and expected_version is None and update_request.quantity > 0:
+        cart = await AsyncCartService.get_cart(
+            db, 
+            user_id=cart_info["user_id"], 
+            session_id=cart_info["session_id"]
+        )
+        if not cart or not any(item.id == item_id for item in cart.items):
+            raise HTTPException(status_code=404, detail="Cart item not found")
+        
+        cart_write_behind.submit(cart, item_id, update_request.quantity, **cart_info)
+        # Reads skip the cache while the owner has buffered quantities, and find nothing once they are flushed
+        await cart_cache.invalidate(**cart_info)
+        cart_write_behind.project(cart, **cart_info)
+        total_items = AsyncCartService.get_cart_total_items(cart)
+        return CartJSONResponse(serialize_cart_response(cart, total_items), headers={"Cache-Control": "no-store"})
+    
+    # Synchronous update: buffered quantities of this owner go first
+    await cart_write_behind.flush_owner(**cart_info)
+    try:
+        await AsyncCartItemService.update_cart_item(
+            db,
+            item_id,
+            update_request,
+            user_id=cart_info["user_id"],
+            session_id=cart_info["session_id"],
+            expected_version=expected_version
+        )
+    except CartItemNotFoundError:
         raise HTTPException(status_code=404, detail="Cart item not found")
+    except CartVersionConflictError as e:
+        raise precondition_failed(e.cart_id, e.current_version)
     
     # Get updated cart
-    cart = CartService.get_cart(
+    cart = await AsyncCartService.get_cart(
         db, 
         user_id=cart_info["user_id"], 
         session_id=cart_info["session_id"]
@@ -119,33 +185,35 @@ async def update_cart_item(
     if not cart:
         raise HTTPException(status_code=404, detail="Cart not found")
     
-    total_items = CartService.get_cart_total_items(cart)
-    
-    return CartResponse(cart=cart, total_items=total_items)
+    total_items = AsyncCartService.get_cart_total_items(cart)
+    etag, payload = cart_etag(cart.id, cart.version), serialize_cart_response(cart, total_items)
+    await cart_cache.set(payload, etag, **cart_info)
+    return CartJSONResponse(payload, headers=cart_cache_headers(etag))
 
-@router.delete("/{item_id}")
+@router.delete("/{item_id}", dependencies=[Depends(request_guard), Depends(flush_pending_cart_writes)])
 async def remove_cart_item(
-    item_id: str,
+    item_id: uuid.UUID,
     request: Request,
-    db: Session = Depends(get_db),
-    current_user: Optional[dict] = Depends(get_current_user_optional)
+    db: AsyncSession = Depends(db_manager.get_async_db),
+    current_user: Optional[dict] = Depends(get_current_user_optional),
+    expected_version: Optional[CartVersion] = Depends(expected_cart_version)
 ):
     """Remove item from cart - requires CSRF protection and origin validation"""
-    # Validate request origin to prevent cross-site attacks
-    validate_request_origin(request)
-    
-    # CSRF protection for state-changing operation
-    csrf_protect.validate_csrf(request)
     cart_info = get_cart_identifier(request, current_user)
     
-    success = CartItemService.remove_cart_item(
-        db,
-        item_id,
-        user_id=cart_info["user_id"],
-        session_id=cart_info["session_id"]
-    )
+    try:
+        success = await AsyncCartItemService.remove_cart_item(
+            db,
+            item_id,
+            user_id=cart_info["user_id"],
+            session_id=cart_info["session_id"],
+            expected_version=expected_version
+        )
+    except CartVersionConflictError as e:
+        raise precondition_failed(e.cart_id, e.current_version)
     
     if not success:
         raise HTTPException(status_code=404, detail="Cart item not found")
     
+    await cart_cache.invalidate(**cart_info)
     return {"message": "Item removed from cart"}
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ..core.config import settings
+from ..core.database import db_manager
+from ..core.hashing import password_hasher
+from ..core.profiling import recent_profiles
+from ..core.redis import LocalCacheBackend, cart_cache
+from ..core.security import internal_guard
+from ..services.cart_sweeper import cart_sweeper
+from ..services.cart_write_behind import cart_write_behind
+from ..services.user import token_cache
+
+# Operational reports, for operators only: every endpoint requires the internal token
+router = APIRouter(prefix="/health", tags=["health"], dependencies=[Depends(internal_guard)])
+
+@router.get("/db-pool")
+async def get_db_pool_status():
+    """Connection pool report: size, checked-out and overflow connections, checkout wait times"""
+    return db_manager.pool_status()
+
+@router.get("/password-hashing")
+async def get_password_hashing_stats():
+    """Password hashing pool: size, queue limit, calls in flight and calls rejected with 503"""
+    return password_hasher.stats()
+
+@router.get("/caches")
+async def get_cache_stats():
+    """Entry counts and hit/miss counters of the in-process caches, for sizing them"""
+    caches = {"token": token_cache.stats()}
+    if isinstance(cart_cache.backend, LocalCacheBackend):
+        caches["cart"] = cart_cache.backend.stats()
+    return caches
+
+@router.get("/cart-sweeper")
+async def get_cart_sweeper_report():
+    """Settings of the stale cart sweeper and the report of its last in-process run"""
+    return {
+        "ttl": cart_sweeper.ttl,
+        "batch_size": cart_sweeper.batch_size,
+        "interval": settings.CORNU_CART_SWEEP_INTERVAL,
+        "last_report": cart_sweeper.last_report,
+    }
+
+@router.get("/cart-write-behind")
+async def get_cart_write_behind_stats():
+    """Buffered quantity updates waiting for a flush, and flush counters"""
+    return cart_write_behind.stats()
+
+@router.get("/query-profiles")
+async def get_query_profiles():
+    """Statements, timings, call sites and N+1 suspects of the latest requests, 404 unless CORNU_QUERY_PROFILING is on"""
+    if not settings.CORNU_QUERY_PROFILING:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {"profiles": recent_profiles.snapshot()}
@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Depends, Response
+from ..core.metrics import PROMETHEUS_CONTENT_TYPE, metrics
+from ..core.security import internal_guard
+
+# Scraped with the internal token (Prometheus: authorization.credentials)
+router = APIRouter(tags=["metrics"], dependencies=[Depends(internal_guard)])
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint: request, latency, in-flight and database statement metrics"""
+    return Response(metrics.render(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -2,41 +2,35 @@ from app.core.database import db_manager
 from app.schemas.user import UserLogin
 from app.services.user import (
     create_valid_token, 
-    verify_password 
+    verify_password_async 
 )
 from app.services.user import get_user_info
-from app.core.security import csrf_protect
-from app.utils.origin_check import validate_request_origin
+from app.core.security import request_guard
 from datetime import timedelta
-from fastapi import APIRouter, HTTPException, status, Depends, Request, Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, status, Depends, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
-@router.post("/login")
-def login(
+@router.post("/login", dependencies=[Depends(request_guard)])
+async def login(
     user_login: UserLogin, 
-    request: Request,
     response: Response,
-    db: Session = Depends(db_manager.get_db)
+    db: AsyncSession = Depends(db_manager.get_async_db)
 ):
     """User login - requires CSRF protection and origin validation"""
-    # Validate request origin to prevent cross-site attacks
-    validate_request_origin(request)
-    
-    # CSRF protection for state-changing operation
-    csrf_protect.validate_csrf(request)
-    
-    user_info = get_user_info(user_login.username, db)
+    user_info = await db.run_sync(lambda session: get_user_info(user_login.username, session))
     hashed_pwd = user_info.hashed_password if user_info else ''
-    if not user_info or not verify_password(user_login.password, hashed_pwd):
+    # bcrypt runs on the dedicated password executor (503 when saturated)
+    if not user_info or not await verify_password_async(user_login.password, hashed_pwd):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
     # Short-lived access token (15 minutes)
-    access_token = create_valid_token(data={"username": user_info.username}, expires_delta=timedelta(minutes=15))
+    claims = {"username": user_info.username, "id": str(user_info.id)}
+    access_token = create_valid_token(data=claims, expires_delta=timedelta(minutes=15))
     
     # Long-lived refresh token (7 days) stored in HttpOnly cookie
-    refresh_token = create_valid_token(data={"username": user_info.username}, expires_delta=timedelta(days=7))
+    refresh_token = create_valid_token(data=claims, expires_delta=timedelta(days=7))
     
     # Set secure HttpOnly cookie for refresh token
     response.set_cookie(
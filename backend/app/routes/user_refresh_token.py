@@ -1,4 +1,5 @@
 import jwt
+import uuid
 from app.services.user import (
     create_valid_token, 
     validate_access_token, 
@@ -27,15 +28,21 @@ def refresh_access_token(
         if not user_id:
             raise HTTPException(status_code=401, detail="Invalid refresh token payload")
         
+        # Refresh tokens issued before the id claim existed cannot be refreshed: log in again
+        try:
+            claims = {"username": user_id, "id": str(uuid.UUID(str(payload.get("id"))))}
+        except ValueError:
+            raise HTTPException(status_code=401, detail="Invalid refresh token payload")
+        
         # Generate new short-lived access token
         new_access_token = create_valid_token(
-            data={"username": user_id}, 
+            data=claims, 
             expires_delta=timedelta(minutes=15)  
         )
         
         # Generate new refresh token and update cookie
         new_refresh_token = create_valid_token(
-            data={"username": user_id}, 
+            data=claims, 
             expires_delta=timedelta(days=7)
         )
         
@@ -1,28 +1,23 @@
 from app.core.database import db_manager
 from app.schemas.user import UserCreate, UserOut
-from app.services.user import create_user
-from app.core.security import csrf_protect
-from app.utils.origin_check import validate_request_origin
-from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+from app.services.user import create_user, hash_password_async
+from app.core.security import request_guard
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter()
 
-@router.post("/register", response_model=UserOut, status_code=201)
-def register_new_user(
+@router.post("/register", response_model=UserOut, status_code=201, dependencies=[Depends(request_guard)])
+async def register_new_user(
     user_data: UserCreate, 
-    request: Request,
-    db: Session = Depends(db_manager.get_db)
+    db: AsyncSession = Depends(db_manager.get_async_db)
 ):
     """Register new user - requires CSRF protection and origin validation"""
-    # Validate request origin to prevent cross-site attacks
-    validate_request_origin(request)
-    
-    # CSRF protection for state-changing operation
-    csrf_protect.validate_csrf(request)
+    # bcrypt runs on the dedicated password executor (503 when saturated)
+    hashed_pwd = (await hash_password_async(user_data.password)).decode('utf-8')
     
     try:
-        new_user = create_user(db=db, user_data=user_data)
+        new_user = await db.run_sync(create_user, user_data, hashed_pwd)
         return new_user
     except ValueError as e:
         raise HTTPException(
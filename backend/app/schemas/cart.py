@@ -1,20 +1,22 @@
 from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
+from uuid import UUID
 from .cart_item import CartItem
 
 class CartBase(BaseModel):
-    user_id: Optional[str] = None
+    user_id: Optional[UUID] = None
     session_id: Optional[str] = None
 
 class CartCreate(CartBase):
     pass
 
 class Cart(CartBase):
-    id: str
+    id: UUID
     items: List[CartItem] = []
     created_at: datetime
     updated_at: datetime
+    version: int
 
     model_config = {
         "from_attributes": True
@@ -27,4 +29,12 @@ class CartResponse(BaseModel):
     model_config = {
         "from_attributes": True
     }
-    
\ No newline at end of file
+    
+class CartPageResponse(CartResponse):
+    """CartResponse whose items are only the first page, continued through GET /cart/items"""
+    line_count: int
+    next_cursor: Optional[str] = None
+
+class CartSummaryResponse(BaseModel):
+    line_count: int
+    total_items: int
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, field_validator
-from typing import Optional
+from pydantic import BaseModel, Field, field_validator
+from typing import Annotated, List, Literal, Optional, Union
 from datetime import datetime
+from uuid import UUID
 from ..utils.security import InputSanitizer
 
 class CartItemBase(BaseModel):
@@ -35,13 +36,17 @@ class CartItemUpdate(BaseModel):
     price_snapshot: Optional[str] = None
 
 class CartItem(CartItemBase):
-    id: str
-    cart_id: str
+    id: UUID
+    cart_id: UUID
     created_at: datetime
     updated_at: datetime
     model_config = {
         "from_attributes": True
     }
+
+class CartItemPage(BaseModel):
+    items: List[CartItem]
+    next_cursor: Optional[str] = None
     
 # API request model
 class AddToCartRequest(BaseModel):
@@ -79,3 +84,25 @@ class UpdateCartItemRequest(BaseModel):
         if v > 10000:
             raise ValueError("Quantity cannot exceed 10000")
         return v
+
+# Batch API: one request carrying many add / update / remove operations
+MAX_BATCH_OPERATIONS = 200
+
+class BatchAddOperation(AddToCartRequest):
+    op: Literal["add"]
+
+class BatchUpdateOperation(UpdateCartItemRequest):
+    op: Literal["update"]
+    item_id: UUID
+
+class BatchRemoveOperation(BaseModel):
+    op: Literal["remove"]
+    item_id: UUID
+
+CartBatchOperation = Annotated[
+    Union[BatchAddOperation, BatchUpdateOperation, BatchRemoveOperation],
+    Field(discriminator="op")
+]
+
+class CartBatchRequest(BaseModel):
+    operations: List[CartBatchOperation] = Field(min_length=1, max_length=MAX_BATCH_OPERATIONS)
@@ -1,43 +1,167 @@
-from typing import Optional
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_
+import uuid
+from typing import List, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session, aliased, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, delete, func, or_, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.database import dialect_insert, execute_upsert, route_to_owner, shard_for, use_shard
 from ..models.cart import Cart
-from ..models.cart_item import CartItem
+from ..models.cart_item import CartItem, CartItemTransfer
+from ..utils.etag import CartVersion, cart_etag
+from ..utils.pagination import ItemKey
 from datetime import datetime, timezone
 
+class CartVersionConflictError(Exception):
+    """Raised when a mutation's expected cart version is not the current one"""
+
+    def __init__(self, cart_id, current_version: Optional[int]):
+        super().__init__(f"cart {cart_id} is at version {current_version}")
+        self.cart_id = cart_id
+        self.current_version = current_version
+
+class CartPage(NamedTuple):
+    """A cart with only its first page of lines loaded"""
+    cart: Cart
+    line_count: int
+    total_items: int
+    next_key: Optional[ItemKey]
+
+def _owner_filter(user_id=None, session_id=None):
+    if user_id:
+        return Cart.user_id == user_id
+    if session_id:
+        return Cart.session_id == session_id
+    return None
+
+# The cart shown to owners who have none yet is never stored. Its id is derived from the owner
+# and its timestamps are fixed, so its body (and ETag) is the same on every read by one owner,
+# and differs between owners
+_VIRTUAL_CART_NAMESPACE = uuid.UUID("6f1c1d2e-8a43-4b5e-9d0c-3f7a2b9e4c61")
+VIRTUAL_CART_TIMESTAMP = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def virtual_cart_id(user_id=None, session_id=None) -> uuid.UUID:
+    owner = f"user:{user_id}" if user_id else f"session:{session_id}"
+    return uuid.uuid5(_VIRTUAL_CART_NAMESPACE, owner)
+
+def virtual_cart(user_id=None, session_id=None) -> Cart:
+    """Transient empty cart, version 0, for reads by an owner without a cart row.
+
+    Serializes like a stored cart, so reads never have to INSERT; the row is only
+    created by the first mutation.
+    """
+    cart = Cart(
+        id=virtual_cart_id(user_id, session_id),
+        user_id=user_id,
+        session_id=None if user_id else session_id,
+        created_at=VIRTUAL_CART_TIMESTAMP,
+        updated_at=VIRTUAL_CART_TIMESTAMP,
+        version=0
+    )
+    set_committed_value(cart, "items", [])
+    return cart
+
 class CartService:
     
     @staticmethod
     def get_or_create_cart(db: Session, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Cart:
-        """Get or create a cart - one user/session can only have one cart"""
-        cart = None
+        """Get or create a cart - one user/session can only have one cart.
         
+        Race free and at most two statements: INSERT ... ON CONFLICT DO NOTHING RETURNING
+        creates the cart, and only when the owner already has one it is read back.
+        A new cart is at version 0, like the virtual cart, until its first mutation.
+        Only mutations call this, reads use get_cart and fall back to virtual_cart.
+        """
+        route_to_owner(db, user_id, session_id)
         if user_id:
-            # Logged in user: directly find the unique cart for the user with items preloaded
-            cart = db.query(Cart).options(joinedload(Cart.items)).filter(Cart.user_id == user_id).first()
+            owner_column, session_id = Cart.user_id, None
         elif session_id:
-            # Anonymous user: find the unique cart for the session with items preloaded
-            cart = db.query(Cart).options(joinedload(Cart.items)).filter(Cart.session_id == session_id).first()
-            
-        if not cart:
-            # Create a new cart
-            cart = Cart(
-                user_id=user_id,
-                session_id=session_id if not user_id else None
-            )
-            db.add(cart)
-            try:
-                db.commit()
-                db.refresh(cart)
-            except Exception as e:
-                db.rollback()
-                raise e
-            
+            owner_column = Cart.session_id
+        else:
+            raise ValueError("user_id or session_id is required to get a cart")
+        
+        now = datetime.now(timezone.utc)
+        stmt = dialect_insert(db, Cart).values(
+            id=uuid.uuid4(),
+            user_id=user_id,
+            session_id=session_id,
+            created_at=now,
+            updated_at=now,
+            version=0
+        ).on_conflict_do_nothing(index_elements=[owner_column]).returning(Cart)
+        
+        try:
+            cart = execute_upsert(db, stmt).scalars().first()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise e
+        
+        if cart is not None:
+            # Brand new cart, nothing to load
+            set_committed_value(cart, "items", [])
+            return cart
+        
+        # The owner already has a cart (possibly created by a concurrent request)
+        return CartService.get_cart(db, user_id, session_id)
+    
+    @staticmethod
+    def get_or_create_cart_for_write(
+        db: Session,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        now: Optional[datetime] = None,
+        expected_version: Optional[CartVersion] = None
+    ) -> Cart:
+        """The owner's cart, created if needed, with its version bumped: the first write of a mutation transaction.
+
+        One statement, INSERT ... ON CONFLICT (owner) DO UPDATE SET version = version + 1
+        ... RETURNING: a new cart starts at version 1, an existing one is bumped only when
+        it matches expected_version. Raises CartVersionConflictError like bump_version.
+        Items are not loaded and nothing is committed.
+        """
+        route_to_owner(db, user_id, session_id)
+        if user_id:
+            owner_column, owner, session_id = Cart.user_id, user_id, None
+        elif session_id:
+            owner_column, owner = Cart.session_id, session_id
+        else:
+            raise ValueError("user_id or session_id is required to get a cart")
+        
+        now = now or datetime.now(timezone.utc)
+        expected_version = _stored_expectation(expected_version)
+        conditions = []
+        if expected_version is not None:
+            conditions.append(Cart.version == expected_version.version)
+            if expected_version.cart_id is not None:
+                conditions.append(Cart.id == expected_version.cart_id)
+        stmt = dialect_insert(db, Cart).values(
+            id=uuid.uuid4(),
+            user_id=user_id,
+            session_id=session_id,
+            created_at=now,
+            updated_at=now,
+            version=1
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[owner_column],
+            set_={"version": Cart.version + 1, "updated_at": stmt.excluded.updated_at},
+            where=and_(*conditions) if conditions else None
+        ).returning(Cart)
+        
+        cart = execute_upsert(db, stmt, {"populate_existing": True}).scalars().first()
+        if cart is None:
+            # The owner's cart did not match the expectation
+            current = db.execute(select(Cart.id, Cart.version).filter(owner_column == owner)).first()
+            raise CartVersionConflictError(*(current or (virtual_cart_id(user_id, session_id), 0)))
+        if cart.version == 1 and expected_version is not None and expected_version.version > 0:
+            # Created just now: the cart the client expected is gone (merged or swept)
+            raise CartVersionConflictError(virtual_cart_id(user_id, session_id), 0)
         return cart
     
     @staticmethod
     def get_cart(db: Session, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Optional[Cart]:
         """Get cart for user or session with items preloaded"""
+        route_to_owner(db, user_id, session_id)
         if user_id:
             return db.query(Cart).options(joinedload(Cart.items)).filter(Cart.user_id == user_id).first()
         elif session_id:
@@ -45,15 +169,159 @@ class CartService:
         return None
     
     @staticmethod
-    def clear_cart(
+    def get_cart_etag(
+        db: Session,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        page_size: Optional[int] = None,
+        summary: bool = False
+    ) -> Optional[str]:
+        """ETag of the owner's cart (or of the virtual one) from a single lookup on the owner index, items are not loaded.
+
+        With page_size, the ETag of the first-page representation of that size; with summary, the one of the summary.
+        """
+        route_to_owner(db, user_id, session_id)
+        owner_filter = _owner_filter(user_id, session_id)
+        if owner_filter is None:
+            return None
+        row = db.execute(select(Cart.id, Cart.version).filter(owner_filter)).first()
+        if row is None:
+            return cart_etag(virtual_cart_id(user_id, session_id), 0, page_size, summary)
+        return cart_etag(row.id, row.version, page_size, summary)
+    
+    @staticmethod
+    def get_cart_summary(db: Session, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Tuple[int, int]:
+        """(line count, total quantity) of the owner's cart.
+
+        One aggregate SELECT, no CartItem objects are loaded. An owner without a
+        cart gets (0, 0) and no cart is created.
+        """
+        route_to_owner(db, user_id, session_id)
+        owner_filter = _owner_filter(user_id, session_id)
+        if owner_filter is None:
+            return 0, 0
+        line_count, total_items = db.execute(
+            select(func.count(CartItem.id), func.coalesce(func.sum(CartItem.quantity), 0))
+            .select_from(Cart)
+            .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+            .filter(owner_filter)
+        ).one()
+        return line_count, total_items
+    
+    @staticmethod
+    def get_cart_summary_with_etag(
         db: Session,
         user_id: Optional[str] = None,
         session_id: Optional[str] = None
+    ) -> Tuple[str, int, int]:
+        """(summary ETag, line count, total quantity) of the owner's cart, from the same single aggregate SELECT"""
+        route_to_owner(db, user_id, session_id)
+        owner_filter = _owner_filter(user_id, session_id)
+        if owner_filter is None:
+            raise ValueError("user_id or session_id is required to get a cart")
+        row = db.execute(
+            select(Cart.id, Cart.version, func.count(CartItem.id), func.coalesce(func.sum(CartItem.quantity), 0))
+            .select_from(Cart)
+            .outerjoin(CartItem, CartItem.cart_id == Cart.id)
+            .filter(owner_filter)
+            .group_by(Cart.id, Cart.version)
+        ).first()
+        if row is None:
+            return cart_etag(virtual_cart_id(user_id, session_id), 0, summary=True), 0, 0
+        cart_id, version, line_count, total_items = row
+        return cart_etag(cart_id, version, summary=True), line_count, total_items
+    
+    @staticmethod
+    def get_cart_items_page(
+        db: Session,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        limit: int = 100,
+        after: Optional[ItemKey] = None
+    ) -> Tuple[List[CartItem], Optional[ItemKey]]:
+        """One page of the owner's cart lines in (created_at, id) order, and the key to continue after.
+
+        Keyset pagination on the (cart_id, created_at, id) index: every page is a
+        range scan of `limit` rows however deep it is, and lines added meanwhile
+        are neither skipped nor repeated.
+        """
+        route_to_owner(db, user_id, session_id)
+        owner_filter = _owner_filter(user_id, session_id)
+        if owner_filter is None:
+            return [], None
+        stmt = select(CartItem).join(Cart, CartItem.cart_id == Cart.id).filter(owner_filter)
+        if after is not None:
+            stmt = stmt.filter(tuple_(CartItem.created_at, CartItem.id) > tuple_(*after))
+        # One extra row tells whether there is a next page
+        items = list(db.scalars(stmt.order_by(CartItem.created_at, CartItem.id).limit(limit + 1)))
+        if len(items) <= limit:
+            return items, None
+        del items[limit:]
+        return items, (items[-1].created_at, items[-1].id)
+    
+    @staticmethod
+    def get_cart_first_page(
+        db: Session,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        page_size: int = 100
+    ) -> CartPage:
+        """The cart with only its first page of lines loaded, plus the totals - a virtual cart if there is none"""
+        route_to_owner(db, user_id, session_id)
+        owner_filter = _owner_filter(user_id, session_id)
+        cart = db.scalars(select(Cart).filter(owner_filter)).first() if owner_filter is not None else None
+        if cart is None:
+            return CartPage(virtual_cart(user_id, session_id), 0, 0, None)
+        line_count, total_items = CartService.get_cart_summary(db, user_id, session_id)
+        items, next_key = CartService.get_cart_items_page(db, user_id, session_id, page_size)
+        set_committed_value(cart, "items", items)
+        return CartPage(cart, line_count, total_items, next_key)
+    
+    @staticmethod
+    def bump_version(
+        db: Session,
+        cart_id,
+        now: datetime,
+        expected_version: Optional[CartVersion] = None
+    ) -> int:
+        """Increment carts.version (and updated_at) as the first write of a mutation transaction.
+
+        The version check and the increment are one conditional UPDATE, so concurrent
+        writers need no SELECT ... FOR UPDATE: the loser matches no row and gets
+        CartVersionConflictError. A loaded cart is given the new values in place.
+        """
+        expected_version = _stored_expectation(expected_version)
+        stmt = update(Cart).filter(Cart.id == cart_id)
+        version = None
+        if expected_version is not None:
+            stmt = stmt.filter(Cart.version == expected_version.version)
+        # An ETag of another cart (e.g. the anonymous one before a merge) never matches
+        if expected_version is None or expected_version.cart_id in (None, cart_id):
+            version = db.scalar(
+                stmt.values(version=Cart.version + 1, updated_at=now).returning(Cart.version),
+                execution_options={"synchronize_session": False}
+            )
+        if version is None:
+            raise CartVersionConflictError(cart_id, db.scalar(select(Cart.version).filter(Cart.id == cart_id)))
+        
+        cart = db.identity_map.get(Session.identity_key(Cart, cart_id))
+        if cart is not None:
+            set_committed_value(cart, "version", version)
+            set_committed_value(cart, "updated_at", now)
+        return version
+    
+    @staticmethod
+    def clear_cart(
+        db: Session,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
     ) -> bool:
         """clean the cart"""
         cart = CartService.get_cart(db, user_id, session_id)
         if cart:
             try:
+                CartService.bump_version(db, cart.id, datetime.now(timezone.utc), expected_version)
                 db.query(CartItem).filter(CartItem.cart_id == cart.id).delete()
                 db.commit()
                 return True
@@ -64,58 +332,271 @@ class CartService:
     
     @staticmethod
     def merge_carts(db: Session, user_id: str, session_id: str) -> Optional[Cart]:
-        """Merge carts when user logs in - simplified version"""
-        # Get user cart and anonymous cart with items preloaded
-        user_cart = db.query(Cart).options(joinedload(Cart.items)).filter(Cart.user_id == user_id).first()
-        anonymous_cart = db.query(Cart).options(joinedload(Cart.items)).filter(Cart.session_id == session_id).first()
-        
-        if not anonymous_cart:
-            # No anonymous cart, return or create user cart
-            return CartService.get_or_create_cart(db, user_id=user_id)
-            
-        if not user_cart:
-            # User has no cart, directly convert anonymous cart to user cart
-            anonymous_cart.user_id = user_id
-            anonymous_cart.session_id = None
-            anonymous_cart.updated_at = datetime.now(timezone.utc)
-            try:
-                db.commit()
-                db.refresh(anonymous_cart)
-                return anonymous_cart
-            except Exception as e:
-                db.rollback()
-                raise e
+        """Merge carts when user logs in.
 
-        # Both carts exist, merge items into user cart
-        for anonymous_item in anonymous_cart.items:
-            existing_item = db.query(CartItem).filter(
-                and_(
-                    CartItem.cart_id == user_cart.id,
-                    CartItem.product_id == anonymous_item.product_id
+        Set based: the same handful of statements runs in one transaction
+        whether the anonymous cart has 3 lines or 3,000.
+        """
+        user_shard = shard_for(db, user_id=user_id)
+        if user_shard != shard_for(db, session_id=session_id):
+            return CartService._merge_across_shards(db, user_id, session_id)
+        use_shard(db, user_shard)
+        
+        # Find both carts in one round trip, without loading their items
+        owners = db.execute(
+            select(Cart.id, Cart.user_id).filter(or_(Cart.user_id == user_id, Cart.session_id == session_id))
+        ).all()
+        user_cart_id = next((cart_id for cart_id, owner in owners if owner is not None), None)
+        anonymous_cart_id = next((cart_id for cart_id, owner in owners if owner is None), None)
+        
+        if not anonymous_cart_id:
+            # No anonymous cart, nothing to write
+            return CartService.get_cart(db, user_id=user_id) or virtual_cart(user_id=user_id)
+        
+        now = datetime.now(timezone.utc)
+        no_sync = {"synchronize_session": False}
+        try:
+            if not user_cart_id:
+                # User has no cart, directly convert anonymous cart to user cart
+                db.execute(
+                    update(Cart).filter(Cart.id == anonymous_cart_id)
+                    .values(user_id=user_id, session_id=None, updated_at=now, version=Cart.version + 1),
+                    execution_options=no_sync
                 )
-            ).first()
-            
-            if existing_item:
-                # Merge quantities
-                existing_item.quantity += anonymous_item.quantity
-                existing_item.updated_at = datetime.now(timezone.utc)
+                user_cart_id = anonymous_cart_id
             else:
-                # Move item to user cart
-                anonymous_item.cart_id = user_cart.id
+                anonymous_item = aliased(CartItem)
+                user_item = aliased(CartItem)
+                anonymous_products = select(anonymous_item.product_id).filter(anonymous_item.cart_id == anonymous_cart_id)
+                
+                # Products in both carts: add the anonymous quantity to the user line
+                anonymous_quantity = (
+                    select(anonymous_item.quantity)
+                    .filter(anonymous_item.cart_id == anonymous_cart_id, anonymous_item.product_id == CartItem.product_id)
+                    .scalar_subquery()
+                )
+                db.execute(
+                    update(CartItem)
+                    .filter(CartItem.cart_id == user_cart_id, CartItem.product_id.in_(anonymous_products))
+                    .values(quantity=CartItem.quantity + anonymous_quantity, updated_at=now),
+                    execution_options=no_sync
+                )
+                
+                # Products only in the anonymous cart: move the lines over
+                db.execute(
+                    update(CartItem)
+                    .filter(
+                        CartItem.cart_id == anonymous_cart_id,
+                        CartItem.product_id.not_in(select(user_item.product_id).filter(user_item.cart_id == user_cart_id))
+                    )
+                    .values(cart_id=user_cart_id),
+                    execution_options=no_sync
+                )
+                
+                # Delete anonymous cart with its remaining (already merged) lines
+                db.execute(delete(CartItem).filter(CartItem.cart_id == anonymous_cart_id), execution_options=no_sync)
+                db.execute(delete(Cart).filter(Cart.id == anonymous_cart_id), execution_options=no_sync)
+                db.execute(
+                    update(Cart).filter(Cart.id == user_cart_id).values(updated_at=now, version=Cart.version + 1),
+                    execution_options=no_sync
+                )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise e
+        
+        return (
+            db.query(Cart).options(joinedload(Cart.items)).populate_existing()
+            .filter(Cart.id == user_cart_id).first()
+        )
+    
+    @staticmethod
+    def _merge_across_shards(db: Session, user_id: str, session_id: str) -> Cart:
+        """merge_carts when the anonymous cart and the user cart are on different shards.
 
-        # Delete anonymous cart
+        The anonymous lines are upserted into the user cart and committed on the
+        user's shard first, then the anonymous cart is deleted on its own shard, so
+        a failure in between never loses lines: the anonymous cart is still there
+        and the next login merges it again. transfer_cart_lines remembers the lines
+        already added, so that merge does not add their quantities a second time.
+        """
+        user_shard, anonymous_shard = shard_for(db, user_id=user_id), shard_for(db, session_id=session_id)
+        use_shard(db, anonymous_shard)
+        anonymous_cart_id = db.scalar(select(Cart.id).filter(Cart.session_id == session_id))
+        if not anonymous_cart_id:
+            return CartService.get_cart(db, user_id=user_id) or virtual_cart(user_id=user_id)
+        lines = db.execute(
+            select(CartItem.id, CartItem.product_id, CartItem.quantity, CartItem.price_snapshot, CartItem.created_at)
+            .filter(CartItem.cart_id == anonymous_cart_id)
+        ).all()
+        db.rollback()
+        
+        cart = CartService.get_or_create_cart(db, user_id=user_id)
+        now = datetime.now(timezone.utc)
+        try:
+            CartService.bump_version(db, cart.id, now)
+            transfer_cart_lines(db, cart.id, [{**line._asdict(), "updated_at": now} for line in lines])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise e
+        
+        use_shard(db, anonymous_shard)
+        no_sync = {"synchronize_session": False}
         try:
-            db.delete(anonymous_cart)
-            user_cart.updated_at = datetime.now(timezone.utc)
+            db.execute(delete(CartItem).filter(CartItem.cart_id == anonymous_cart_id), execution_options=no_sync)
+            db.execute(delete(Cart).filter(Cart.id == anonymous_cart_id), execution_options=no_sync)
+            db.commit()
+            use_shard(db, user_shard)
+            forget_transferred_lines(db, [line.id for line in lines])
             db.commit()
-            db.refresh(user_cart)
         except Exception as e:
             db.rollback()
             raise e
         
-        return user_cart
+        return (
+            db.query(Cart).options(joinedload(Cart.items)).populate_existing()
+            .filter(Cart.id == cart.id).first()
+        )
     
     @staticmethod
     def get_cart_total_items(cart: Cart) -> int:
         """Calculate the total number of items in the cart"""
         return sum(item.quantity for item in cart.items)
+
+
+def transfer_cart_lines(db: Session, cart_id: uuid.UUID, lines: List[dict]) -> int:
+    """Copy lines of a cart on another database into cart_id, in the caller's transaction; returns lines copied.
+
+    Lines keep their ids, a product already in the cart gets the quantities added up.
+    Each source line is recorded in cart_item_transfers by the same transaction, so
+    running the copy again before the source is deleted skips the lines already added.
+    Call forget_transferred_lines once the source lines are deleted.
+    """
+    if not lines:
+        return 0
+    now = datetime.now(timezone.utc)
+    recorded = set(execute_upsert(
+        db,
+        dialect_insert(db, CartItemTransfer)
+        .values([{"source_item_id": line["id"], "cart_id": cart_id, "created_at": now} for line in lines])
+        .on_conflict_do_nothing(index_elements=[CartItemTransfer.source_item_id])
+        .returning(CartItemTransfer.source_item_id)
+    ).scalars())
+    lines = [line for line in lines if line["id"] in recorded]
+    if lines:
+        stmt = dialect_insert(db, CartItem).values([{**line, "cart_id": cart_id} for line in lines])
+        execute_upsert(db, stmt.on_conflict_do_update(
+            index_elements=[CartItem.cart_id, CartItem.product_id],
+            set_={"quantity": CartItem.quantity + stmt.excluded.quantity, "updated_at": stmt.excluded.updated_at}
+        ))
+    return len(lines)
+
+def forget_transferred_lines(db: Session, source_item_ids: List[uuid.UUID]) -> None:
+    """Drop the transfer records of source lines that are deleted now, in the caller's transaction"""
+    if source_item_ids:
+        db.execute(
+            delete(CartItemTransfer).filter(CartItemTransfer.source_item_id.in_(source_item_ids)),
+            execution_options={"synchronize_session": False}
+        )
+
+def _stored_expectation(expected_version: Optional[CartVersion]) -> Optional[CartVersion]:
+    """A client that saw the virtual cart expects a cart nothing was written to yet: a row at version 0, whatever its id"""
+    if expected_version is not None and expected_version.version == 0:
+        return CartVersion(None, 0)
+    return expected_version
+
+def _with_items(cart: Optional[Cart]) -> Optional[Cart]:
+    """Load cart items while still inside the sync greenlet, so they can be read afterwards"""
+    if cart is not None:
+        cart.items
+    return cart
+
+class AsyncCartService:
+    """Async counterpart of CartService.
+
+    Each call runs the CartService logic through AsyncSession.run_sync, so the queries
+    go over the async driver and never block the event loop.
+    """
+
+    @staticmethod
+    async def get_or_create_cart(db: AsyncSession, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Cart:
+        """Get or create a cart - one user/session can only have one cart"""
+        return await db.run_sync(
+            lambda session: _with_items(CartService.get_or_create_cart(session, user_id, session_id))
+        )
+
+    @staticmethod
+    async def get_cart(db: AsyncSession, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Optional[Cart]:
+        """Get cart for user or session with items preloaded"""
+        return await db.run_sync(
+            lambda session: _with_items(CartService.get_cart(session, user_id, session_id))
+        )
+
+    @staticmethod
+    async def get_cart_etag(
+        db: AsyncSession,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        page_size: Optional[int] = None,
+        summary: bool = False
+    ) -> Optional[str]:
+        """ETag of the owner's cart, without loading its items"""
+        return await db.run_sync(CartService.get_cart_etag, user_id, session_id, page_size, summary)
+
+    @staticmethod
+    async def get_cart_summary(db: AsyncSession, user_id: Optional[str] = None, session_id: Optional[str] = None) -> Tuple[int, int]:
+        """(line count, total quantity) of the owner's cart, from a single aggregate query"""
+        return await db.run_sync(CartService.get_cart_summary, user_id, session_id)
+
+    @staticmethod
+    async def get_cart_summary_with_etag(
+        db: AsyncSession,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None
+    ) -> Tuple[str, int, int]:
+        """(summary ETag, line count, total quantity) of the owner's cart, from a single aggregate query"""
+        return await db.run_sync(CartService.get_cart_summary_with_etag, user_id, session_id)
+
+    @staticmethod
+    async def get_cart_items_page(
+        db: AsyncSession,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        limit: int = 100,
+        after: Optional[ItemKey] = None
+    ) -> Tuple[List[CartItem], Optional[ItemKey]]:
+        """One page of the owner's cart lines in (created_at, id) order, and the key to continue after"""
+        return await db.run_sync(CartService.get_cart_items_page, user_id, session_id, limit, after)
+
+    @staticmethod
+    async def get_cart_first_page(
+        db: AsyncSession,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        page_size: int = 100
+    ) -> CartPage:
+        """The cart with only its first page of lines loaded, plus the totals - a virtual cart if there is none"""
+        return await db.run_sync(CartService.get_cart_first_page, user_id, session_id, page_size)
+
+    @staticmethod
+    async def clear_cart(
+        db: AsyncSession,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
+    ) -> bool:
+        """clean the cart"""
+        return await db.run_sync(CartService.clear_cart, user_id, session_id, expected_version)
+
+    @staticmethod
+    async def merge_carts(db: AsyncSession, user_id: str, session_id: str) -> Optional[Cart]:
+        """Merge carts when user logs in"""
+        return await db.run_sync(
+            lambda session: _with_items(CartService.merge_carts(session, user_id, session_id))
+        )
+
+    @staticmethod
+    def get_cart_total_items(cart: Cart) -> int:
+        """Calculate the total number of items in the cart"""
+        return CartService.get_cart_total_items(cart)
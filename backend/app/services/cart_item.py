@@ -1,67 +1,94 @@
-from typing import Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+import uuid
+from typing import List, Optional
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..core.database import dialect_insert, execute_upsert, route_to_owner
 from ..models.cart import Cart
 from ..models.cart_item import CartItem
-from ..schemas.cart_item import AddToCartRequest, UpdateCartItemRequest
+from .cart import CartService
+from ..utils.etag import CartVersion
+from ..schemas.cart_item import AddToCartRequest, CartBatchOperation, UpdateCartItemRequest
 from datetime import datetime, timezone
 
+class CartItemNotFoundError(LookupError):
+    """Raised when operations reference cart lines that are not in the cart"""
+
+    def __init__(self, item_ids):
+        super().__init__(f"cart items not found: {', '.join(str(item_id) for item_id in item_ids)}")
+        self.item_ids = item_ids
+
 class CartItemService:
     
     @staticmethod
     def add_item_to_cart(
         db: Session, 
-        cart: Cart, 
-        request: AddToCartRequest
+        request: AddToCartRequest,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
     ) -> CartItem:
-        """Add item to cart"""
-        # Check if the same product already exists
-        existing_item = db.query(CartItem).filter(
-            and_(
-                CartItem.cart_id == cart.id,
-                CartItem.product_id == request.product_id
-            )
-        ).first()
-        
-        if existing_item:
-            # Update quantity
-            existing_item.quantity += request.quantity
-            existing_item.updated_at = datetime.now(timezone.utc)
-            if request.price_snapshot:
-                existing_item.price_snapshot = request.price_snapshot
-            try:
-                db.commit()
-                db.refresh(existing_item)
-                return existing_item
-            except Exception as e:
-                db.rollback()
-                raise e
-        else:
-            # Create new cart item
-            cart_item = CartItem(
+        """Add item to the owner's cart, created if needed.
+
+        At most three statements, none of them a read before the write: the cart upsert
+        that also bumps its version, the line upsert (INSERT ... ON CONFLICT DO UPDATE
+        ... RETURNING), and the read of the cart's lines for the response, skipped for a
+        cart that had none. The returned line's cart has its items loaded.
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            cart = CartService.get_or_create_cart_for_write(db, user_id, session_id, now, expected_version)
+            stmt = dialect_insert(db, CartItem).values(
+                id=uuid.uuid4(),
                 cart_id=cart.id,
                 product_id=request.product_id,
                 quantity=request.quantity,
-                price_snapshot=request.price_snapshot
+                price_snapshot=request.price_snapshot,
+                created_at=now,
+                updated_at=now
             )
-            db.add(cart_item)
-            try:
-                db.commit()
-                db.refresh(cart_item)
-                return cart_item
-            except Exception as e:
-                db.rollback()
-                raise e
+            # Same product already in the cart: add up quantities, keep the old price unless a new one is given
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CartItem.cart_id, CartItem.product_id],
+                set_={
+                    "quantity": CartItem.quantity + stmt.excluded.quantity,
+                    "price_snapshot": func.coalesce(stmt.excluded.price_snapshot, CartItem.price_snapshot),
+                    "updated_at": stmt.excluded.updated_at,
+                }
+            ).returning(CartItem)
+            # populate_existing: an already loaded line gets the new quantity in place
+            cart_item = execute_upsert(db, stmt, {"populate_existing": True}).scalars().one()
+            if cart.version == 1:
+                # First mutation of the cart: this is its only line
+                items = [cart_item]
+            else:
+                items = db.scalars(
+                    select(CartItem).filter(CartItem.cart_id == cart.id)
+                    .order_by(CartItem.created_at, CartItem.id)
+                ).all()
+            set_committed_value(cart, "items", list(items))
+            set_committed_value(cart_item, "cart", cart)
+            db.commit()
+            return cart_item
+        except Exception as e:
+            db.rollback()
+            raise e
     
     @staticmethod
     def update_cart_item(
         db: Session,
-        cart_item_id: str,
+        cart_item_id: uuid.UUID,
         request: UpdateCartItemRequest,
         user_id: Optional[str] = None,
-        session_id: Optional[str] = None
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
     ) -> Optional[CartItem]:
-        """Update cart item"""
+        """Update cart item, None when a quantity of 0 or less deleted it.
+
+        Raises CartItemNotFoundError when the line is not in the owner's cart.
+        """
+        route_to_owner(db, user_id, session_id)
         # Build query conditions - simplified version
         query = db.query(CartItem).join(Cart).filter(CartItem.id == cart_item_id)
         
@@ -70,15 +97,17 @@ class CartItemService:
         elif session_id:
             query = query.filter(Cart.session_id == session_id)
         else:
-            return None
+            raise CartItemNotFoundError([cart_item_id])
             
         cart_item = query.first()
         if not cart_item:
-            return None
+            raise CartItemNotFoundError([cart_item_id])
             
+        now = datetime.now(timezone.utc)
         if request.quantity <= 0:
             # Delete item when quantity is 0 or negative
             try:
+                CartService.bump_version(db, cart_item.cart_id, now, expected_version)
                 db.delete(cart_item)
                 db.commit()
                 return None
@@ -86,9 +115,10 @@ class CartItemService:
                 db.rollback()
                 raise e
         else:
-            cart_item.quantity = request.quantity
-            cart_item.updated_at = datetime.now(timezone.utc)
             try:
+                CartService.bump_version(db, cart_item.cart_id, now, expected_version)
+                cart_item.quantity = request.quantity
+                cart_item.updated_at = now
                 db.commit()
                 return cart_item
             except Exception as e:
@@ -98,11 +128,13 @@ class CartItemService:
     @staticmethod
     def remove_cart_item(
         db: Session,
-        cart_item_id: str,
+        cart_item_id: uuid.UUID,
         user_id: Optional[str] = None,
-        session_id: Optional[str] = None
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
     ) -> bool:
         """Remove item from cart"""
+        route_to_owner(db, user_id, session_id)
         query = db.query(CartItem).join(Cart).filter(CartItem.id == cart_item_id)
         
         if user_id:
@@ -115,6 +147,7 @@ class CartItemService:
         cart_item = query.first()
         if cart_item:
             try:
+                CartService.bump_version(db, cart_item.cart_id, datetime.now(timezone.utc), expected_version)
                 db.delete(cart_item)
                 db.commit()
                 return True
@@ -122,3 +155,142 @@ class CartItemService:
                 db.rollback()
                 raise e
         return False
+
+    
+    @staticmethod
+    def apply_batch(
+        db: Session,
+        operations: List[CartBatchOperation],
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
+    ) -> Cart:
+        """Apply a batch of add / update / remove operations to the owner's cart, created if needed, in one transaction.
+
+        The cart upsert that checks expected_version and bumps the version comes first,
+        then the lines are checked and written in the same transaction. Updates and
+        removes address the lines as they were before the batch (a later operation on
+        the same line wins), adds are upserted last. Raises CartItemNotFoundError,
+        without changing anything, if a line is not in the cart.
+        """
+        quantities = {}  # item_id -> new quantity, 0 removes the line
+        additions = {}   # product_id -> insert values, quantities summed per product
+        for operation in operations:
+            if operation.op == "add":
+                addition = additions.setdefault(operation.product_id, {"quantity": 0, "price_snapshot": None})
+                addition["quantity"] += operation.quantity
+                addition["price_snapshot"] = operation.price_snapshot or addition["price_snapshot"]
+            else:
+                quantities[operation.item_id] = operation.quantity if operation.op == "update" else 0
+        
+        now = datetime.now(timezone.utc)
+        updates = [
+            {"id": item_id, "quantity": quantity, "updated_at": now}
+            for item_id, quantity in quantities.items() if quantity > 0
+        ]
+        removals = [item_id for item_id, quantity in quantities.items() if quantity <= 0]
+        
+        try:
+            cart = CartService.get_or_create_cart_for_write(db, user_id, session_id, now, expected_version)
+            if quantities:
+                line_ids = set(db.scalars(
+                    select(CartItem.id).filter(CartItem.cart_id == cart.id, CartItem.id.in_(quantities))
+                ))
+                missing = [item_id for item_id in quantities if item_id not in line_ids]
+                if missing:
+                    raise CartItemNotFoundError(missing)
+            if updates:
+                # ORM bulk UPDATE by primary key, a single executemany, restricted to this cart's lines;
+                # loaded lines are refreshed by the reload below
+                db.execute(
+                    update(CartItem).where(CartItem.cart_id == cart.id), updates,
+                    execution_options={"synchronize_session": None}
+                )
+            if removals:
+                db.execute(
+                    delete(CartItem).filter(CartItem.cart_id == cart.id, CartItem.id.in_(removals)),
+                    execution_options={"synchronize_session": False}
+                )
+            if additions:
+                stmt = dialect_insert(db, CartItem).values([
+                    {
+                        "id": uuid.uuid4(),
+                        "cart_id": cart.id,
+                        "product_id": product_id,
+                        "quantity": addition["quantity"],
+                        "price_snapshot": addition["price_snapshot"],
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for product_id, addition in additions.items()
+                ])
+                execute_upsert(db, stmt.on_conflict_do_update(
+                    index_elements=[CartItem.cart_id, CartItem.product_id],
+                    set_={
+                        "quantity": CartItem.quantity + stmt.excluded.quantity,
+                        "price_snapshot": func.coalesce(stmt.excluded.price_snapshot, CartItem.price_snapshot),
+                        "updated_at": stmt.excluded.updated_at,
+                    }
+                ))
+            
+            # Reload the lines once for the response
+            cart = (
+                db.query(Cart).options(joinedload(Cart.items)).populate_existing()
+                .filter(Cart.id == cart.id).one()
+            )
+            db.commit()
+            return cart
+        except Exception as e:
+            db.rollback()
+            raise e
+
+class AsyncCartItemService:
+    """Async counterpart of CartItemService, running its logic through AsyncSession.run_sync"""
+
+    @staticmethod
+    async def add_item_to_cart(
+        db: AsyncSession,
+        request: AddToCartRequest,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
+    ) -> CartItem:
+        """Add item to the owner's cart, created if needed"""
+        return await db.run_sync(CartItemService.add_item_to_cart, request, user_id, session_id, expected_version)
+
+    @staticmethod
+    async def update_cart_item(
+        db: AsyncSession,
+        cart_item_id: uuid.UUID,
+        request: UpdateCartItemRequest,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
+    ) -> Optional[CartItem]:
+        """Update cart item"""
+        return await db.run_sync(
+            CartItemService.update_cart_item, cart_item_id, request, user_id, session_id, expected_version
+        )
+
+    @staticmethod
+    async def remove_cart_item(
+        db: AsyncSession,
+        cart_item_id: uuid.UUID,
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
+    ) -> bool:
+        """Remove item from cart"""
+        return await db.run_sync(CartItemService.remove_cart_item, cart_item_id, user_id, session_id, expected_version)
+
+    
+    @staticmethod
+    async def apply_batch(
+        db: AsyncSession,
+        operations: List[CartBatchOperation],
+        user_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        expected_version: Optional[CartVersion] = None
+    ) -> Cart:
+        """Apply a batch of add / update / remove operations to the owner's cart in one transaction"""
+        return await db.run_sync(CartItemService.apply_batch, operations, user_id, session_id, expected_version)
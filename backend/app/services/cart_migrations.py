@@ -0,0 +1,80 @@
+# Brings cart tables created by an earlier API version up to the current models
+from typing import List
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from ..models.cart import Cart
+from ..models.cart_item import CartItem
+
+# carts.version (optimistic concurrency, If-Match) is NOT NULL: existing carts start at version 1,
+# the server default of the column
+ADD_VERSION_COLUMN = "ALTER TABLE carts ADD COLUMN version INTEGER NOT NULL DEFAULT 1"
+
+# Lines of one product in one cart, before ux_cart_items_cart_product made them impossible:
+# the oldest line (created_at, then id) is kept with the quantities added up and the most
+# recent price given, like the add-to-cart upsert would have done; the others are deleted
+_SAME_PRODUCT = "other.cart_id = cart_items.cart_id AND other.product_id = cart_items.product_id"
+_IS_OLDEST = f"""NOT EXISTS (
+    SELECT 1 FROM cart_items AS other WHERE {_SAME_PRODUCT} AND (
+        other.created_at < cart_items.created_at
+        OR (other.created_at = cart_items.created_at AND other.id < cart_items.id)
+    )
+)"""
+MERGE_DUPLICATE_LINES = f"""
+UPDATE cart_items SET
+    quantity = (SELECT sum(other.quantity) FROM cart_items AS other WHERE {_SAME_PRODUCT}),
+    price_snapshot = coalesce((
+        SELECT other.price_snapshot FROM cart_items AS other
+        WHERE {_SAME_PRODUCT} AND other.price_snapshot IS NOT NULL
+        ORDER BY other.created_at DESC, other.id DESC LIMIT 1
+    ), price_snapshot),
+    updated_at = (SELECT max(other.updated_at) FROM cart_items AS other WHERE {_SAME_PRODUCT})
+WHERE {_IS_OLDEST} AND EXISTS (SELECT 1 FROM cart_items AS other WHERE {_SAME_PRODUCT} AND other.id <> cart_items.id)
+"""
+DELETE_DUPLICATE_LINES = f"DELETE FROM cart_items WHERE NOT {_IS_OLDEST}"
+
+def _index(table, name):
+    return next(index for index in table.indexes if index.name == name)
+
+def _create_missing_index(connection: Connection, table, name) -> str:
+    if name in {index["name"] for index in inspect(connection).get_indexes(table.name)}:
+        return f"{name} already present"
+    _index(table, name).create(connection)
+    return f"{name} created"
+
+def add_version_column(connection: Connection) -> str:
+    if "version" in {column["name"] for column in inspect(connection).get_columns("carts")}:
+        return "carts.version already present"
+    connection.execute(text(ADD_VERSION_COLUMN))
+    return "carts.version added"
+
+def add_cart_product_unique_index(connection: Connection) -> str:
+    """The conflict target of the add-to-cart upsert: duplicate lines are merged first"""
+    if "ux_cart_items_cart_product" in {index["name"] for index in inspect(connection).get_indexes("cart_items")}:
+        return "ux_cart_items_cart_product already present"
+    connection.execute(text(MERGE_DUPLICATE_LINES))
+    merged = connection.execute(text(DELETE_DUPLICATE_LINES)).rowcount
+    _index(CartItem.__table__, "ux_cart_items_cart_product").create(connection)
+    return f"ux_cart_items_cart_product created ({merged} duplicate cart lines merged)"
+
+def add_cart_items_keyset_index(connection: Connection) -> str:
+    """Keyset pagination of a cart's lines in (created_at, id) order"""
+    return _create_missing_index(connection, CartItem.__table__, "ix_cart_items_cart_created_id")
+
+def add_stale_session_carts_index(connection: Connection) -> str:
+    """Partial index (WHERE session_id IS NOT NULL) the sweeper finds stale anonymous carts with"""
+    return _create_missing_index(connection, Cart.__table__, "ix_carts_session_updated_at")
+
+# In order, each one checks what is already there: running them again changes nothing
+CART_MIGRATIONS = [
+    add_version_column, add_cart_product_unique_index, add_cart_items_keyset_index, add_stale_session_carts_index
+]
+
+def migrate_cart_tables(engine) -> List[str]:
+    """Run the cart migrations on one database (the primary or a shard), each in its own transaction"""
+    if not inspect(engine).has_table(Cart.__tablename__):
+        return ["no carts table, skipped"]
+    messages = []
+    for migration in CART_MIGRATIONS:
+        with engine.begin() as connection:
+            messages.append(migration(connection))
+    return messages
@@ -0,0 +1,150 @@
+# Moves carts to the shard their owner hashes to, after CORNU_DB_SHARD_URLS changed
+import time
+from typing import Dict, Sequence
+from sqlalchemy import create_engine, delete, inspect, select, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from ..core.database import create_shard_tables, owner_key, pool_options, shard_index
+from ..models.cart import Cart
+from ..models.cart_item import CartItem
+from .cart import forget_transferred_lines, transfer_cart_lines
+
+class RebalanceReport:
+    """What one rebalancing run scanned and moved"""
+
+    def __init__(self):
+        self.carts_scanned = 0
+        self.carts_moved = 0
+        self.carts_merged = 0
+        self.items_moved = 0
+        self.started = time.perf_counter()
+
+    def snapshot(self) -> dict:
+        return {
+            "carts_scanned": self.carts_scanned,
+            "carts_moved": self.carts_moved,
+            "carts_merged": self.carts_merged,
+            "items_moved": self.items_moved,
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+        }
+
+class ShardRebalancer:
+    """Moves every cart (with its lines) to the shard of its owner under `target_urls`.
+
+    Used to backfill the shards from the unsharded primary, and after adding or
+    removing shards. Sources are scanned in cart id order, batch_size carts per
+    transaction; a source that is also a target keeps the carts that belong to it.
+
+    Each cart is written and committed on its target before it is deleted from
+    its source, so an interrupted run loses nothing and can simply be run again:
+    lines already merged into a target cart are recorded there and not added twice.
+    The application routes by the new shard list as soon as it is deployed: an
+    owner who writes before their cart was moved gets a new cart on the target,
+    and the old cart's lines are then merged into it (quantities added up).
+    """
+
+    def __init__(self, source_urls: Sequence[str], target_urls: Sequence[str], batch_size: int = 500):
+        if not target_urls:
+            raise ValueError("at least one target shard is required")
+        self._engines: Dict[str, object] = {}
+        self.targets = [self._engine(url) for url in target_urls]
+        self.sources = [self._engine(url) for url in dict.fromkeys(source_urls)]
+        self.batch_size = batch_size
+
+    def _engine(self, db_url: str):
+        key = make_url(db_url).render_as_string(hide_password=False)
+        if key not in self._engines:
+            self._engines[key] = create_engine(db_url, **pool_options(db_url))
+        return self._engines[key]
+
+    def target_for(self, user_id=None, session_id=None):
+        return self.targets[shard_index(owner_key(user_id, session_id), len(self.targets))]
+
+    def run(self, dry_run: bool = False) -> RebalanceReport:
+        report = RebalanceReport()
+        if not dry_run:
+            for target in self.targets:
+                create_shard_tables(target)
+        for source in self.sources:
+            # A brand new shard (left empty by a dry run) has nothing to give
+            if inspect(source).has_table(Cart.__tablename__):
+                self.rebalance_source(source, report, dry_run)
+        return report
+
+    def rebalance_source(self, source, report: RebalanceReport, dry_run: bool = False) -> None:
+        cart_table = Cart.__table__
+        last_id = None
+        while True:
+            with Session(source) as src:
+                stmt = select(cart_table).order_by(cart_table.c.id).limit(self.batch_size)
+                if last_id is not None:
+                    stmt = stmt.filter(cart_table.c.id > last_id)
+                carts = src.execute(stmt).mappings().all()
+            if not carts:
+                return
+            last_id = carts[-1]["id"]
+            report.carts_scanned += len(carts)
+            for cart in carts:
+                target = self.target_for(cart["user_id"], cart["session_id"])
+                if target is source:
+                    continue
+                if dry_run:
+                    report.carts_moved += 1
+                    continue
+                self.move_cart(source, target, cart, report)
+
+    @staticmethod
+    def move_cart(source, target, cart: dict, report: RebalanceReport) -> None:
+        """Copy one cart and its lines to `target`, then delete them from `source`"""
+        item_table = CartItem.__table__
+        with Session(source) as src:
+            lines = [dict(line) for line in src.execute(
+                select(item_table).filter(item_table.c.cart_id == cart["id"])
+            ).mappings()]
+        source_line_ids = [line["id"] for line in lines]
+
+        owner_column = Cart.user_id if cart["user_id"] else Cart.session_id
+        owner = cart["user_id"] or cart["session_id"]
+        with Session(target) as dst:
+            try:
+                existing_id = dst.scalar(select(Cart.id).filter(owner_column == owner))
+                if existing_id == cart["id"]:
+                    # Copied by an interrupted earlier run, only the delete below is left
+                    cart_id, lines = existing_id, []
+                elif existing_id is None:
+                    dst.execute(Cart.__table__.insert().values(**cart))
+                    cart_id = cart["id"]
+                else:
+                    # The owner already made a new cart on the target: merge into it
+                    cart_id = existing_id
+                    dst.execute(
+                        update(Cart).filter(Cart.id == cart_id).values(version=Cart.version + 1),
+                        execution_options={"synchronize_session": False}
+                    )
+                    report.carts_merged += 1
+                copied = transfer_cart_lines(dst, cart_id, lines)
+                dst.commit()
+            except Exception as e:
+                dst.rollback()
+                raise e
+
+        with Session(source) as src:
+            try:
+                no_sync = {"synchronize_session": False}
+                src.execute(delete(CartItem).filter(CartItem.cart_id == cart["id"]), execution_options=no_sync)
+                src.execute(delete(Cart).filter(Cart.id == cart["id"]), execution_options=no_sync)
+                src.commit()
+            except Exception as e:
+                src.rollback()
+                raise e
+
+        with Session(target) as dst:
+            forget_transferred_lines(dst, source_line_ids)
+            dst.commit()
+
+        report.carts_moved += 1
+        report.items_moved += copied
+
+    def dispose(self) -> None:
+        for engine in self._engines.values():
+            engine.dispose()
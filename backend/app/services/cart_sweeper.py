@@ -0,0 +1,116 @@
+# Deletes anonymous (session) carts nobody has touched for CORNU_CART_SWEEP_TTL seconds
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Tuple
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from ..core.config import settings
+from ..core.database import db_manager, shard_ids, use_shard
+from ..models.cart import Cart
+from ..models.cart_item import CartItem
+
+logger = logging.getLogger(__name__)
+
+class SweepReport:
+    """Rows removed and per-batch latency of one sweep"""
+
+    def __init__(self):
+        self.batches = 0
+        self.carts_removed = 0
+        self.items_removed = 0
+        self.batch_seconds = []
+
+    def record_batch(self, carts: int, items: int, seconds: float) -> None:
+        self.batches += 1
+        self.carts_removed += carts
+        self.items_removed += items
+        self.batch_seconds.append(seconds)
+
+    def snapshot(self) -> dict:
+        total = sum(self.batch_seconds, 0.0)
+        return {
+            "batches": self.batches,
+            "carts_removed": self.carts_removed,
+            "items_removed": self.items_removed,
+            "batch_ms_avg": round(total / self.batches * 1000, 3) if self.batches else 0.0,
+            "batch_ms_max": round(max(self.batch_seconds, default=0.0) * 1000, 3),
+            "total_ms": round(total * 1000, 3),
+        }
+
+class CartSweeper:
+    """Deletes stale session carts in bounded batches.
+
+    Every batch is its own short transaction: at most batch_size cart rows are
+    locked with FOR UPDATE SKIP LOCKED (found through the partial index on
+    carts.updated_at), their lines and the carts are deleted, and it commits.
+    Carts a request is working on are skipped rather than waited for, and
+    several sweepers (one per API worker, plus the CLI) can run side by side.
+    User carts are never swept.
+    """
+
+    def __init__(
+        self,
+        session_scope=db_manager.session_scope,
+        ttl: int = settings.CORNU_CART_SWEEP_TTL,
+        batch_size: int = settings.CORNU_CART_SWEEP_BATCH_SIZE
+    ):
+        self.session_scope = session_scope
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self.last_report: Optional[dict] = None
+
+    def sweep_batch(self, db: Session, cutoff: datetime) -> Tuple[int, int]:
+        """Delete up to batch_size session carts last updated before cutoff, returns (carts, items) removed"""
+        cart_ids = db.scalars(
+            select(Cart.id)
+            .filter(Cart.session_id.is_not(None), Cart.updated_at < cutoff)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not cart_ids:
+            db.rollback()
+            return 0, 0
+
+        no_sync = {"synchronize_session": False}
+        try:
+            items = db.execute(delete(CartItem).filter(CartItem.cart_id.in_(cart_ids)), execution_options=no_sync).rowcount
+            carts = db.execute(delete(Cart).filter(Cart.id.in_(cart_ids)), execution_options=no_sync).rowcount
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise e
+
+        return carts, items
+
+    def run(self, now: Optional[datetime] = None) -> SweepReport:
+        """Sweep batch after batch until a batch comes back short, on every cart shard in turn"""
+        now = now or datetime.now(timezone.utc)
+        # carts.updated_at is a naive UTC timestamp
+        cutoff = (now - timedelta(seconds=self.ttl)).astimezone(timezone.utc).replace(tzinfo=None)
+        report = SweepReport()
+        with self.session_scope() as db:
+            for shard in shard_ids(db):
+                use_shard(db, shard)
+                while True:
+                    started = time.perf_counter()
+                    carts, items = self.sweep_batch(db, cutoff)
+                    if carts:
+                        report.record_batch(carts, items, time.perf_counter() - started)
+                    if carts < self.batch_size:
+                        break
+        self.last_report = report.snapshot()
+        return report
+
+    async def run_periodically(self, interval: int) -> None:
+        """In-process sweeping: runs the sweep in a worker thread every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                report = await asyncio.to_thread(self.run)
+                logger.info("cart sweep: %s", report.snapshot())
+            except Exception:
+                logger.exception("cart sweep failed")
+
+cart_sweeper = CartSweeper()
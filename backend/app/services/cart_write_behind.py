@@ -0,0 +1,253 @@
+"""Write-behind buffer for cart item quantity updates.
+
+With CORNU_CART_WRITE_BEHIND on, PUT /cart/items/{item_id} no longer commits per
+request: the latest quantity per item is kept in an in-process buffer, the client
+is answered at once with the projected cart, and a background task writes the
+coalesced quantities every CORNU_CART_WRITE_BEHIND_FLUSH_MS milliseconds, or as
+soon as CORNU_CART_WRITE_BEHIND_MAX_PENDING items are buffered. Ten clicks on a
+quantity stepper become one UPDATE.
+
+What is buffered, and what is not:
+- only quantity changes to a positive value without an If-Match / expected_version
+  precondition; deletes and conditional updates take the synchronous path
+- every other mutation of a cart (add, batch, remove, clear, merge, conditional
+  update) first flushes that owner's buffered quantities, so writes apply in order
+- GET /cart and the summary show buffered quantities (without ETag, not cached);
+  the paginated listings and page mode flush the owner's entries first
+
+Crash safety:
+- the buffer lives in process memory. An acknowledged update is durable once the
+  next flush commits; if the process dies before that (SIGKILL, OOM, host loss),
+  the updates of at most the last flush interval are lost, and the cart keeps the
+  previously stored quantities. Nothing is ever written twice or half-written:
+  each flush is one transaction.
+- a graceful shutdown (SIGTERM, the app lifespan ending) stops the flusher and
+  writes everything still buffered before the process exits.
+- flushes run one at a time (the periodic one, an owner's, the shutdown one), so
+  an older quantity drained by one flush can never be committed after a newer one
+  written by another.
+- a failed flush puts its entries back unless a newer quantity for the item has
+  been buffered since, and is retried on the next interval.
+- a flush bumps the version of every cart it writes, once, so If-Match tokens
+  taken before it fail with 412 as for any other mutation.
+- each worker process has its own buffer. Run a single worker, or route a cart's
+  requests to one worker, when two workers could step the same item at once.
+"""
+import asyncio
+import logging
+import threading
+import uuid
+from contextlib import suppress
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Set
+from fastapi import Depends, Request
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from ..core.config import settings
+from ..core.database import db_manager, shard_for, use_shard
+from ..core.redis import CartCache
+from ..models.cart import Cart
+from ..models.cart_item import CartItem
+from .user import get_current_user_optional, get_user_id
+
+logger = logging.getLogger(__name__)
+
+class PendingQuantity(NamedTuple):
+    cart_id: uuid.UUID
+    item_id: uuid.UUID
+    quantity: int
+    updated_at: datetime
+    user_id: Optional[uuid.UUID]
+    session_id: Optional[str]
+
+class QuantityBuffer:
+    """Latest pending quantity per cart item, also indexed by cart owner. Thread safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: Dict[uuid.UUID, PendingQuantity] = {}
+        self._by_owner: Dict[str, Set[uuid.UUID]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _add(self, entry: PendingQuantity) -> None:
+        self._pending[entry.item_id] = entry
+        self._by_owner.setdefault(CartCache.key(entry.user_id, entry.session_id), set()).add(entry.item_id)
+
+    def put(self, entry: PendingQuantity) -> int:
+        """Buffer an entry, replacing an older one for the same item; returns the buffer size"""
+        with self._lock:
+            self._add(entry)
+            return len(self._pending)
+
+    def restore(self, entries: List[PendingQuantity]) -> None:
+        """Put back the entries of a failed flush, unless the item got a newer quantity since"""
+        with self._lock:
+            for entry in entries:
+                if entry.item_id not in self._pending:
+                    self._add(entry)
+
+    def for_owner(self, user_id=None, session_id=None) -> Dict[uuid.UUID, PendingQuantity]:
+        with self._lock:
+            item_ids = self._by_owner.get(CartCache.key(user_id, session_id), ())
+            return {item_id: self._pending[item_id] for item_id in item_ids}
+
+    def drain(self, user_id=None, session_id=None) -> List[PendingQuantity]:
+        """Take out every pending entry, or only those of one owner"""
+        with self._lock:
+            if user_id is None and session_id is None:
+                entries = list(self._pending.values())
+                self._pending.clear()
+                self._by_owner.clear()
+                return entries
+            item_ids = self._by_owner.pop(CartCache.key(user_id, session_id), ())
+            return [self._pending.pop(item_id) for item_id in item_ids]
+
+class CartWriteBehind:
+    """Buffers quantity updates and flushes them in coalesced transactions, see the module docstring"""
+
+    def __init__(
+        self,
+        enabled: bool = settings.CORNU_CART_WRITE_BEHIND,
+        flush_interval: float = settings.CORNU_CART_WRITE_BEHIND_FLUSH_MS / 1000,
+        max_pending: int = settings.CORNU_CART_WRITE_BEHIND_MAX_PENDING,
+        session_scope=db_manager.session_scope
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.session_scope = session_scope
+        self.buffer = QuantityBuffer()
+        # Held from drain to commit (or restore): flushes write in the order they drained
+        self._flush_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.updates_buffered = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def has_pending(self, user_id=None, session_id=None) -> bool:
+        return self.enabled and bool(self.buffer.for_owner(user_id, session_id))
+
+    def submit(self, cart: Cart, item_id: uuid.UUID, quantity: int, user_id=None, session_id=None) -> None:
+        """Buffer a new quantity for a line of `cart`, the caller has checked the line is in it"""
+        size = self.buffer.put(
+            PendingQuantity(cart.id, item_id, quantity, datetime.now(timezone.utc), user_id, session_id)
+        )
+        self.updates_buffered += 1
+        if size >= self.max_pending and self._wakeup is not None:
+            self._wakeup.set()
+
+    def project(self, cart: Cart, user_id=None, session_id=None) -> Cart:
+        """Show the owner's buffered quantities on a loaded cart, without making the session dirty"""
+        pending = self.buffer.for_owner(user_id, session_id)
+        for item in cart.items:
+            entry = pending.get(item.id)
+            if entry is not None:
+                set_committed_value(item, "quantity", entry.quantity)
+                set_committed_value(item, "updated_at", entry.updated_at)
+        return cart
+
+    def flush(self, user_id=None, session_id=None) -> int:
+        """Write every buffered quantity (or one owner's) in one transaction, returns rows written.
+
+        Waits for a flush already running, see the module docstring.
+        """
+        with self._flush_lock:
+            entries = self.buffer.drain(user_id, session_id)
+            if not entries:
+                return 0
+            try:
+                with self.session_scope() as db:
+                    written = self._write(db, entries)
+            except Exception as e:
+                self.buffer.restore(entries)
+                raise e
+
+            self.flushes += 1
+            self.rows_written += written
+            return written
+
+    @staticmethod
+    def _write(db: Session, entries: List[PendingQuantity]) -> int:
+        # Sharded cart storage: each shard's entries go to that shard, committed together at the end
+        by_shard: Dict[Optional[int], List[PendingQuantity]] = {}
+        for entry in entries:
+            by_shard.setdefault(shard_for(db, entry.user_id, entry.session_id), []).append(entry)
+        written = 0
+        try:
+            for shard, shard_entries in by_shard.items():
+                use_shard(db, shard)
+                written += CartWriteBehind._write_shard(db, shard_entries)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise e
+        return written
+
+    @staticmethod
+    def _write_shard(db: Session, entries: List[PendingQuantity]) -> int:
+        # Lines removed (or carts swept) since they were buffered are skipped
+        live = dict(db.execute(
+            select(CartItem.id, CartItem.cart_id).filter(CartItem.id.in_([entry.item_id for entry in entries]))
+        ).all())
+        entries = [entry for entry in entries if live.get(entry.item_id) == entry.cart_id]
+        if not entries:
+            return 0
+
+        db.execute(
+            update(Cart).filter(Cart.id.in_({entry.cart_id for entry in entries}))
+            .values(version=Cart.version + 1, updated_at=datetime.now(timezone.utc)),
+            execution_options={"synchronize_session": False}
+        )
+        # ORM bulk UPDATE by primary key: a single executemany
+        db.execute(update(CartItem), [
+            {"id": entry.item_id, "quantity": entry.quantity, "updated_at": entry.updated_at}
+            for entry in entries
+        ])
+        return len(entries)
+
+    async def flush_owner(self, user_id=None, session_id=None) -> None:
+        """Write one owner's buffered quantities now, if it has any"""
+        if self.has_pending(user_id, session_id):
+            await asyncio.to_thread(self.flush, user_id, session_id)
+
+    async def run_periodically(self) -> None:
+        """Flusher task: flushes every flush_interval, or early when the buffer fills, until cancelled"""
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+                self._wakeup.clear()
+                try:
+                    await asyncio.to_thread(self.flush)
+                except Exception:
+                    logger.exception("cart write-behind flush failed, entries kept for the next one")
+        finally:
+            self._wakeup = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self.buffer),
+            "updates_buffered": self.updates_buffered,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+cart_write_behind = CartWriteBehind()
+
+async def flush_pending_cart_writes(
+    request: Request,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+) -> None:
+    """Route dependency of cart mutations: the owner's buffered quantities are written first, so changes apply in order"""
+    if not cart_write_behind.enabled:
+        return
+    if current_user:
+        await cart_write_behind.flush_owner(user_id=get_user_id(current_user))
+    session_id = request.cookies.get("cart_session_id")
+    if session_id:
+        await cart_write_behind.flush_owner(session_id=session_id)
@@ -1,5 +1,11 @@
 import bcrypt
+import hashlib
 import jwt
+import time
+import uuid
+from app.core.config import settings
+from app.core.hashing import password_hasher
+from app.core.redis import LRUCacheBackend
 from app.models.user import User
 from app.schemas.user import UserCreate
 from datetime import datetime, timedelta, timezone
@@ -11,9 +17,14 @@ from sqlalchemy.exc import IntegrityError
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Same scheme, but a missing Authorization header yields None instead of a 401
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 SECRET_KEY = getenv("CORNU_SECKEY") 
 ALGORITHM = "HS256"
 
+# Verified payloads keyed by a hash of the token, each entry evicted at the token's exp
+token_cache = LRUCacheBackend(max_entries=settings.CORNU_TOKEN_CACHE_MAX_ENTRIES)
+
 def get_user_info(username: str, db: Session) -> dict | None:
     """Placeholder function to get user by username."""
     user: User = db.query(User).filter(User.username == username).first()
@@ -30,6 +41,14 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     hashed_password_bytes = hashed_password.encode('utf-8')
     return bcrypt.checkpw(password=plain_password_bytes , hashed_password=hashed_password_bytes)
 
+async def hash_password_async(password: str) -> bytes:
+    """hash_password on the bounded password executor, raises 503 when it is saturated."""
+    return await password_hasher.run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the bounded password executor, raises 503 when it is saturated."""
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
 def create_valid_token(data: dict, expires_delta: timedelta = timedelta(hours=1)) -> str:
     """Generate a JWT access token, default expires in 1 hour."""
     to_encode = data.copy()
@@ -42,6 +61,19 @@ def validate_access_token(token: str) -> dict:
     """Decode and validate JWT token, return payload. Raises exception if invalid."""
     return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
 
+def validate_access_token_cached(token: str) -> dict:
+    """validate_access_token backed by token_cache: a repeated token is a dict lookup
+    until its exp, after which it is decoded (and rejected) again."""
+    key = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(key)
+    if payload is None:
+        payload = validate_access_token(token)
+        exp = payload.get("exp")
+        if exp is not None and exp > time.time():
+            token_cache.set(key, payload, ttl=exp - time.time())
+    # callers get their own copy, the cached payload stays untouched
+    return dict(payload)
+
 def get_current_user(token: str = Depends(oauth2_scheme)) -> dict | None:
     # In a fastapi route
     # token: str = Depends(oauth2_scheme) --> extract token from HTTP header
@@ -49,7 +81,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> dict | None:
     # Depends(get_current_user) --> use this function to get current user info (payload, dict)
     # no duplicate code in routes
     try:
-        payload = validate_access_token(token)
+        payload = validate_access_token_cached(token)
         return payload
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -64,12 +96,35 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> dict | None:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def create_user(db: Session, user_data: UserCreate):
+def get_current_user_optional(token: str | None = Depends(optional_oauth2_scheme)) -> dict | None:
+    """Current user payload, or None for anonymous requests and invalid tokens."""
+    if not token:
+        return None
+    try:
+        return get_current_user(token)
+    except HTTPException:
+        return None
+
+def get_user_id(payload: dict):
+    """User id claim of a verified token payload, as a UUID. Tokens issued before the claim
+    existed (or with a malformed one) are rejected like invalid tokens."""
+    try:
+        return uuid.UUID(str(payload["id"]))
+    except (KeyError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid access token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+def create_user(db: Session, user_data: UserCreate, hashed_pwd: str | None = None):
     """
     register a new user in the database. 
+    hashed_pwd can be computed beforehand (e.g. with hash_password_async) to keep bcrypt off the caller's thread.
     """
 
-    hashed_pwd = hash_password(user_data.password).decode('utf-8')  # bcrypt returns bytes, decode to str for storage
+    if hashed_pwd is None:
+        hashed_pwd = hash_password(user_data.password).decode('utf-8')  # bcrypt returns bytes, decode to str for storage
     db_user = User(
         username=user_data.username,
         email=user_data.email,
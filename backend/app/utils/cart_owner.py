@@ -0,0 +1,27 @@
+import uuid
+from fastapi import Request, Response
+from typing import Optional
+from ..services.user import get_user_id
+
+def set_secure_cookie(response: Response, key: str, value: str):
+    """Set secure cookie with improved security settings"""
+    response.set_cookie(
+        key=key,
+        value=value,
+        max_age=60*60*24*30,  # 30 days
+        httponly=True,        # Prevent JavaScript access
+        secure=False,         # Set to True in production with HTTPS
+        samesite="strict"     # Strict CSRF protection
+    )
+
+def get_cart_identifier(request: Request, current_user: Optional[dict] = None):
+    """Get cart identifier information"""
+    if current_user:
+        return {"user_id": get_user_id(current_user), "session_id": None}
+    
+    # For anonymous users, use session or cookie to identify
+    session_id = request.cookies.get("cart_session_id")
+    if not session_id:
+        session_id = str(uuid.uuid4())
+    
+    return {"user_id": None, "session_id": session_id}
@@ -0,0 +1,77 @@
+import re
+import uuid
+from typing import NamedTuple, Optional
+from fastapi import HTTPException, Query, Request, Response
+
+# Browsers may keep the cart, but must revalidate it on every use
+CART_CACHE_CONTROL = "private, no-cache"
+
+_CART_ETAG = re.compile(r'^"([0-9a-f]{32})-([0-9]+)(?:-p[0-9]+|-s)?"$')
+
+class CartVersion(NamedTuple):
+    """Version a client expects the cart to be at, cart_id is None when only the number was given"""
+    cart_id: Optional[uuid.UUID]
+    version: int
+
+def cart_etag(cart_id: uuid.UUID, version: int, page_size: Optional[int] = None, summary: bool = False) -> str:
+    """Strong ETag of a cart: its id plus its version, plus the page size for a first-page representation
+    or a suffix for the summary one"""
+    if summary:
+        return f'"{cart_id.hex}-{version}-s"'
+    if page_size is not None:
+        return f'"{cart_id.hex}-{version}-p{page_size}"'
+    return f'"{cart_id.hex}-{version}"'
+
+def parse_cart_etag(etag: str) -> Optional[CartVersion]:
+    """Cart version named by an ETag of any cart representation, None if it is not one we issued"""
+    match = _CART_ETAG.match(etag.strip())
+    if not match:
+        return None
+    return CartVersion(uuid.UUID(match.group(1)), int(match.group(2)))
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check, using the weak comparison RFC 9110 prescribes for it"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def cart_cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CART_CACHE_CONTROL}
+
+def not_modified_response(etag: str) -> Response:
+    return Response(status_code=304, headers=cart_cache_headers(etag))
+
+def precondition_failed(cart_id: uuid.UUID, current_version: Optional[int]) -> HTTPException:
+    """412 for a stale If-Match / expected_version, with the current ETag so the client can refetch"""
+    headers = {"ETag": cart_etag(cart_id, current_version)} if current_version is not None else None
+    return HTTPException(status_code=412, detail="Cart was modified by another request", headers=headers)
+
+async def expected_cart_version(
+    request: Request,
+    expected_version: Optional[int] = Query(None, ge=0)
+) -> Optional[CartVersion]:
+    """Optimistic concurrency precondition of a cart mutation.
+
+    Taken from an If-Match header holding the ETag returned by the cart endpoints,
+    or from the expected_version query parameter (0: the cart must not have been
+    created yet). None (no header, or If-Match: *) means the mutation is applied
+    unconditionally.
+    """
+    if_match = request.headers.get("if-match")
+    if if_match is None:
+        return CartVersion(None, expected_version) if expected_version is not None else None
+    if if_match.strip() == "*":
+        return None
+    expected = parse_cart_etag(if_match)
+    if expected is None:
+        # Not an ETag we issued (weak, a list, another resource), so it can never match
+        raise HTTPException(status_code=412, detail="If-Match does not match the cart")
+    return expected
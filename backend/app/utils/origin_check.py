@@ -1,11 +1,22 @@
 from fastapi import HTTPException, Request
+from functools import lru_cache
+from urllib.parse import urlsplit
 
 # Allowed origins for production and development
-ALLOWED_ORIGINS = [
+ALLOWED_ORIGINS = frozenset({
     "http://localhost:3000",    # React dev server (CRA)
     "http://localhost:5173",    # Vite dev server
     "https://your-domain.com",  # Production domain (update this)
-]
+})
+
+@lru_cache(maxsize=256)
+def referer_origin(referer: str) -> str:
+    """
+    Extract the origin (scheme://host[:port]) from a Referer URL.
+    Cached: a client sends the same few referers over and over.
+    """
+    parsed_referer = urlsplit(referer)
+    return f"{parsed_referer.scheme}://{parsed_referer.netloc}"
 
 def check_origin(request: Request) -> None:
     """
@@ -18,7 +29,7 @@ def check_origin(request: Request) -> None:
     if not origin:
         return
     
-    # Check if origin is in allowed list
+    # Check if origin is in allowed set
     if origin not in ALLOWED_ORIGINS:
         raise HTTPException(
             status_code=403, 
@@ -37,21 +48,19 @@ def check_referer(request: Request) -> None:
     
     # Extract origin from referer URL
     try:
-        from urllib.parse import urlparse
-        parsed_referer = urlparse(referer)
-        referer_origin = f"{parsed_referer.scheme}://{parsed_referer.netloc}"
-        
-        if referer_origin not in ALLOWED_ORIGINS:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Referer origin '{referer_origin}' not allowed"
-            )
-    except Exception:
+        origin = referer_origin(referer)
+    except ValueError:
         # If parsing fails, reject the request
         raise HTTPException(
             status_code=403,
             detail="Invalid referer header"
         )
+    
+    if origin not in ALLOWED_ORIGINS:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Referer origin '{origin}' not allowed"
+        )
 
 def validate_request_origin(request: Request) -> None:
     """
@@ -0,0 +1,26 @@
+import base64
+import uuid
+from datetime import datetime, timezone
+from typing import Tuple
+import orjson
+
+# Position of a cart line in the (created_at, id) listing order
+ItemKey = Tuple[datetime, uuid.UUID]
+
+def encode_cursor(key: ItemKey) -> str:
+    """Opaque cursor pointing just after the given line"""
+    created_at, item_id = key
+    if created_at.tzinfo is not None:
+        # The column is a naive UTC timestamp, compare against the same
+        created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+    raw = orjson.dumps([created_at.isoformat(), item_id.hex])
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> ItemKey:
+    """Inverse of encode_cursor, raises ValueError for anything it did not produce"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, item_id = orjson.loads(raw)
+        return datetime.fromisoformat(created_at), uuid.UUID(hex=item_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("invalid cursor") from e
@@ -0,0 +1,65 @@
+import orjson
+from typing import Optional
+from fastapi import Response
+
+# orjson options matching Pydantic's JSON output (UTC as "Z")
+ORJSON_OPTIONS = orjson.OPT_UTC_Z
+
+class CartJSONResponse(Response):
+    """JSON response whose body is already encoded bytes"""
+    media_type = "application/json"
+
+def serialize_cart_item(item) -> dict:
+    """Cart line as a plain dict, same keys and order as schemas.cart_item.CartItem"""
+    return {
+        "product_id": item.product_id,
+        "quantity": item.quantity,
+        "price_snapshot": item.price_snapshot,
+        "id": item.id,
+        "cart_id": item.cart_id,
+        "created_at": item.created_at,
+        "updated_at": item.updated_at,
+    }
+
+def serialize_cart(cart) -> dict:
+    """Cart as a plain dict, same keys and order as schemas.cart.Cart"""
+    return {
+        "user_id": cart.user_id,
+        "session_id": cart.session_id,
+        "id": cart.id,
+        "items": [serialize_cart_item(item) for item in cart.items],
+        "created_at": cart.created_at,
+        "updated_at": cart.updated_at,
+        "version": cart.version,
+    }
+
+def serialize_cart_response(cart, total_items: int) -> bytes:
+    """
+    Encode a cart straight from its ORM rows to CartResponse JSON bytes.
+    The rows come from our own database and were validated on the way in,
+    so the Pydantic model and its InputSanitizer validators are skipped.
+    """
+    return orjson.dumps({"cart": serialize_cart(cart), "total_items": total_items}, option=ORJSON_OPTIONS)
+
+def serialize_cart_page(cart, total_items: int, line_count: int, next_cursor: Optional[str]) -> bytes:
+    """CartPageResponse JSON bytes, cart.items holding the first page only"""
+    return orjson.dumps(
+        {
+            "cart": serialize_cart(cart),
+            "total_items": total_items,
+            "line_count": line_count,
+            "next_cursor": next_cursor,
+        },
+        option=ORJSON_OPTIONS,
+    )
+
+def serialize_cart_items_page(items, next_cursor: Optional[str]) -> bytes:
+    """CartItemPage JSON bytes"""
+    return orjson.dumps(
+        {"items": [serialize_cart_item(item) for item in items], "next_cursor": next_cursor},
+        option=ORJSON_OPTIONS,
+    )
+
+def serialize_cart_summary(line_count: int, total_items: int) -> bytes:
+    """CartSummaryResponse JSON bytes"""
+    return orjson.dumps({"line_count": line_count, "total_items": total_items})
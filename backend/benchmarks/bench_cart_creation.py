@@ -0,0 +1,74 @@
+"""
+First-visit cart creation under concurrency.
+
+Fires N parallel CartService.get_or_create_cart calls for one new session id
+(the parallel XHRs of a first page load) and reports latency percentiles and
+errors. Runs against CORNU_DB_URL, creating the tables if needed:
+
+    cd backend && CORNU_DB_URL=postgresql://... python -m benchmarks.bench_cart_creation
+"""
+import argparse
+import threading
+import time
+import uuid
+from app.core.database import db_manager
+from app.models import user, cart, cart_item  # noqa
+from app.services.cart import CartService
+from benchmarks.stats import summarize
+
+def run_round(concurrency: int, same_session: bool):
+    session_id = str(uuid.uuid4())
+    barrier = threading.Barrier(concurrency)
+    latencies, errors, cart_ids = [], [], set()
+    lock = threading.Lock()
+
+    def first_visit():
+        sid = session_id if same_session else str(uuid.uuid4())
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            with db_manager.session_scope() as db:
+                cart_id = CartService.get_or_create_cart(db, session_id=sid).id
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            cart_ids.add(cart_id)
+
+    threads = [threading.Thread(target=first_visit) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, cart_ids
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--distinct-sessions", action="store_true",
+                        help="one session per request instead of one shared session")
+    args = parser.parse_args()
+
+    db_manager.create_all_tables()
+    latencies, errors, duplicates = [], [], 0
+    for _ in range(args.rounds):
+        round_latencies, round_errors, cart_ids = run_round(args.concurrency, not args.distinct_sessions)
+        latencies += round_latencies
+        errors += round_errors
+        if not args.distinct_sessions and len(cart_ids) > 1:
+            duplicates += 1
+
+    print(f"get_or_create_cart x{args.concurrency} parallel, {args.rounds} rounds")
+    for name, value in summarize(latencies).items():
+        print(f"  {name:>8}: {value}")
+    print(f"  {'errors':>8}: {len(errors)}")
+    print(f"  {'split':>8}: {duplicates} rounds returned more than one cart")
+    for error in sorted(set(errors))[:5]:
+        print(f"    {error}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+CartResponse serialization: the FastAPI/Pydantic path against the direct orjson path.
+
+The current path validates the ORM objects into CartResponse (running the
+InputSanitizer validators on every line), runs jsonable_encoder and renders a
+JSONResponse. The fast path goes from rows to bytes with serialize_cart_response.
+No database needed:
+
+    cd backend && CORNU_DB_URL=sqlite:// python -m benchmarks.bench_cart_serialization
+"""
+import argparse
+import json
+import timeit
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.schemas.cart import CartResponse
+from app.utils.serialization import serialize_cart_response
+from benchmarks.fixtures import make_cart
+
+def pydantic_path(cart, total_items: int) -> bytes:
+    return JSONResponse(jsonable_encoder(CartResponse(cart=cart, total_items=total_items))).body
+
+def fast_path(cart, total_items: int) -> bytes:
+    return serialize_cart_response(cart, total_items)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 50, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'lines':>6} {'pydantic_us':>12} {'fast_us':>10} {'speedup':>8}")
+    for size in args.sizes:
+        cart = make_cart(size)
+        total_items = sum(item.quantity for item in cart.items)
+        assert json.loads(pydantic_path(cart, total_items)) == json.loads(fast_path(cart, total_items))
+
+        number = max(1, 2000 // size)
+        results = {}
+        for name, fn in (("pydantic", pydantic_path), ("fast", fast_path)):
+            timings = timeit.repeat(lambda: fn(cart, total_items), number=number, repeat=args.repeat)
+            results[name] = min(timings) / number * 1e6
+        print(f"{size:>6} {results['pydantic']:>12.1f} {results['fast']:>10.1f} {results['pydantic'] / results['fast']:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
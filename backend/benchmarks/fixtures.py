@@ -0,0 +1,24 @@
+# In-memory objects shared by the benchmark scripts
+import uuid
+from datetime import datetime
+from app.models import user  # noqa: registers the users table referenced by carts
+from app.models.cart import Cart
+from app.models.cart_item import CartItem
+
+def make_cart(lines: int) -> Cart:
+    """Transient Cart with `lines` CartItems, no database involved"""
+    now = datetime(2025, 1, 2, 3, 4, 5, 678901)
+    cart = Cart(id=uuid.uuid4(), user_id=None, session_id=str(uuid.uuid4()), created_at=now, updated_at=now, version=1)
+    cart.items = [
+        CartItem(
+            id=uuid.uuid4(),
+            cart_id=cart.id,
+            product_id=f"sku-{n}",
+            quantity=n % 5 + 1,
+            price_snapshot="19.99",
+            created_at=now,
+            updated_at=now,
+        )
+        for n in range(lines)
+    ]
+    return cart
@@ -0,0 +1,378 @@
+"""
+HTTP load test of the API: starts the app under uvicorn against a local database,
+seeds users and carts through the API, then drives a scenario with a fixed number
+of concurrent virtual users (each an httpx.AsyncClient with its own cookies).
+
+Scenarios:
+    browse       cart reads: GET /cart (half of them revalidating with If-None-Match),
+                 /cart/summary and the paginated /cart/items
+    add_burst    guests adding products, stepping quantities, reading the badge
+    login_storm  logins of the seeded users followed by a cart read
+    merge        guest fills a cart, logs in, POST /cart/merge
+    mixed        70% browse, 20% add_burst, 5% login_storm, 5% merge
+
+Reports throughput and p50/p95/p99 per endpoint and can save them as JSON
+(with the commit they were measured at); compare two result files to spot
+regressions between commits:
+
+    cd backend && python -m benchmarks.load_test run --scenario mixed --concurrency 32 --duration 30 --output before.json
+    cd backend && python -m benchmarks.load_test compare before.json after.json --threshold 10
+
+Without CORNU_DB_URL a fresh SQLite file in a temporary directory is used;
+--url targets a server that is already running (and already seeded) instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+import httpx
+from benchmarks.stats import summarize
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SEED_PASSWORD = "load-test-password"
+PRODUCTS = [f"sku-{n}" for n in range(200)]
+
+class Recorder:
+    """Latencies and status codes per endpoint (method + route template)"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.recording = False
+
+    def record(self, endpoint: str, elapsed: float, status: Optional[int]) -> None:
+        if not self.recording:
+            return
+        self.latencies[endpoint].append(elapsed)
+        if status is None or status >= 400:
+            self.errors[endpoint] += 1
+        self.statuses[endpoint][status or 0] += 1
+
+    def report(self, seconds: float) -> dict:
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                **summarize(latencies),
+                "rps": round(len(latencies) / seconds, 2),
+                "errors": self.errors[endpoint],
+                "statuses": {str(status): count for status, count in sorted(self.statuses[endpoint].items())},
+            }
+        every = [latency for latencies in self.latencies.values() for latency in latencies]
+        total = {**summarize(every), "rps": round(len(every) / seconds, 2), "errors": sum(self.errors.values())}
+        return {"total": total, "endpoints": endpoints}
+
+class VirtualUser:
+    """One browser: its own cookie jar (cart session, CSRF, refresh token) and random stream"""
+
+    def __init__(self, base_url: str, recorder: Recorder, rng: random.Random):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=30)
+        self.recorder = recorder
+        self.rng = rng
+        self.csrf_token: Optional[str] = None
+        self.access_token: Optional[str] = None
+        self.etag: Optional[str] = None
+        self.item_ids: List[str] = []
+
+    async def request(self, method: str, endpoint: str, path: Optional[str] = None, **kwargs) -> Optional[httpx.Response]:
+        headers = kwargs.pop("headers", {})
+        if method != "GET" and self.csrf_token:
+            headers["X-CSRF-Token"] = self.csrf_token
+        if self.access_token:
+            headers["Authorization"] = f"Bearer {self.access_token}"
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path or endpoint, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(f"{method} {endpoint}", time.perf_counter() - start, None)
+            return None
+        self.recorder.record(f"{method} {endpoint}", time.perf_counter() - start, response.status_code)
+        return response
+
+    async def start(self) -> None:
+        response = await self.request("GET", "/security/csrf-token")
+        if response is not None and response.status_code == 200:
+            self.csrf_token = response.json()["csrf_token"]
+
+    async def new_guest(self) -> None:
+        """Forget the cart session and the login, like a new private window"""
+        self.client.cookies.clear()
+        self.access_token, self.etag, self.item_ids = None, None, []
+        await self.start()
+
+    async def login(self, username: str) -> bool:
+        response = await self.request("POST", "/user/login", json={"username": username, "password": SEED_PASSWORD})
+        if response is None or response.status_code != 200:
+            return False
+        self.access_token = response.json()["access_token"]
+        return True
+
+    async def add(self, product_id: str, quantity: int = 1) -> None:
+        response = await self.request("POST", "/cart/items/", json={"product_id": product_id, "quantity": quantity})
+        if response is not None and response.status_code == 200:
+            self.item_ids = [item["id"] for item in response.json()["cart"]["items"]]
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+# Scenario steps: one user transaction each
+
+async def browse(vu: VirtualUser, users: List[str]) -> None:
+    headers = {"If-None-Match": vu.etag} if vu.etag and vu.rng.random() < 0.5 else {}
+    response = await vu.request("GET", "/cart/", headers=headers)
+    if response is not None and response.headers.get("etag"):
+        vu.etag = response.headers["etag"]
+    await vu.request("GET", "/cart/summary")
+    if vu.rng.random() < 0.3:
+        await vu.request("GET", "/cart/items/", params={"page_size": 20})
+
+async def add_burst(vu: VirtualUser, users: List[str]) -> None:
+    for _ in range(vu.rng.randint(1, 5)):
+        await vu.add(vu.rng.choice(PRODUCTS), vu.rng.randint(1, 3))
+    if vu.item_ids:
+        item_id = vu.rng.choice(vu.item_ids)
+        await vu.request("PUT", "/cart/items/{item_id}", f"/cart/items/{item_id}", json={"quantity": vu.rng.randint(1, 9)})
+    await vu.request("GET", "/cart/summary")
+
+async def login_storm(vu: VirtualUser, users: List[str]) -> None:
+    await vu.new_guest()
+    if await vu.login(vu.rng.choice(users)):
+        await vu.request("GET", "/cart/")
+
+async def merge(vu: VirtualUser, users: List[str]) -> None:
+    await vu.new_guest()
+    for _ in range(vu.rng.randint(1, 5)):
+        await vu.add(vu.rng.choice(PRODUCTS))
+    if await vu.login(vu.rng.choice(users)):
+        await vu.request("POST", "/cart/merge")
+
+async def mixed(vu: VirtualUser, users: List[str]) -> None:
+    step = vu.rng.choices([browse, add_burst, login_storm, merge], weights=[70, 20, 5, 5])[0]
+    await step(vu, users)
+
+SCENARIOS = {step.__name__: step for step in (browse, add_burst, login_storm, merge, mixed)}
+
+# Server and seed data
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def server_env(db_url: str) -> dict:
+    env = dict(os.environ, CORNU_DB_URL=db_url)
+    env.setdefault("CORNU_SECKEY", "load-test-secret-key-load-test-secret")
+    env.setdefault("CORNU_CART_SWEEP_INTERVAL", "0")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(BACKEND_DIR), env.get("PYTHONPATH")]))
+    return env
+
+def start_server(db_url: str, port: int, workers: int, log_path: Path) -> subprocess.Popen:
+    env = server_env(db_url)
+    subprocess.run(
+        [sys.executable, "-c", "from app.models import user, cart, cart_item\n"
+         "from app.core.database import db_manager\ndb_manager.create_all_tables()"],
+        env=env, cwd=BACKEND_DIR, check=True
+    )
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:my_app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        env=env, cwd=BACKEND_DIR, stdout=log, stderr=subprocess.STDOUT
+    )
+
+async def wait_ready(base_url: str, server: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with code {server.returncode}")
+            try:
+                if (await client.get("/security/csrf-token")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server not ready after {timeout} seconds")
+
+async def seed(base_url: str, users: int, lines: int, rng: random.Random) -> List[str]:
+    """Register users and give each a cart of `lines` products, returns the usernames"""
+    run_id = uuid.uuid4().hex[:8]
+    usernames = [f"load{run_id}u{n}" for n in range(users)]
+    recorder = Recorder()
+
+    async def seed_user(username: str) -> None:
+        vu = VirtualUser(base_url, recorder, random.Random(rng.random()))
+        try:
+            await vu.start()
+            response = await vu.request("POST", "/user/register", json={
+                "username": username, "email": f"{username}@example.com", "password": SEED_PASSWORD
+            })
+            if response is None or response.status_code not in (200, 201):
+                raise RuntimeError(f"could not register {username}: {response.status_code if response else 'no response'}")
+            if await vu.login(username):
+                for product_id in vu.rng.sample(PRODUCTS, lines):
+                    await vu.add(product_id, vu.rng.randint(1, 3))
+        finally:
+            await vu.close()
+
+    await asyncio.gather(*(seed_user(username) for username in usernames))
+    return usernames
+
+# Load generation
+
+async def drive(base_url: str, scenario, users: List[str], concurrency: int, duration: float, warmup: float, seed_value: int) -> dict:
+    recorder = Recorder()
+    virtual_users = [VirtualUser(base_url, recorder, random.Random(seed_value + n)) for n in range(concurrency)]
+    await asyncio.gather(*(vu.start() for vu in virtual_users))
+    stop_at = time.monotonic() + warmup + duration
+
+    async def loop(vu: VirtualUser) -> None:
+        while time.monotonic() < stop_at:
+            await scenario(vu, users)
+
+    async def measure() -> float:
+        await asyncio.sleep(warmup)
+        recorder.recording = True
+        started = time.perf_counter()
+        await asyncio.sleep(duration)
+        recorder.recording = False
+        return time.perf_counter() - started
+
+    try:
+        measured, *_ = await asyncio.gather(measure(), *(loop(vu) for vu in virtual_users))
+    finally:
+        await asyncio.gather(*(vu.close() for vu in virtual_users))
+    return recorder.report(measured)
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(results: dict) -> None:
+    meta = results["meta"]
+    print(f"{meta['scenario']}: {meta['concurrency']} virtual users, {meta['duration']} s, commit {meta['commit']}")
+    print(f"  {'endpoint':<34} {'count':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for endpoint, stats in [*results["endpoints"].items(), ("total", results["total"])]:
+        print(
+            f"  {endpoint:<34} {stats['count']:>7} {stats['rps']:>8} {stats['p50_ms']:>8} "
+            f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7}"
+        )
+
+async def run(args) -> dict:
+    rng = random.Random(args.seed)
+    server = None
+    with tempfile.TemporaryDirectory(prefix="cornu-load-") as tmp:
+        base_url = args.url
+        if base_url is None:
+            db_url = os.environ.get("CORNU_DB_URL") or f"sqlite:///{Path(tmp) / 'load.db'}"
+            port = free_port()
+            server = start_server(db_url, port, args.workers, Path(tmp) / "server.log")
+            base_url = f"http://127.0.0.1:{port}"
+        try:
+            if server is not None:
+                await wait_ready(base_url, server)
+            users = await seed(base_url, args.users, args.cart_lines, rng)
+            report = await drive(
+                base_url, SCENARIOS[args.scenario], users, args.concurrency, args.duration, args.warmup, args.seed
+            )
+        except Exception:
+            if server is not None:
+                print((Path(tmp) / "server.log").read_text()[-4000:], file=sys.stderr)
+            raise
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    return {
+        "meta": {
+            "scenario": args.scenario,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "users": args.users,
+            "workers": args.workers,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        **report,
+    }
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Print the p95 and throughput change per endpoint, returns False when one regressed by more than threshold %"""
+    ok = True
+    print(f"baseline {baseline['meta']['commit']} -> current {current['meta']['commit']} ({current['meta']['scenario']})")
+    for key in ("scenario", "concurrency", "duration", "workers"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"  warning: {key} differs ({baseline['meta'].get(key)} vs {current['meta'].get(key)})")
+    print(f"  {'endpoint':<34} {'p95 ms':>17} {'change':>8} {'rps':>17} {'change':>8}")
+    rows = [(name, baseline["endpoints"].get(name), stats) for name, stats in current["endpoints"].items()]
+    for name, before, after in [*rows, ("total", baseline["total"], current["total"])]:
+        if before is None:
+            print(f"  {name:<34} (new endpoint)")
+            continue
+        p95_change = _change(before["p95_ms"], after["p95_ms"])
+        rps_change = _change(before["rps"], after["rps"])
+        regressed = p95_change > threshold or -rps_change > threshold
+        ok = ok and not regressed
+        print(
+            f"  {name:<34} {before['p95_ms']:>8}->{after['p95_ms']:<8} {p95_change:>+7.1f}% "
+            f"{before['rps']:>8}->{after['rps']:<8} {rps_change:>+7.1f}%{'  REGRESSION' if regressed else ''}"
+        )
+    return ok
+
+def _change(before: float, after: float) -> float:
+    return (after - before) / before * 100 if before else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run a scenario and report per-endpoint latency")
+    run_parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    run_parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    run_parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=5, help="seconds of load before measuring")
+    run_parser.add_argument("--users", type=int, default=20, help="registered users to seed")
+    run_parser.add_argument("--cart-lines", type=int, default=10, help="cart lines seeded per user")
+    run_parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    run_parser.add_argument("--seed", type=int, default=1, help="random seed of the seed data and the virtual users")
+    run_parser.add_argument("--url", help="use a running server instead of starting one")
+    run_parser.add_argument("--output", type=Path, help="save the results as JSON")
+
+    compare_parser = commands.add_parser("compare", help="compare two result files, exit 1 on a regression")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument("--threshold", type=float, default=10, help="allowed p95 / throughput change in percent")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        ok = compare(json.loads(args.baseline.read_text()), json.loads(args.current.read_text()), args.threshold)
+        sys.exit(0 if ok else 1)
+
+    results = asyncio.run(run(args))
+    print_report(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
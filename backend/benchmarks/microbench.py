@@ -0,0 +1,277 @@
+"""
+Microbenchmarks of the hot paths every request goes through: CSRF tokens, JWTs,
+the InputSanitizer, AddToCartRequest validation, CartResponse serialization and
+the CartService queries (on an in-memory SQLite database).
+
+Each benchmark is warmed up for --warmup seconds, then timed in --repeat samples
+of `number` calls, `number` being calibrated so a sample lasts at least
+--min-time seconds. The median time per call is the figure that gets compared.
+
+    cd backend && CORNU_DB_URL=sqlite:// python -m benchmarks.microbench --save baseline.json
+    cd backend && CORNU_DB_URL=sqlite:// python -m benchmarks.microbench --compare baseline.json --threshold 20
+
+--compare exits 1 when a benchmark's median got slower than the baseline by more
+than --threshold percent. --filter runs the benchmarks whose name contains it.
+"""
+import argparse
+import gc
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Optional
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.core.database import Base
+from app.core.security import CSRFProtection
+from app.schemas.cart import CartResponse
+from app.schemas.cart_item import AddToCartRequest
+from app.services.cart import CartService
+from app.services.user import create_valid_token, validate_access_token, validate_access_token_cached
+from app.utils.security import InputSanitizer
+from app.utils.serialization import serialize_cart_response
+from benchmarks.fixtures import make_cart
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+CART_SIZES = (1, 50, 1000)
+
+# name -> setup, returning the zero-argument callable to time
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+# Security
+
+@benchmark("csrf.generate_token")
+def _csrf_generate():
+    return CSRFProtection().generate_csrf_token
+
+@benchmark("csrf.validate_token")
+def _csrf_validate():
+    """A token seen for the first time: the signature is checked"""
+    csrf = CSRFProtection()
+    token = csrf.generate_csrf_token()
+
+    def validate():
+        csrf._validated_tokens.clear()
+        return csrf.validate_csrf_token(token)
+    return validate
+
+@benchmark("csrf.validate_token_repeated")
+def _csrf_validate_repeated():
+    csrf = CSRFProtection()
+    token = csrf.generate_csrf_token()
+    return lambda: csrf.validate_csrf_token(token)
+
+@benchmark("jwt.create_valid_token")
+def _jwt_create():
+    data = {"sub": "bench_user", "id": str(uuid.uuid4())}
+    return lambda: create_valid_token(data)
+
+@benchmark("jwt.validate_access_token")
+def _jwt_validate():
+    token = create_valid_token({"sub": "bench_user", "id": str(uuid.uuid4())})
+    return lambda: validate_access_token(token)
+
+@benchmark("jwt.validate_access_token_cached")
+def _jwt_validate_cached():
+    token = create_valid_token({"sub": "bench_user", "id": str(uuid.uuid4())})
+    return lambda: validate_access_token_cached(token)
+
+@benchmark("sanitizer.sanitize_text")
+def _sanitize_text():
+    text = "  A <b>gift</b> for Alice & Bob, wrapped in \"red\" paper  "
+    return lambda: InputSanitizer.sanitize_text(text, max_length=200)
+
+@benchmark("sanitizer.sanitize_username")
+def _sanitize_username():
+    return lambda: InputSanitizer.sanitize_username("  bench_user_42 ")
+
+@benchmark("sanitizer.sanitize_product_id")
+def _sanitize_product_id():
+    return lambda: InputSanitizer.sanitize_product_id("sku-1234_blue-xl")
+
+@benchmark("sanitizer.sanitize_price")
+def _sanitize_price():
+    return lambda: InputSanitizer.sanitize_price(" 1,299.99 ")
+
+# Schemas
+
+@benchmark("schema.add_to_cart_request")
+def _add_to_cart_request():
+    payload = {"product_id": "sku-1234_blue-xl", "quantity": 3, "price_snapshot": "19.99"}
+    return lambda: AddToCartRequest.model_validate(payload)
+
+def _cart_response(lines: int):
+    cart = make_cart(lines)
+    total_items = sum(item.quantity for item in cart.items)
+    return lambda: CartResponse(cart=cart, total_items=total_items).model_dump_json()
+
+def _cart_response_fast(lines: int):
+    cart = make_cart(lines)
+    total_items = sum(item.quantity for item in cart.items)
+    return lambda: serialize_cart_response(cart, total_items)
+
+for _lines in CART_SIZES:
+    benchmark(f"schema.cart_response[{_lines}]")(lambda lines=_lines: _cart_response(lines))
+    benchmark(f"schema.cart_response_orjson[{_lines}]")(lambda lines=_lines: _cart_response_fast(lines))
+
+# CartService on a private in-memory database, one session per call like one per request
+
+_sessionmaker: Optional[sessionmaker] = None
+
+def cart_db() -> sessionmaker:
+    """Sessionmaker of an in-memory SQLite database holding one 50-line cart of session "bench" """
+    global _sessionmaker
+    if _sessionmaker is None:
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(engine)
+        _sessionmaker = sessionmaker(bind=engine, autoflush=False)
+        with _sessionmaker() as db:
+            cart = make_cart(50)
+            cart.session_id = "bench"
+            db.add(cart)
+            db.commit()
+    return _sessionmaker
+
+def _cart_query(query: Callable[[Session], object]):
+    make_session = cart_db()
+
+    def run():
+        with make_session() as db:
+            return query(db)
+    return run
+
+_CART_QUERIES = {
+    "get_or_create_cart": lambda db: CartService.get_or_create_cart(db, session_id="bench"),
+    "get_cart": lambda db: CartService.get_cart(db, session_id="bench"),
+    "get_cart_etag": lambda db: CartService.get_cart_etag(db, session_id="bench"),
+    "get_cart_summary": lambda db: CartService.get_cart_summary(db, session_id="bench"),
+    "get_cart_items_page": lambda db: CartService.get_cart_items_page(db, session_id="bench", limit=20),
+    "get_cart_first_page": lambda db: CartService.get_cart_first_page(db, session_id="bench", page_size=20),
+}
+
+for _name, _query in _CART_QUERIES.items():
+    benchmark(f"cart_service.{_name}")(lambda query=_query: _cart_query(query))
+
+# Runner
+
+def calibrate(fn: Callable[[], object], min_time: float) -> int:
+    """Calls per sample so that one sample lasts at least min_time"""
+    number = 1
+    while True:
+        if _time(fn, number) >= min_time:
+            return number
+        number *= 2 if number < 8 else 4
+
+def _time(fn: Callable[[], object], number: int) -> float:
+    calls = range(number)
+    start = time.perf_counter()
+    for _ in calls:
+        fn()
+    return time.perf_counter() - start
+
+def measure(fn: Callable[[], object], warmup: float, repeat: int, min_time: float) -> dict:
+    deadline = time.perf_counter() + warmup
+    while time.perf_counter() < deadline:
+        fn()
+    number = calibrate(fn, min_time)
+    # Collections would land in random samples, as in timeit
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        samples = [_time(fn, number) / number * 1e6 for _ in range(repeat)]
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {
+        "number": number,
+        "repeat": repeat,
+        "min_us": round(min(samples), 3),
+        "median_us": round(statistics.median(samples), 3),
+        "stdev_us": round(statistics.stdev(samples), 3) if repeat > 1 else 0.0,
+    }
+
+def run(names, warmup: float, repeat: int, min_time: float) -> dict:
+    results = {}
+    for name in names:
+        results[name] = measure(BENCHMARKS[name](), warmup, repeat, min_time)
+        stats = results[name]
+        print(f"  {name:<42} {stats['median_us']:>12.3f} {stats['min_us']:>12.3f} {stats['stdev_us']:>10.3f} {stats['number']:>8}")
+    return results
+
+def compare(baseline: dict, results: dict, threshold: float) -> bool:
+    """Print the median change per benchmark, returns False when one got slower by more than threshold %"""
+    ok = True
+    print(f"baseline {baseline['meta']['commit']}, threshold {threshold}%")
+    for name, stats in results.items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            print(f"  {name:<42} (not in baseline)")
+            continue
+        change = (stats["median_us"] - before["median_us"]) / before["median_us"] * 100
+        regressed = change > threshold
+        ok = ok and not regressed
+        print(
+            f"  {name:<42} {before['median_us']:>12.3f} -> {stats['median_us']:<12.3f} {change:>+7.1f}%"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+    return ok
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="run the benchmarks whose name contains this")
+    parser.add_argument("--warmup", type=float, default=0.2, help="seconds of calls before timing")
+    parser.add_argument("--repeat", type=int, default=7, help="timed samples per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per sample")
+    parser.add_argument("--save", type=Path, help="write the results as a JSON baseline")
+    parser.add_argument("--compare", type=Path, help="baseline JSON to compare against, exit 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=20, help="allowed slowdown of a median in percent")
+    parser.add_argument("--list", action="store_true", help="print the benchmark names and exit")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.filter in name]
+    if args.list:
+        print("\n".join(names))
+        return
+    if not names:
+        parser.error(f"no benchmark matches {args.filter!r}")
+
+    print(f"  {'benchmark':<42} {'median_us':>12} {'min_us':>12} {'stdev_us':>10} {'number':>8}")
+    results = run(names, args.warmup, args.repeat, args.min_time)
+
+    if args.save:
+        args.save.write_text(json.dumps({
+            "meta": {
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "warmup": args.warmup,
+                "repeat": args.repeat,
+                "min_time": args.min_time,
+            },
+            "benchmarks": results,
+        }, indent=2))
+        print(f"baseline saved to {args.save}")
+    if args.compare:
+        ok = compare(json.loads(args.compare.read_text()), results, args.threshold)
+        sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+import asyncio
+from app.core.database import DatabaseManager
+from app.models import user  # noqa: registers the users table referenced by carts
+from app.schemas.cart_item import AddToCartRequest, UpdateCartItemRequest
+from app.services.cart import AsyncCartService
+from app.services.cart_item import AsyncCartItemService
+
+def test_cart_services_run_on_an_async_session(tmp_path):
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'cart.db'}")
+    manager.create_all_tables()
+
+    async def scenario():
+        async with manager.async_db_session() as db:
+            item = await AsyncCartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=2), session_id="async-tab")
+            await AsyncCartItemService.update_cart_item(db, item.id, UpdateCartItemRequest(quantity=5), session_id="async-tab")
+        # A new session sees the committed rows, with the items readable outside the greenlet
+        async with manager.async_db_session() as db:
+            cart = await AsyncCartService.get_cart(db, session_id="async-tab")
+            return [(line.product_id, line.quantity) for line in cart.items], AsyncCartService.get_cart_total_items(cart)
+
+    try:
+        assert asyncio.run(scenario()) == ([("sku-1", 5)], 5)
+    finally:
+        manager.engine.dispose()
+        asyncio.run(manager.async_engine.dispose())
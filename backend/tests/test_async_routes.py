@@ -0,0 +1,146 @@
+import asyncio
+import pytest
+import uuid
+from datetime import timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.core.config import settings
+from app.core.database import DatabaseManager, db_manager
+from app.core.redis import cart_cache
+from app.main import my_app
+from app.services import user
+from app.services.cart_write_behind import QuantityBuffer, cart_write_behind
+from tests.test_cart_cache import UnreachableBackend
+
+@pytest.fixture
+def client(tmp_path):
+    """The app on a private SQLite file, through the async session dependencies"""
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'cart.db'}")
+    manager.create_all_tables()
+    my_app.dependency_overrides[db_manager.get_async_db] = manager.get_async_db
+    my_app.dependency_overrides[db_manager.get_async_read_db] = manager.get_async_read_db
+    # https: the cart session cookie is Secure
+    client = TestClient(my_app, base_url="https://testserver")
+    client.headers["X-CSRF-Token"] = client.get("/security/csrf-token").json()["csrf_token"]
+    client.manager = manager
+    yield client
+    my_app.dependency_overrides.clear()
+    manager.engine.dispose()
+    asyncio.run(manager.async_engine.dispose())
+
+def test_add_to_cart_and_read_it_back(client):
+    response = client.post("/cart/items/", json={"product_id": "sku-1", "quantity": 2})
+    assert response.status_code == 200
+    assert client.cookies.get("cart_session_id")
+    client.post("/cart/items/", json={"product_id": "sku-1", "quantity": 1})
+
+    cart = client.get("/cart/").json()
+    assert cart["total_items"] == 3
+    assert [(item["product_id"], item["quantity"]) for item in cart["cart"]["items"]] == [("sku-1", 3)]
+    assert client.get("/cart/summary").json() == {"line_count": 1, "total_items": 3}
+
+def test_updating_an_unknown_line_is_a_404_whatever_the_quantity(client):
+    item_id = client.post("/cart/items/", json={"product_id": "sku-1"}).json()["cart"]["items"][0]["id"]
+    unknown = "00000000-0000-0000-0000-000000000001"
+    for quantity in (0, 3):
+        assert client.put(f"/cart/items/{unknown}", json={"quantity": quantity}).status_code == 404
+
+    # A quantity of 0 deletes a known line
+    response = client.put(f"/cart/items/{item_id}", json={"quantity": 0})
+    assert response.status_code == 200
+    assert response.json()["cart"]["items"] == []
+
+def test_paged_cart_has_its_own_etag(client):
+    client.post("/cart/items/", json={"product_id": "sku-1", "quantity": 2})
+    full = client.get("/cart/").headers["etag"]
+    paged = client.get("/cart/", params={"page_size": 1}).headers["etag"]
+    assert paged != full
+    assert client.get("/cart/", params={"page_size": 1}, headers={"If-None-Match": paged}).status_code == 304
+    assert client.get("/cart/", params={"page_size": 1}, headers={"If-None-Match": full}).status_code == 200
+    assert client.get("/cart/", headers={"If-None-Match": paged}).status_code == 200
+    # Either one works as If-Match
+    assert client.post("/cart/items/", json={"product_id": "sku-2"}, headers={"If-Match": paged}).status_code == 200
+
+def test_virtual_cart_etag_is_owner_scoped(client):
+    first = client.get("/cart/")
+    again = client.get("/cart/")
+    assert (again.headers["etag"], again.json()) == (first.headers["etag"], first.json())
+    assert client.get("/cart/", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+    # Another visitor's empty cart is another representation
+    client.cookies.clear()
+    other = client.get("/cart/")
+    assert other.headers["etag"] != first.headers["etag"]
+    # The first mutation accepts the virtual cart's ETag
+    assert client.post("/cart/items/", json={"product_id": "sku-1"}, headers={"If-Match": other.headers["etag"]}).status_code == 200
+
+def test_cart_summary_is_conditional_and_does_not_flush(client, monkeypatch):
+    item_id = client.post("/cart/items/", json={"product_id": "sku-1", "quantity": 2}).json()["cart"]["items"][0]["id"]
+    summary = client.get("/cart/summary")
+    assert summary.headers["cache-control"] == "private, no-cache"
+    assert summary.headers["etag"] not in (client.get("/cart/").headers["etag"], None)
+    assert client.get("/cart/summary", headers={"If-None-Match": summary.headers["etag"]}).status_code == 304
+
+    # A buffered quantity is counted, not written
+    monkeypatch.setattr(cart_write_behind, "enabled", True)
+    monkeypatch.setattr(cart_write_behind, "buffer", QuantityBuffer())
+    assert client.put(f"/cart/items/{item_id}", json={"quantity": 5}).status_code == 200
+    buffered = client.get("/cart/summary", headers={"If-None-Match": summary.headers["etag"]})
+    assert (buffered.status_code, buffered.json()) == (200, {"line_count": 1, "total_items": 5})
+    assert (buffered.headers.get("etag"), buffered.headers["cache-control"]) == (None, "no-store")
+    assert len(cart_write_behind.buffer) == 1
+
+def test_cart_cache_is_kept_current_by_the_mutation_routes(client):
+    item_id = client.post("/cart/items/", json={"product_id": "sku-1", "quantity": 2}).json()["cart"]["items"][0]["id"]
+    updated = client.put(f"/cart/items/{item_id}", json={"quantity": 5})
+
+    # Written through: the cart is served, and answered 304, without a statement
+    statements = []
+    event.listen(client.manager.async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    cart = client.get("/cart/")
+    assert (cart.headers["etag"], cart.json()) == (updated.headers["etag"], updated.json())
+    assert client.get("/cart/", headers={"If-None-Match": cart.headers["etag"]}).status_code == 304
+    assert statements == []
+
+    # Invalidated: read again from the database
+    assert client.delete("/cart/").status_code == 200
+    response = client.get("/cart/", headers={"If-None-Match": cart.headers["etag"]})
+    assert response.status_code == 200
+    assert response.json()["cart"]["items"] == []
+
+def test_cart_routes_work_while_the_cache_is_down(client, monkeypatch):
+    monkeypatch.setattr(cart_cache, "backend", UnreachableBackend())
+    assert client.post("/cart/items/", json={"product_id": "sku-1", "quantity": 2}).status_code == 200
+    response = client.get("/cart/")
+    assert response.status_code == 200
+    assert response.json()["total_items"] == 2
+
+def test_tokens_without_a_user_id_are_rejected(client):
+    # Issued before tokens carried the user id: the cart cannot be told, log in again
+    older = user.create_valid_token({"username": "olduser"}, expires_delta=timedelta(minutes=5))
+    assert client.get("/cart/", headers={"Authorization": f"Bearer {older}"}).status_code == 401
+    client.cookies.set("refresh_token", older)
+    assert client.post("/user/refresh").status_code == 401
+
+    user_id = str(uuid.uuid4())
+    client.cookies.set("refresh_token", user.create_valid_token({"username": "newuser", "id": user_id}))
+    access_token = client.post("/user/refresh").json()["access_token"]
+    assert user.validate_access_token(access_token)["id"] == user_id
+    assert client.get("/cart/", headers={"Authorization": f"Bearer {access_token}"}).status_code == 200
+
+def test_operational_endpoints_require_the_internal_token(client, monkeypatch):
+    paths = ["/metrics", "/health/db-pool", "/health/caches", "/health/cart-sweeper", "/health/cart-write-behind"]
+    # No token configured: as if they were not mounted
+    monkeypatch.setattr(settings, "CORNU_INTERNAL_TOKEN", None)
+    assert {client.get(path).status_code for path in paths} == {404}
+
+    monkeypatch.setattr(settings, "CORNU_INTERNAL_TOKEN", "ops-token")
+    assert {client.get(path).status_code for path in paths} == {401}
+    assert client.get("/health/db-pool", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    authorized = {"Authorization": "Bearer ops-token"}
+    assert {client.get(path, headers=authorized).status_code for path in paths} == {200}
+    # Query profiles only exist with profiling switched on
+    monkeypatch.setattr(settings, "CORNU_QUERY_PROFILING", False)
+    assert client.get("/health/query-profiles", headers=authorized).status_code == 404
+    monkeypatch.setattr(settings, "CORNU_QUERY_PROFILING", True)
+    assert client.get("/health/query-profiles", headers=authorized).status_code == 200
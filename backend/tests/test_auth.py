@@ -1,5 +1,8 @@
+import asyncio
+import threading
 import jwt
 import pytest
+from app.core.hashing import PasswordHashExecutor
 from app.services import user
 from datetime import datetime, timedelta, timezone
 from fastapi import HTTPException
@@ -11,6 +14,31 @@ def test_hash_and_verify_password():
     assert user.verify_password(password, hashed)
     assert not user.verify_password("wrongpassword", hashed)
 
+def test_hash_and_verify_password_async():
+    password = "mysecretpassword"
+    hashed = asyncio.run(user.hash_password_async(password)).decode('utf-8')
+    assert asyncio.run(user.verify_password_async(password, hashed))
+    assert not asyncio.run(user.verify_password_async("wrongpassword", hashed))
+
+def test_password_executor_rejects_when_saturated():
+    executor = PasswordHashExecutor(max_workers=1, max_pending=0)
+    release = threading.Event()
+
+    async def scenario():
+        busy = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as excinfo:
+            await executor.run(user.hash_password, "password")
+        release.set()
+        await busy
+        return excinfo.value
+
+    error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["in_flight"] == 0
+    executor.shutdown()
+
 def test_create_and_validate_access_token():
     data = {"username": "testuser"}
     token = user.create_valid_token(data, expires_delta=timedelta(minutes=5))
@@ -54,3 +82,22 @@ def test_get_current_user_invalid():
         user.get_current_user(token)
     assert excinfo.value.status_code == 401
     assert excinfo.value.detail == "Invalid access token"
+
+def test_get_current_user_caches_verified_payload():
+    user.token_cache.clear()
+    before = user.token_cache.stats()
+    token = user.create_valid_token({"username": "cacheduser"}, expires_delta=timedelta(minutes=5))
+    first = user.get_current_user(token)
+    first["username"] = "mutated"  # callers get a copy, the cache is not affected
+    second = user.get_current_user(token)
+    assert second["username"] == "cacheduser"
+    stats = user.token_cache.stats()
+    assert stats["misses"] - before["misses"] == 1
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["entries"] == 1
+
+def test_get_current_user_optional():
+    token = user.create_valid_token({"username": "validuser"}, expires_delta=timedelta(minutes=5))
+    assert user.get_current_user_optional(token)["username"] == "validuser"
+    assert user.get_current_user_optional(None) is None
+    assert user.get_current_user_optional("not-a-jwt") is None
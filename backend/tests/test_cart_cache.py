@@ -0,0 +1,90 @@
+import asyncio
+import time
+from app.core.redis import CacheBackend, CartCache, LocalCacheBackend, LRUCacheBackend, RedisCacheBackend
+
+class FakeRedis:
+    """Stands in for redis.asyncio.Redis: bytes values and expiry through `ex`"""
+
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.store[key]
+            return None
+        return value
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = (value, time.monotonic() + ex if ex is not None else None)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+class UnreachableBackend(CacheBackend):
+    """A cache server that is down"""
+
+    async def get(self, key):
+        raise ConnectionError("cache unreachable")
+
+    async def set(self, key, value, ttl=None):
+        raise ConnectionError("cache unreachable")
+
+    async def delete(self, *keys):
+        raise ConnectionError("cache unreachable")
+
+def test_lru_backend_evicts_least_recently_used():
+    backend = LRUCacheBackend(max_entries=2)
+    backend.set("a", b"1")
+    backend.set("b", b"2")
+    assert backend.get("a") == b"1"  # "b" is now the least recently used
+    backend.set("c", b"3")
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+    assert backend.get("c") == b"3"
+    assert backend.stats()["hits"] == 3
+    assert backend.stats()["misses"] == 1
+
+def test_lru_backend_expires_entries():
+    backend = LRUCacheBackend(default_ttl=0.01)
+    backend.set("a", b"1")
+    assert backend.get("a") == b"1"
+    time.sleep(0.02)
+    assert backend.get("a") is None
+    assert backend.stats()["entries"] == 0
+
+def test_cart_cache_read_write_and_invalidate():
+    async def scenario(cache):
+        await cache.set(b'{"total_items": 1}', '"a-1"', user_id="u1")
+        await cache.set(b'{"total_items": 2}', '"b-2"', session_id="s1")
+        assert await cache.get(user_id="u1") == ('"a-1"', b'{"total_items": 1}')
+        assert (await cache.get(session_id="s1")).body == b'{"total_items": 2}'
+        assert (await cache.get(session_id="s1")).etag == '"b-2"'
+        assert await cache.get(session_id="s2") is None
+        assert await cache.get() is None
+
+        # merge invalidation drops both the user and the anonymous entry
+        await cache.invalidate(user_id="u1", session_id="s1")
+        assert await cache.get(user_id="u1") is None
+        assert await cache.get(session_id="s1") is None
+
+    for backend in (LocalCacheBackend(), RedisCacheBackend(FakeRedis())):
+        asyncio.run(scenario(CartCache(backend, ttl=60)))
+
+def test_cache_errors_count_as_misses():
+    cache = CartCache(UnreachableBackend(), ttl=60)
+    asyncio.run(cache.set(b"{}", '"a-1"', session_id="s1"))
+    asyncio.run(cache.invalidate(session_id="s1"))
+    assert asyncio.run(cache.get(session_id="s1")) is None
+
+def test_redis_backend_prefixes_keys_and_sets_ttl():
+    client = FakeRedis()
+    cache = CartCache(RedisCacheBackend(client, prefix="test:"), ttl=0.01)
+    asyncio.run(cache.set(b"{}", '"a-1"', session_id="s1"))
+    assert "test:cart:session:s1" in client.store
+    time.sleep(0.02)
+    assert asyncio.run(cache.get(session_id="s1")) is None
@@ -0,0 +1,54 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine, insert, inspect, select, text
+from app.core.database import Base
+from app.models import user  # noqa: registers the users table referenced by carts
+from app.models.cart import Cart
+from app.models.cart_item import CartItem
+from app.services.cart_migrations import migrate_cart_tables
+
+def test_older_cart_tables_are_brought_up_to_date(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'older.db'}")
+    Base.metadata.create_all(engine)
+    cart_id, first_line, now = uuid.uuid4(), uuid.uuid4(), datetime.now(timezone.utc)
+    line = {"cart_id": cart_id, "created_at": now, "updated_at": now}
+    with engine.begin() as connection:
+        connection.execute(insert(Cart).values(id=cart_id, session_id="older", created_at=now, updated_at=now))
+        # Before the unique index, adding a product twice could leave two lines
+        connection.execute(text("DROP INDEX ux_cart_items_cart_product"))
+        connection.execute(insert(CartItem), [
+            {**line, "id": first_line, "product_id": "sku-1", "quantity": 1, "price_snapshot": "9.99"},
+            {**line, "id": uuid.uuid4(), "product_id": "sku-2", "quantity": 4, "price_snapshot": None},
+            {**line, "id": uuid.uuid4(), "product_id": "sku-1", "quantity": 2, "price_snapshot": None,
+             "created_at": now + timedelta(seconds=1), "updated_at": now + timedelta(seconds=1)},
+        ])
+        connection.execute(text("ALTER TABLE carts DROP COLUMN version"))
+        connection.execute(text("DROP INDEX ix_cart_items_cart_created_id"))
+        connection.execute(text("DROP INDEX ix_carts_session_updated_at"))
+
+    assert migrate_cart_tables(engine) == [
+        "carts.version added", "ux_cart_items_cart_product created (1 duplicate cart lines merged)",
+        "ix_cart_items_cart_created_id created", "ix_carts_session_updated_at created"
+    ]
+    with engine.connect() as connection:
+        lines = connection.execute(
+            select(CartItem.id, CartItem.product_id, CartItem.quantity, CartItem.price_snapshot).order_by(CartItem.product_id)
+        ).all()
+        assert connection.execute(select(Cart.version)).scalar_one() == 1
+    assert lines == [(first_line, "sku-1", 3, "9.99"), (lines[1].id, "sku-2", 4, None)]
+    assert {"ux_cart_items_cart_product", "ix_cart_items_cart_created_id"} <= {
+        index["name"] for index in inspect(engine).get_indexes("cart_items")
+    }
+    with engine.connect() as connection:
+        # Only anonymous carts are indexed
+        index_sql = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE name = 'ix_carts_session_updated_at'")
+        ).scalar_one()
+    assert "WHERE session_id IS NOT NULL" in index_sql
+
+    # Running it again changes nothing
+    assert migrate_cart_tables(engine) == [
+        "carts.version already present", "ux_cart_items_cart_product already present",
+        "ix_cart_items_cart_created_id already present", "ix_carts_session_updated_at already present"
+    ]
+    engine.dispose()
@@ -0,0 +1,226 @@
+import pytest
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event, select
+from app.core import database
+from app.core.database import DatabaseManager
+from app.models.cart import Cart
+from app.schemas.cart_item import AddToCartRequest, BatchAddOperation, BatchRemoveOperation, BatchUpdateOperation, UpdateCartItemRequest
+from app.services.cart import CartService, CartVersionConflictError, virtual_cart_id
+from app.services.cart_item import CartItemNotFoundError, CartItemService
+from app.services.cart_sweeper import CartSweeper
+from app.utils.etag import CartVersion, cart_etag
+from app.utils.pagination import decode_cursor, encode_cursor
+
+def test_adding_a_product_again_adds_up_its_quantity(db):
+    db.expire_on_commit = False
+    first = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=1, price_snapshot="9.99"), session_id="upsert")
+
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    again = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=2), session_id="upsert")
+    # One statement creates or bumps the cart, one writes the line; the loaded line keeps its price
+    writes = [statement.split(" (")[0] for statement in statements if statement.startswith(("INSERT", "UPDATE"))]
+    assert writes == ["INSERT INTO carts", "INSERT INTO cart_items"]
+    assert again is first
+    assert [(line.product_id, line.quantity, line.price_snapshot) for line in first.cart.items] == [("sku-1", 3, "9.99")]
+
+def test_upserts_fall_back_to_select_then_insert(db, monkeypatch):
+    # A dialect without ON CONFLICT: the same results, statement by statement
+    monkeypatch.delitem(database.UPSERT_INSERTS, "sqlite")
+    CartService.get_or_create_cart(db, session_id="portable")
+    CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=1, price_snapshot="9.99"), session_id="portable")
+    item = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=2), session_id="portable")
+    assert (item.quantity, item.price_snapshot, item.cart.version) == (3, "9.99", 2)
+
+    with pytest.raises(CartVersionConflictError):
+        CartItemService.add_item_to_cart(
+            db, AddToCartRequest(product_id="sku-2"), session_id="portable", expected_version=CartVersion(item.cart.id, 1)
+        )
+    cart = CartItemService.apply_batch(db, [
+        BatchAddOperation(op="add", product_id="sku-1", quantity=1),
+        BatchAddOperation(op="add", product_id="sku-2", quantity=4),
+    ], session_id="portable")
+    assert {line.product_id: line.quantity for line in cart.items} == {"sku-1": 4, "sku-2": 4}
+
+def test_merge_adds_up_shared_products_and_moves_the_rest(db):
+    user_id = uuid.uuid4()
+    user_cart = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=1), user_id=user_id).cart
+    CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=2), session_id="guest")
+    CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p2", quantity=5), session_id="guest")
+
+    merged = CartService.merge_carts(db, user_id, "guest")
+    assert merged.id == user_cart.id
+    assert {line.product_id: line.quantity for line in merged.items} == {"p1": 3, "p2": 5}
+    assert CartService.get_cart(db, session_id="guest") is None
+
+def test_merge_without_a_user_cart_adopts_the_anonymous_one(db):
+    user_id = uuid.uuid4()
+    guest_cart = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=2), session_id="guest").cart
+
+    merged = CartService.merge_carts(db, user_id, "guest")
+    assert (merged.id, merged.user_id, merged.session_id) == (guest_cart.id, user_id, None)
+    assert [(line.product_id, line.quantity) for line in merged.items] == [("p1", 2)]
+
+def test_batch_updates_removes_and_adds_lines(db):
+    keep = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="keep", quantity=1), session_id="bulk")
+    drop = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="drop", quantity=1), session_id="bulk")
+
+    cart = CartItemService.apply_batch(db, [
+        BatchUpdateOperation(op="update", item_id=keep.id, quantity=4),
+        BatchRemoveOperation(op="remove", item_id=drop.id),
+        BatchAddOperation(op="add", product_id="keep", quantity=2),
+        BatchAddOperation(op="add", product_id="new", quantity=3),
+    ], session_id="bulk")
+    assert {line.product_id: line.quantity for line in cart.items} == {"keep": 6, "new": 3}
+
+    # A line outside the cart rejects the whole batch
+    with pytest.raises(CartItemNotFoundError):
+        CartItemService.apply_batch(db, [
+            BatchUpdateOperation(op="update", item_id=keep.id, quantity=1),
+            BatchRemoveOperation(op="remove", item_id=uuid.uuid4()),
+        ], session_id="bulk")
+    # So does a line of another owner's cart, even unconditionally updated by id
+    other = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="other", quantity=1), session_id="other")
+    with pytest.raises(CartItemNotFoundError):
+        CartItemService.apply_batch(db, [BatchUpdateOperation(op="update", item_id=other.id, quantity=9)], session_id="bulk")
+    # And a stale version, checked by the same transaction
+    with pytest.raises(CartVersionConflictError):
+        CartItemService.apply_batch(
+            db, [BatchUpdateOperation(op="update", item_id=keep.id, quantity=1)],
+            session_id="bulk", expected_version=CartVersion(cart.id, cart.version - 1)
+        )
+    db.expire_all()
+    bulk = CartService.get_cart(db, session_id="bulk")
+    assert {line.product_id: line.quantity for line in bulk.items} == {"keep": 6, "new": 3}
+    assert bulk.version == cart.version
+    assert [line.quantity for line in CartService.get_cart(db, session_id="other").items] == [1]
+
+def test_parallel_first_visits_create_one_cart(tmp_path):
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'first-visit.db'}")
+    manager.create_all_tables()
+
+    def first_visit(_):
+        with manager.session_scope() as db:
+            return CartService.get_or_create_cart(db, session_id="first-visit").id
+
+    try:
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            assert len(set(pool.map(first_visit, range(16)))) == 1
+    finally:
+        manager.engine.dispose()
+
+def test_mutations_bump_version_and_reject_stale_expectations(db):
+    cart = CartService.get_or_create_cart(db, session_id="tab-test")
+    assert cart.version == 0
+
+    item = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=1), session_id="tab-test")
+    assert item.cart is cart and cart.version == 1
+
+    # Two tabs both read version 1: the first update wins, the second gets a conflict
+    first = CartVersion(cart.id, 1)
+    CartItemService.update_cart_item(db, item.id, UpdateCartItemRequest(quantity=3), session_id="tab-test", expected_version=first)
+    with pytest.raises(CartVersionConflictError) as excinfo:
+        CartItemService.update_cart_item(
+            db, item.id, UpdateCartItemRequest(quantity=9), session_id="tab-test", expected_version=first
+        )
+    assert excinfo.value.current_version == 2
+
+    reloaded = CartService.get_cart(db, session_id="tab-test")
+    assert reloaded.version == 2
+    assert [line.quantity for line in reloaded.items] == [3]
+
+def test_cart_summary_is_a_single_aggregate_query(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert CartService.get_cart_summary(db, session_id="no-cart") == (0, 0)
+
+    CartService.get_or_create_cart(db, session_id="badge")
+    assert CartService.get_cart_summary(db, session_id="badge") == (0, 0)
+    CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=2), session_id="badge")
+    CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-2", quantity=3), session_id="badge")
+
+    statements.clear()
+    db.expunge_all()
+    assert CartService.get_cart_summary(db, session_id="badge") == (2, 5)
+    assert len(statements) == 1
+    assert len(db.identity_map) == 0
+
+    # The same query carries the cart's version, for the summary ETag
+    cart = CartService.get_cart(db, session_id="badge")
+    etag = cart_etag(cart.id, cart.version, summary=True)
+    assert CartService.get_cart_summary_with_etag(db, session_id="badge") == (etag, 2, 5)
+    assert CartService.get_cart_etag(db, session_id="badge", summary=True) == etag
+    assert CartService.get_cart_summary_with_etag(db, session_id="no-cart") == (
+        cart_etag(virtual_cart_id(session_id="no-cart"), 0, summary=True), 0, 0
+    )
+
+def test_keyset_pages_cover_every_line_once(db):
+    cart = CartService.get_or_create_cart(db, session_id="b2b")
+    # One batch: every line shares created_at, so the id tiebreaker decides the order
+    operations = [BatchAddOperation(op="add", product_id=f"sku-{n}", quantity=1) for n in range(25)]
+    CartItemService.apply_batch(db, operations, session_id="b2b")
+
+    seen, cursor = [], None
+    while True:
+        items, next_key = CartService.get_cart_items_page(
+            db, session_id="b2b", limit=10, after=decode_cursor(cursor) if cursor else None
+        )
+        seen.extend(item.id for item in items)
+        if next_key is None:
+            break
+        cursor = encode_cursor(next_key)
+    assert len(seen) == 25
+    assert seen == sorted(seen, key=lambda item_id: item_id.hex)
+
+    page = CartService.get_cart_first_page(db, session_id="b2b", page_size=10)
+    assert (len(page.cart.items), page.line_count, page.total_items) == (10, 25, 25)
+    assert page.next_key == (page.cart.items[-1].created_at, page.cart.items[-1].id)
+
+def test_sweeper_deletes_only_stale_session_carts_in_batches(db):
+    @contextmanager
+    def session_scope():
+        yield db
+
+    now = datetime.now(timezone.utc)
+    for n in range(5):
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=1), session_id=f"bot-{n}")
+    CartService.get_or_create_cart(db, session_id="fresh")
+
+    # Two days later, with a one day TTL, only the fresh cart is touched again
+    later = now + timedelta(days=2)
+    fresh = CartService.get_cart(db, session_id="fresh")
+    CartService.bump_version(db, fresh.id, later)
+    db.commit()
+
+    report = CartSweeper(session_scope, ttl=60 * 60 * 24, batch_size=2).run(now=later).snapshot()
+    assert (report["carts_removed"], report["items_removed"], report["batches"]) == (5, 5, 3)
+    assert db.scalars(select(Cart.session_id)).all() == ["fresh"]
+
+def test_reads_do_not_create_carts(db):
+    page = CartService.get_cart_first_page(db, session_id="crawler", page_size=10)
+    assert (page.cart.id, page.cart.version, page.cart.items) == (virtual_cart_id(session_id="crawler"), 0, [])
+    assert CartService.get_cart_etag(db, session_id="crawler") == cart_etag(page.cart.id, 0)
+    # One virtual cart per owner: a 304 for one owner's ETag never stands for another's body
+    assert virtual_cart_id(session_id="crawler") != virtual_cart_id(session_id="other")
+    assert virtual_cart_id(user_id="crawler") != virtual_cart_id(session_id="crawler")
+    assert db.scalars(select(Cart)).all() == []
+
+    # The first mutation creates the row; a client that saw the virtual cart expects version 0
+    virtual = CartVersion(page.cart.id, 0)
+    CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1"), session_id="crawler", expected_version=virtual)
+    with pytest.raises(CartVersionConflictError):
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1"), session_id="crawler", expected_version=virtual)
+
+    # A row created but never written to (version 0) still matches the virtual cart
+    CartService.get_or_create_cart(db, session_id="empty")
+    CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1"), session_id="empty", expected_version=virtual)
+
+    # An expectation of a real cart fails when the owner has none
+    with pytest.raises(CartVersionConflictError) as excinfo:
+        CartItemService.add_item_to_cart(
+            db, AddToCartRequest(product_id="sku-1"), session_id="swept", expected_version=CartVersion(None, 4)
+        )
+    assert (excinfo.value.cart_id, excinfo.value.current_version) == (virtual_cart_id(session_id="swept"), 0)
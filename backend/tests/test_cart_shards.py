@@ -0,0 +1,156 @@
+import uuid
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+from app.core.database import DatabaseManager, owner_key, shard_index
+from app.models.cart import Cart
+from app.models.cart_item import CartItemTransfer
+from app.schemas.cart_item import AddToCartRequest
+from app.services import cart as cart_service, cart_shards
+from app.services.cart import CartService
+from app.services.cart_item import CartItemService
+from app.services.cart_shards import ShardRebalancer
+
+def sqlite_urls(tmp_path, *names):
+    return [f"sqlite:///{tmp_path / name}.db" for name in names]
+
+def session_ids_on(shard, shard_count, count):
+    """Session ids whose carts live on `shard`"""
+    session_ids = []
+    while len(session_ids) < count:
+        session_id = str(uuid.uuid4())
+        if shard_index(owner_key(session_id=session_id), shard_count) == shard:
+            session_ids.append(session_id)
+    return session_ids
+
+def cart_counts(urls):
+    counts = []
+    for url in urls:
+        engine = create_engine(url)
+        with Session(engine) as db:
+            counts.append(db.scalar(select(func.count(Cart.id))))
+        engine.dispose()
+    return counts
+
+def test_carts_are_stored_on_the_owner_shard(tmp_path):
+    primary, *shards = sqlite_urls(tmp_path, "primary", "shard-0", "shard-1")
+    manager = DatabaseManager(primary, shard_urls=shards)
+    manager.create_all_tables()
+
+    with manager.session_scope() as db:
+        for sid in session_ids_on(0, 2, 3) + session_ids_on(1, 2, 2):
+            CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=1), session_id=sid)
+        sid = session_ids_on(1, 2, 1)[0]
+        assert CartService.get_cart_summary(db, session_id=sid) == (0, 0)
+        CartService.get_or_create_cart(db, session_id=sid)
+
+    assert cart_counts([primary, *shards]) == [0, 3, 3]
+
+def test_merge_across_shards(tmp_path):
+    primary, *shards = sqlite_urls(tmp_path, "primary", "shard-0", "shard-1")
+    manager = DatabaseManager(primary, shard_urls=shards)
+    manager.create_all_tables()
+    user_id = uuid.uuid4()
+    user_shard = shard_index(owner_key(user_id=user_id), 2)
+    session_id = session_ids_on(1 - user_shard, 2, 1)[0]
+
+    with manager.session_scope() as db:
+        user_cart = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=1), user_id=user_id).cart
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=2), session_id=session_id)
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p2", quantity=5), session_id=session_id)
+
+        merged = CartService.merge_carts(db, user_id, session_id)
+        assert merged.id == user_cart.id
+        assert {item.product_id: item.quantity for item in merged.items} == {"p1": 3, "p2": 5}
+        assert CartService.get_cart(db, session_id=session_id) is None
+
+    assert sorted(cart_counts(shards)) == [0, 1]
+
+def test_rebalancer_backfills_and_moves_only_misplaced_carts(tmp_path):
+    primary, *shards = sqlite_urls(tmp_path, "primary", "shard-0", "shard-1", "shard-2")
+    unsharded = DatabaseManager(primary)
+    unsharded.create_all_tables()
+    session_ids = [str(uuid.uuid4()) for _ in range(30)]
+    with unsharded.session_scope() as db:
+        for sid in session_ids:
+            CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=2), session_id=sid)
+
+    # Backfill two shards from the primary
+    rebalancer = ShardRebalancer([primary, *shards[:2]], shards[:2], batch_size=7)
+    report = rebalancer.run().snapshot()
+    rebalancer.dispose()
+    assert (report["carts_moved"], report["items_moved"]) == (30, 30)
+    assert cart_counts([primary, *shards[:2]])[0] == 0
+
+    # Growing to three shards only moves the carts the new shard takes over
+    rebalancer = ShardRebalancer(shards, shards)
+    report = rebalancer.run().snapshot()
+    rebalancer.dispose()
+    expected = sum(shard_index(owner_key(session_id=sid), 3) == 2 for sid in session_ids)
+    assert report["carts_moved"] == expected
+    assert cart_counts(shards) == [
+        sum(shard_index(owner_key(session_id=sid), 3) == shard for sid in session_ids) for shard in range(3)
+    ]
+
+    sharded = DatabaseManager(primary, shard_urls=shards)
+    with sharded.session_scope() as db:
+        assert all(CartService.get_cart_summary(db, session_id=sid) == (1, 2) for sid in session_ids)
+
+def transfer_records(url):
+    engine = create_engine(url)
+    with Session(engine) as db:
+        count = db.scalar(select(func.count()).select_from(CartItemTransfer))
+    engine.dispose()
+    return count
+
+def unreachable(*args, **kwargs):
+    raise ConnectionError("source database unreachable")
+
+def test_interrupted_moves_and_merges_do_not_add_quantities_twice(tmp_path, monkeypatch):
+    primary, shard = sqlite_urls(tmp_path, "primary", "shard")
+    unsharded = DatabaseManager(primary)
+    unsharded.create_all_tables()
+    sharded = DatabaseManager(primary, shard_urls=[shard])
+    sharded.create_all_tables()
+    with unsharded.session_scope() as db:
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=2), session_id="moving")
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p2", quantity=1), session_id="moving")
+    # The owner wrote after the deploy, before the move: a new cart on the shard, merged into by the move
+    with sharded.session_scope() as db:
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=1), session_id="moving")
+
+    # The first run copies the lines, then fails to delete them from the source; the second run copies again
+    with monkeypatch.context() as patch:
+        patch.setattr(cart_shards, "delete", unreachable)
+        with pytest.raises(ConnectionError):
+            ShardRebalancer([primary], [shard]).run()
+    rebalancer = ShardRebalancer([primary], [shard])
+    assert rebalancer.run().snapshot()["items_moved"] == 0
+    rebalancer.dispose()
+
+    with sharded.session_scope() as db:
+        cart = CartService.get_cart(db, session_id="moving")
+        assert {item.product_id: item.quantity for item in cart.items} == {"p1": 3, "p2": 1}
+    assert cart_counts([primary]) == [0]
+    assert transfer_records(shard) == 0
+
+    # Same for a cross-shard merge that could not delete the anonymous cart
+    shards = sqlite_urls(tmp_path, "shard-0", "shard-1")
+    manager = DatabaseManager(primary, shard_urls=shards)
+    manager.create_all_tables()
+    user_id = uuid.uuid4()
+    user_shard = shard_index(owner_key(user_id=user_id), 2)
+    session_id = session_ids_on(1 - user_shard, 2, 1)[0]
+    with manager.session_scope() as db:
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=1), user_id=user_id)
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="p1", quantity=2), session_id=session_id)
+    with monkeypatch.context() as patch:
+        patch.setattr(cart_service, "delete", unreachable)
+        with pytest.raises(ConnectionError):
+            with manager.session_scope() as db:
+                CartService.merge_carts(db, user_id, session_id)
+    with manager.session_scope() as db:
+        merged = CartService.merge_carts(db, user_id, session_id)
+        assert {item.product_id: item.quantity for item in merged.items} == {"p1": 3}
+        assert CartService.get_cart(db, session_id=session_id) is None
+    assert transfer_records(shards[user_shard]) == 0
@@ -0,0 +1,93 @@
+import threading
+import pytest
+from contextlib import contextmanager
+from app.core.database import DatabaseManager
+from app.schemas.cart_item import AddToCartRequest
+from app.services.cart import CartService
+from app.services.cart_item import CartItemService
+from app.services.cart_write_behind import CartWriteBehind
+
+def make_write_behind(db):
+    @contextmanager
+    def session_scope():
+        yield db
+    return CartWriteBehind(enabled=True, flush_interval=60, max_pending=100, session_scope=session_scope)
+
+def test_updates_are_coalesced_into_one_flush(db):
+    item = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=1), session_id="stepper")
+    cart = item.cart
+    write_behind = make_write_behind(db)
+
+    for quantity in range(2, 12):
+        write_behind.submit(cart, item.id, quantity, session_id="stepper")
+    assert len(write_behind.buffer) == 1
+    assert write_behind.has_pending(session_id="stepper")
+    assert not write_behind.has_pending(session_id="someone-else")
+
+    # The projection shows the buffered quantity before anything is stored
+    db.expire_all()
+    projected = write_behind.project(CartService.get_cart(db, session_id="stepper"), session_id="stepper")
+    assert [line.quantity for line in projected.items] == [11]
+    assert not db.dirty
+
+    assert write_behind.flush() == 1
+    db.expire_all()
+    stored = CartService.get_cart(db, session_id="stepper")
+    assert [line.quantity for line in stored.items] == [11]
+    assert stored.version == 2  # added, one flush
+    assert write_behind.flush() == 0
+
+def test_flush_skips_removed_lines_and_restores_on_failure(db):
+    item = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=1), session_id="gone")
+    cart = item.cart
+    write_behind = make_write_behind(db)
+
+    write_behind.submit(cart, item.id, 5, session_id="gone")
+    CartItemService.remove_cart_item(db, item.id, session_id="gone")
+    assert write_behind.flush() == 0
+
+    @contextmanager
+    def broken_scope():
+        raise ConnectionError("database down")
+        yield
+    write_behind.session_scope = broken_scope
+    write_behind.submit(cart, item.id, 5, session_id="gone")
+    with pytest.raises(ConnectionError):
+        write_behind.flush()
+    assert write_behind.buffer.for_owner(session_id="gone")[item.id].quantity == 5
+
+def test_an_older_quantity_is_never_committed_after_a_newer_one(tmp_path):
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'cart.db'}")
+    manager.create_all_tables()
+    with manager.session_scope() as db:
+        item = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1"), session_id="race")
+        cart = item.cart
+
+    drained, release = threading.Event(), threading.Event()
+    @contextmanager
+    def slow_scope():
+        # The periodic flush has drained quantity 5 and is slow to write it
+        drained.set()
+        release.wait(5)
+        with manager.session_scope() as db:
+            yield db
+    write_behind = make_write_behind(None)
+    write_behind.session_scope = slow_scope
+    write_behind.submit(cart, item.id, 5, session_id="race")
+    periodic = threading.Thread(target=write_behind.flush)
+    periodic.start()
+    drained.wait(5)
+
+    # Meanwhile quantity 7 is buffered and the owner's next request flushes it
+    write_behind.submit(cart, item.id, 7, session_id="race")
+    write_behind.session_scope = manager.session_scope
+    owner_flush = threading.Thread(target=write_behind.flush, kwargs={"session_id": "race"})
+    owner_flush.start()
+    owner_flush.join(0.5)  # would commit 7 here, before 5, if flushes could overlap
+    release.set()
+    periodic.join(5)
+    owner_flush.join(5)
+
+    with manager.session_scope() as db:
+        assert [line.quantity for line in CartService.get_cart(db, session_id="race").items] == [7]
+    manager.engine.dispose()
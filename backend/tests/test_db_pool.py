@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+from app.core.config import settings
+from app.core.database import DatabaseManager, TimedAsyncAdaptedQueuePool, TimedQueuePool, pool_options, pool_status
+
+def test_pool_options_come_from_settings():
+    assert pool_options("sqlite:///cart.db") == {}
+    options = pool_options("postgresql://db/cornucopia")
+    assert options["poolclass"] is TimedQueuePool
+    assert (options["pool_size"], options["max_overflow"], options["pool_timeout"]) == (
+        settings.CORNU_DB_POOL_SIZE, settings.CORNU_DB_MAX_OVERFLOW, settings.CORNU_DB_POOL_TIMEOUT
+    )
+    assert pool_options("postgresql+asyncpg://db/cornucopia", is_async=True)["poolclass"] is TimedAsyncAdaptedQueuePool
+
+def test_timed_pool_reports_checkouts_and_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        assert pool_status(engine)["checked_out"] == 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+    status = pool_status(engine)
+    assert (status["pool"], status["size"], status["checked_out"]) == ("TimedQueuePool", 1, 0)
+    assert (status["checkouts"], status["timeouts"]) == (1, 1)
+    assert status["wait_seconds_max"] >= 0.05
+    engine.dispose()
+
+def test_session_scope_rolls_back_and_releases_on_error(tmp_path):
+    manager = DatabaseManager(f"sqlite:///{tmp_path / 'scope.db'}")
+    with manager.session_scope() as db:
+        db.execute(text("CREATE TABLE notes (body TEXT)"))
+        db.commit()
+    with pytest.raises(RuntimeError):
+        with manager.session_scope() as db:
+            db.execute(text("INSERT INTO notes VALUES ('lost')"))
+            raise RuntimeError("request failed")
+    with manager.session_scope() as db:
+        assert db.execute(text("SELECT count(*) FROM notes")).scalar() == 0
+    manager.engine.dispose()
@@ -0,0 +1,47 @@
+import asyncio
+import uuid
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from app.utils.etag import CartVersion, cart_etag, etag_matches, expected_cart_version, parse_cart_etag
+
+def make_request(headers=None):
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({"type": "http", "method": "PUT", "path": "/", "headers": raw_headers})
+
+def test_cart_etag_round_trip():
+    cart_id = uuid.uuid4()
+    etag = cart_etag(cart_id, 7)
+    assert etag == f'"{cart_id.hex}-7"'
+    assert parse_cart_etag(etag) == CartVersion(cart_id, 7)
+    assert parse_cart_etag('W/"abc"') is None
+
+    # The first-page representation has its own ETag, naming the same version
+    page_etag = cart_etag(cart_id, 7, page_size=20)
+    assert page_etag not in (etag, cart_etag(cart_id, 7, page_size=50))
+    assert parse_cart_etag(page_etag) == CartVersion(cart_id, 7)
+
+    summary_etag = cart_etag(cart_id, 7, summary=True)
+    assert summary_etag not in (etag, page_etag)
+    assert parse_cart_etag(summary_etag) == CartVersion(cart_id, 7)
+
+def test_etag_matches_if_none_match_lists():
+    etag = '"abc-1"'
+    assert etag_matches('"abc-1"', etag)
+    assert etag_matches('"xyz-2", W/"abc-1"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abc-2"', etag)
+    assert not etag_matches(None, etag)
+
+def test_expected_cart_version_sources():
+    cart_id = uuid.uuid4()
+    assert asyncio.run(expected_cart_version(make_request(), None)) is None
+    assert asyncio.run(expected_cart_version(make_request(), 3)) == CartVersion(None, 3)
+    assert asyncio.run(expected_cart_version(make_request({"If-Match": "*"}), None)) is None
+    # If-Match wins over the query parameter
+    expected = asyncio.run(expected_cart_version(make_request({"If-Match": cart_etag(cart_id, 5)}), 3))
+    assert expected == CartVersion(cart_id, 5)
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(expected_cart_version(make_request({"If-Match": 'W/"weak"'}), None))
+    assert excinfo.value.status_code == 412
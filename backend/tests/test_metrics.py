@@ -0,0 +1,46 @@
+import threading
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.core.metrics import MetricsRegistry, http_requests
+from app.core.middleware import MetricsMiddleware
+
+def test_values_recorded_by_many_threads_are_merged():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ("route",))
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+    def record():
+        for _ in range(1000):
+            requests.inc(("/cart/",))
+            latency.observe(0.5)
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latency.observe(0.05)
+
+    lines = registry.render().splitlines()
+    assert 'requests_total{route="/cart/"} 4000' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 4001' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4001' in lines
+    assert "# TYPE latency_seconds histogram" in lines
+
+def test_requests_are_labelled_with_the_route_template():
+    app = FastAPI()
+
+    @app.get("/things/{thing_id}")
+    async def get_thing(thing_id: int):
+        return {"id": thing_id}
+
+    app.add_middleware(MetricsMiddleware)
+    with TestClient(app) as client:
+        client.get("/things/1")
+        client.get("/things/2")
+        client.get("/missing")
+
+    lines = "\n".join(http_requests.render())
+    assert 'cornu_http_requests_total{method="GET",route="/things/{thing_id}",status="200"} 2' in lines
+    assert 'route="unmatched",status="404"' in lines
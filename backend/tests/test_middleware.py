@@ -0,0 +1,90 @@
+import asyncio
+from app.core.config import settings
+from app.core.middleware import QueryProfilerMiddleware, ReadYourWritesMiddleware, SecurityHeadersMiddleware
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+def make_middleware():
+    return SecurityHeadersMiddleware(
+        ok_app,
+        allow_origins=["http://localhost:5173"],
+        allow_credentials=True,
+        allow_methods=["GET", "POST"],
+        allow_headers=["Authorization", "X-CSRF-Token"],
+        expose_headers=["ETag"],
+    )
+
+def call(middleware, method="GET", headers=()):
+    scope = {"type": "http", "method": method, "path": "/", "headers": list(headers)}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    start = messages[0]
+    return start["status"], dict(start["headers"]), messages
+
+def test_security_headers_added_to_every_response():
+    status, headers, _ = call(make_middleware())
+    assert status == 200
+    assert headers[b"x-frame-options"] == b"DENY"
+    assert headers[b"content-security-policy"].startswith(b"default-src 'self';")
+    assert headers[b"content-type"] == b"application/json"
+    assert b"access-control-allow-origin" not in headers
+
+def test_cors_headers_for_allowed_origin_only():
+    _, headers, _ = call(make_middleware(), headers=[(b"origin", b"http://localhost:5173")])
+    assert headers[b"access-control-allow-origin"] == b"http://localhost:5173"
+    assert headers[b"access-control-expose-headers"] == b"ETag"
+    assert headers[b"access-control-allow-credentials"] == b"true"
+
+    _, headers, _ = call(make_middleware(), headers=[(b"origin", b"https://evil.example")])
+    assert b"access-control-allow-origin" not in headers
+    assert headers[b"x-content-type-options"] == b"nosniff"
+
+def test_preflight_is_answered_without_the_app():
+    status, headers, messages = call(make_middleware(), method="OPTIONS", headers=[
+        (b"origin", b"http://localhost:5173"),
+        (b"access-control-request-method", b"POST"),
+        (b"access-control-request-headers", b"content-type, x-csrf-token"),
+    ])
+    assert status == 200
+    assert headers[b"access-control-allow-origin"] == b"http://localhost:5173"
+    assert b"POST" in headers[b"access-control-allow-methods"]
+    assert messages[1]["body"] == b"OK"
+
+def test_preflight_rejects_disallowed_method_and_headers():
+    status, _, messages = call(make_middleware(), method="OPTIONS", headers=[
+        (b"origin", b"http://localhost:5173"),
+        (b"access-control-request-method", b"DELETE"),
+        (b"access-control-request-headers", b"x-unknown"),
+    ])
+    assert status == 400
+    assert messages[1]["body"] == b"Disallowed CORS method, headers"
+
+def test_read_primary_cookie_after_successful_writes_only():
+    middleware = ReadYourWritesMiddleware(ok_app, cookie_name="cornu_read_primary", ttl=5)
+    _, headers, _ = call(middleware, method="POST")
+    assert headers[b"set-cookie"].startswith(b"cornu_read_primary=")
+    assert b"Max-Age=5" in headers[b"set-cookie"]
+    _, headers, _ = call(middleware, method="GET")
+    assert b"set-cookie" not in headers
+
+def test_query_profile_header_only_for_internal_token_holders(monkeypatch):
+    middleware = QueryProfilerMiddleware(ok_app)
+    monkeypatch.setattr(settings, "CORNU_INTERNAL_TOKEN", "ops-token")
+    _, headers, _ = call(middleware)
+    assert b"x-query-profile" not in headers
+    _, headers, _ = call(middleware, headers=[(b"x-internal-token", b"wrong")])
+    assert b"x-query-profile" not in headers
+    # Authorization is the user's token, it never turns the header on
+    _, headers, _ = call(middleware, headers=[(b"authorization", b"Bearer ops-token")])
+    assert b"x-query-profile" not in headers
+    _, headers, _ = call(middleware, headers=[(b"authorization", b"Bearer user-token"), (b"x-internal-token", b"ops-token")])
+    assert headers[b"x-query-profile"].startswith(b"queries=0;")
@@ -0,0 +1,51 @@
+import uuid
+import pytest
+from app.core.profiling import assert_max_queries, profile_queries
+from app.schemas.cart_item import AddToCartRequest, UpdateCartItemRequest
+from app.services.cart import CartService
+from app.services.cart_item import CartItemService
+
+def fill_cart(db, session_id, lines):
+    for i in range(lines):
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id=f"sku-{i}", quantity=1), session_id=session_id)
+    db.expunge_all()
+
+def test_cart_code_paths_stay_within_their_query_budget(db):
+    fill_cart(db, "budget", 20)
+
+    with assert_max_queries(1):
+        CartService.get_cart_summary(db, session_id="budget")
+    with assert_max_queries(3):
+        CartService.get_cart_first_page(db, session_id="budget", page_size=5)
+    with assert_max_queries(2):
+        CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=1), session_id="new-cart")
+    with assert_max_queries(3):
+        item = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-new", quantity=1), session_id="budget")
+    item_id = item.id
+    with assert_max_queries(3):
+        CartItemService.update_cart_item(db, item_id, UpdateCartItemRequest(quantity=4), session_id="budget")
+
+    # Set based: the statement count does not grow with the number of lines
+    user_id = uuid.uuid4()
+    fill_cart(db, "anonymous", 25)
+    CartService.get_or_create_cart(db, user_id=user_id)
+    with assert_max_queries(7):
+        merged = CartService.merge_carts(db, user_id, "anonymous")
+    assert len(merged.items) == 25
+
+def test_repeated_statements_are_flagged_and_over_budget_blocks_fail(db):
+    for session_id in ("a", "b", "c"):
+        fill_cart(db, session_id, 1)
+
+    with profile_queries(repeat_threshold=3) as profile:
+        for session_id in ("a", "b", "c"):
+            CartService.get_cart(db, session_id=session_id)
+    suspects = profile.n_plus_one_suspects()
+    assert [suspect["count"] for suspect in suspects] == [3]
+    assert suspects[0]["call_sites"][0].startswith("app/services/cart.py:")
+    assert profile.header().startswith("queries=3; time_ms=")
+
+    with pytest.raises(AssertionError, match="expected at most 1 queries, 3 were issued"):
+        with assert_max_queries(1):
+            for session_id in ("a", "b", "c"):
+                CartService.get_cart(db, session_id=session_id)
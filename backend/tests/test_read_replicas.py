@@ -0,0 +1,76 @@
+import asyncio
+import sqlite3
+import time
+from sqlalchemy import text
+from starlette.requests import Request
+from app.core.database import READ_PRIMARY_COOKIE, DatabaseManager, Replica, is_replica_session
+
+def sqlite_file(path, name):
+    """SQLite database standing in for one server, with a table telling which one answered"""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE marker (name TEXT)")
+    conn.execute("INSERT INTO marker VALUES (?)", (name,))
+    conn.commit()
+    conn.close()
+    return f"sqlite:///{path}"
+
+def make_request(cookies=None):
+    cookie = "; ".join(f"{name}={value}" for name, value in (cookies or {}).items())
+    headers = [(b"cookie", cookie.encode())] if cookie else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+async def served_by(manager, request):
+    dependency = manager.get_async_read_db(request)
+    db = await dependency.__anext__()
+    try:
+        name = (await db.execute(text("SELECT name FROM marker"))).scalar_one()
+        return name, is_replica_session(db)
+    finally:
+        await dependency.aclose()
+
+def make_manager(tmp_path, *replicas):
+    return DatabaseManager(
+        sqlite_file(tmp_path / "primary.db", "primary"),
+        replica_urls=[sqlite_file(tmp_path / f"{name}.db", name) for name in replicas]
+    )
+
+def test_reads_round_robin_over_replicas_and_sticky_clients_read_primary(tmp_path):
+    manager = make_manager(tmp_path, "replica-1", "replica-2")
+
+    async def scenario():
+        anonymous = [await served_by(manager, make_request()) for _ in range(4)]
+        sticky = await served_by(manager, make_request({READ_PRIMARY_COOKIE: f"{time.time() + 5:.3f}"}))
+        expired = await served_by(manager, make_request({READ_PRIMARY_COOKIE: f"{time.time() - 1:.3f}"}))
+        await manager.async_engine.dispose()
+        for replica in manager.replicas.replicas:
+            await replica.async_engine.dispose()
+        return anonymous, sticky, expired
+
+    anonymous, sticky, expired = asyncio.run(scenario())
+    assert [name for name, _ in anonymous] == ["replica-1", "replica-2", "replica-1", "replica-2"]
+    assert all(on_replica for _, on_replica in anonymous)
+    assert sticky == ("primary", False)
+    assert expired[1] is True
+
+def test_unhealthy_replicas_are_skipped(tmp_path):
+    manager = make_manager(tmp_path, "replica-1")
+    # A replica that can't be reached (its directory does not exist)
+    manager.replicas.replicas.append(Replica(f"sqlite:///{tmp_path}/missing/replica.db"))
+    manager.replicas.retry_after = 60
+
+    async def scenario():
+        await manager.replicas.check_all()
+        names = [(await served_by(manager, make_request()))[0] for _ in range(3)]
+        # With every replica down, reads fall back to the primary
+        manager.replicas.replicas[0].mark_down(RuntimeError("gone"))
+        fallback = await served_by(manager, make_request())
+        await manager.async_engine.dispose()
+        for replica in manager.replicas.replicas:
+            await replica.async_engine.dispose()
+        return names, fallback
+
+    names, fallback = asyncio.run(scenario())
+    assert [replica.healthy for replica in manager.replicas.replicas] == [False, False]
+    assert names == ["replica-1"] * 3
+    assert fallback == ("primary", False)
+    assert manager.pool_status()["replicas"][1]["last_error"]
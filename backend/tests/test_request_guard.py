@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+from app.core.security import RequestGuard, csrf_protect
+from fastapi import HTTPException
+from starlette.requests import Request
+
+def make_request(method="POST", headers=None):
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()]
+    return Request({"type": "http", "method": method, "path": "/", "headers": raw_headers})
+
+def test_safe_methods_pass_without_checks():
+    guard = RequestGuard()
+    asyncio.run(guard(make_request("GET", {"Origin": "https://evil.example"})))
+
+def test_unsafe_request_needs_allowed_origin_and_csrf_token():
+    guard = RequestGuard()
+    token = csrf_protect.generate_csrf_token()
+    asyncio.run(guard(make_request(headers={"Origin": "http://localhost:5173", "X-CSRF-Token": token})))
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(guard(make_request(headers={"Origin": "https://evil.example", "X-CSRF-Token": token})))
+    assert excinfo.value.detail == "Request origin validation failed"
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(guard(make_request(headers={"Referer": "https://evil.example/page", "X-CSRF-Token": token})))
+    assert excinfo.value.status_code == 403
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(guard(make_request(headers={"Origin": "http://localhost:5173"})))
+    assert excinfo.value.detail == "CSRF token missing"
+
+def test_csrf_token_validation_is_cached_but_still_checked():
+    token = csrf_protect.generate_csrf_token()
+    assert csrf_protect.validate_csrf_token(token)
+    assert csrf_protect.validate_csrf_token(token)  # served from the validated-token cache
+    timestamp, random_value, signature = token.split(":")
+    assert not csrf_protect.validate_csrf_token(f"{timestamp}:{random_value}:{'0' * len(signature)}")
+    assert not csrf_protect.validate_csrf_token("garbage")
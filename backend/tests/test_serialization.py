@@ -0,0 +1,30 @@
+import json
+from datetime import datetime, timezone
+from app.schemas.cart import CartResponse
+from app.schemas.cart_item import AddToCartRequest, UpdateCartItemRequest
+from app.services.cart import CartService
+from app.services.cart_item import CartItemService
+from app.utils.serialization import serialize_cart_response
+from benchmarks.fixtures import make_cart
+
+def test_fast_path_matches_pydantic_response():
+    for lines in (0, 1, 25):
+        cart = make_cart(lines)
+        for n, item in enumerate(cart.items):
+            # Both kinds of datetime and both kinds of price
+            item.updated_at = datetime.now(timezone.utc)
+            item.price_snapshot = "9.99" if n % 2 else None
+        total_items = sum(item.quantity for item in cart.items)
+        expected = CartResponse(cart=cart, total_items=total_items).model_dump_json()
+        assert json.loads(serialize_cart_response(cart, total_items)) == json.loads(expected)
+
+def test_timestamps_serialize_the_same_written_or_read(db):
+    db.expire_on_commit = False  # like the async sessions: responses use the values just written
+    item = CartItemService.add_item_to_cart(db, AddToCartRequest(product_id="sku-1", quantity=1), session_id="tz")
+    CartItemService.update_cart_item(db, item.id, UpdateCartItemRequest(quantity=2), session_id="tz")
+    written = json.loads(serialize_cart_response(item.cart, 2))["cart"]
+
+    db.expunge_all()
+    read = json.loads(serialize_cart_response(CartService.get_cart(db, session_id="tz"), 2))["cart"]
+    assert written["updated_at"] == read["updated_at"]
+    assert read["updated_at"].endswith("Z") and read["items"][0]["updated_at"].endswith("Z")
@@ -1,7 +1,10 @@
 from backend.app.core.database import db_manager 
 from backend.app.models import user, cart, cart_item  # noqa
+from database._migrate_carts import migrate
 
 if __name__ == "__main__":
 
     db_manager.create_all_tables()
-    print("Database tables created successfully.")
\ No newline at end of file
+    # create_all skips tables that exist: bring older cart tables up to date
+    migrate()
+    print("Database tables created successfully.")
@@ -0,0 +1,17 @@
+from backend.app.core.database import db_manager
+from backend.app.models import user, cart, cart_item  # noqa
+from backend.app.services.cart_migrations import migrate_cart_tables
+
+# Run once on databases created by an earlier API version, before starting the new one: the
+# add-to-cart upsert needs ux_cart_items_cart_product, and responses need carts.version.
+# _create_tables.py runs it too. Databases already up to date are left alone.
+
+def migrate():
+    engines = [("primary", db_manager.engine)] + [(f"shard {n}", shard.engine) for n, shard in enumerate(db_manager.shards)]
+    for name, engine in engines:
+        for message in migrate_cart_tables(engine):
+            print(f"{name}: {message}.")
+
+if __name__ == "__main__":
+
+    migrate()
@@ -0,0 +1,37 @@
+import argparse
+from backend.app.models import user, cart, cart_item  # noqa
+from backend.app.services.cart_shards import ShardRebalancer
+from backend.app.core.config import settings
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Move carts to the shard their owner hashes to: backfill the shards from the primary, or rebalance after the shard list changed"
+    )
+    parser.add_argument(
+        "--source", action="append", dest="sources", metavar="DB_URL",
+        help="database to take carts from, repeatable (default: the primary and the target shards)"
+    )
+    parser.add_argument(
+        "--target", action="append", dest="targets", metavar="DB_URL",
+        help="shard, repeatable and in order (default: CORNU_DB_SHARD_URLS)"
+    )
+    parser.add_argument("--batch-size", type=int, default=500, help="carts read per query")
+    parser.add_argument("--dry-run", action="store_true", help="only count the carts that would move")
+    args = parser.parse_args()
+
+    targets = args.targets or settings.CORNU_DB_SHARD_URLS
+    if not targets:
+        parser.error("no target shards: set CORNU_DB_SHARD_URLS or pass --target")
+    sources = args.sources or [settings.CORNU_DB_URL, *targets]
+
+    rebalancer = ShardRebalancer(sources, targets, batch_size=args.batch_size)
+    try:
+        report = rebalancer.run(dry_run=args.dry_run).snapshot()
+    finally:
+        rebalancer.dispose()
+    verb = "Would move" if args.dry_run else "Moved"
+    print(
+        f"{verb} {report['carts_moved']} of {report['carts_scanned']} carts ({report['items_moved']} cart items, "
+        f"{report['carts_merged']} merged into an existing cart) in {report['total_ms']} ms."
+    )
@@ -0,0 +1,18 @@
+import argparse
+from backend.app.models import user, cart, cart_item  # noqa
+from backend.app.services.cart_sweeper import CartSweeper
+from backend.app.core.config import settings
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Delete anonymous carts that have not been updated for a while")
+    parser.add_argument("--ttl", type=int, default=settings.CORNU_CART_SWEEP_TTL, help="age in seconds after which a session cart is stale")
+    parser.add_argument("--batch-size", type=int, default=settings.CORNU_CART_SWEEP_BATCH_SIZE, help="carts deleted per transaction")
+    args = parser.parse_args()
+
+    report = CartSweeper(ttl=args.ttl, batch_size=args.batch_size).run().snapshot()
+    print(
+        f"Removed {report['carts_removed']} carts and {report['items_removed']} cart items "
+        f"in {report['batches']} batches "
+        f"(batch latency avg {report['batch_ms_avg']} ms, max {report['batch_ms_max']} ms)."
+    )